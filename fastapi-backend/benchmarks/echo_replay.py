@@ -0,0 +1,325 @@
+"""
+Replay benchmark for ECHO chat.
+
+Replays a recorded corpus of chat requests and reports throughput, end-to-end
+and per-stage latency percentiles (from the call traces ECHO attaches to each
+answer), cache hit rate and tokens per request. Results can be saved and
+compared against a baseline, so context-building and caching changes are
+judged on numbers.
+
+Two modes:
+
+- `service` (default) calls GeminiService in this process, with the stub
+  backend unless --backend says otherwise. No server or API key is needed;
+  usage is recorded in a scratch SQLite database unless DATABASE_URL is set.
+  Rate limits are lifted for the stub backend (--no-unlimited keeps them).
+- `http` posts to /api/chatbot/chat on a running server. Start it with
+  ECHO_BACKEND=stub to leave the provider out of the measurement.
+
+The corpus is JSONL, one request per line. `message` is the question (`body`
+or `title` are used if it is missing, so a backlog file like requests.jsonl
+replays too); the optional `course_id` is sent along, and lines with the same
+`session` label are replayed in order as one conversation:
+
+    {"session": "s1", "course_id": 3, "message": "What is a binary heap?"}
+
+Run from the fastapi-backend directory:
+
+    python benchmarks/echo_replay.py benchmarks/echo_corpus.sample.jsonl --repeat 3 --output run.json
+    python benchmarks/echo_replay.py corpus.jsonl --baseline run.json --max-regression 10
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class Sample:
+    latency_ms: float
+    success: bool
+    cache_hit: bool = False
+    tokens: Optional[int] = None
+    stages: Dict[str, float] = field(default_factory=dict)
+    error: Optional[str] = None
+
+
+def load_corpus(path: str, limit: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+    """Requests grouped into conversations, each replayed in order"""
+    conversations: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path, encoding="utf-8") as corpus:
+        for number, line in enumerate(corpus):
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            message = entry.get("message") or entry.get("body") or entry.get("title")
+            if not message:
+                continue
+            request = {"message": message[:2000], "course_id": entry.get("course_id")}
+            # Lines without a session are standalone questions
+            conversations.setdefault(entry.get("session") or f"line-{number}", []).append(request)
+            if limit and sum(len(c) for c in conversations.values()) >= limit:
+                break
+    return list(conversations.values())
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[rank], 1)
+
+
+def _distribution(values: List[float]) -> Dict[str, Optional[float]]:
+    return {"count": len(values), "p50": percentile(values, 50),
+            "p95": percentile(values, 95), "p99": percentile(values, 99)}
+
+
+class ServiceTarget:
+    """Calls GeminiService in this process"""
+
+    def __init__(self, backend: str, unlimited: Optional[bool]):
+        os.environ.setdefault("ECHO_BACKEND", backend)
+        if unlimited is None:
+            # The stub has no quota to protect; measure latency, not throttling
+            unlimited = os.environ["ECHO_BACKEND"] == "stub"
+        if unlimited:
+            for name in ("ECHO_RATE_LIMIT", "ECHO_COURSE_RATE_LIMIT", "ECHO_USER_RATE_LIMIT"):
+                os.environ[name] = "1000000"
+        # Usage ledger writes go to a scratch database unless one is given
+        os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(
+            tempfile.mkdtemp(prefix="echo_replay_"), "replay.db"))
+        sys.path.insert(0, BACKEND_DIR)
+        from database import engine
+        from models import Base
+        from services.gemini_service import get_gemini_service
+        Base.metadata.create_all(bind=engine)
+        self.service = get_gemini_service()
+        self.histories: Dict[int, List[Dict[str, str]]] = {}
+
+    async def send(self, conversation_id: int, request: Dict[str, Any]) -> Sample:
+        history = self.histories.setdefault(conversation_id, [])
+        started = time.monotonic()
+        try:
+            result = await self.service.chat_with_context(
+                request["message"], course_id=request.get("course_id"),
+                conversation_history=list(history))
+        except Exception as e:
+            return Sample((time.monotonic() - started) * 1000, False, error=str(e))
+        latency = (time.monotonic() - started) * 1000
+        if result.get("success"):
+            history.extend([{"role": "user", "content": request["message"]},
+                            {"role": "assistant", "content": result["response"]}])
+        return Sample(
+            latency, bool(result.get("success")),
+            cache_hit=bool((result.get("cache") or {}).get("hit")),
+            tokens=result.get("tokens_used"),
+            stages=(result.get("timings") or {}).get("stages_ms", {}),
+            error=result.get("error"))
+
+    async def close(self):
+        # Let background usage writes finish before the loop closes
+        await asyncio.gather(*list(self.service._usage_writes), return_exceptions=True)
+
+
+class HttpTarget:
+    """Posts to /api/chatbot/chat on a running server"""
+
+    def __init__(self, url: str, token: Optional[str], timeout: float):
+        self.url = url.rstrip("/") + "/api/chatbot/chat"
+        self.headers = {"Content-Type": "application/json"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+        self.timeout = timeout
+        self.sessions: Dict[int, int] = {}
+
+    def _post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode("utf-8"),
+            headers=self.headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    async def send(self, conversation_id: int, request: Dict[str, Any]) -> Sample:
+        payload = {"message": request["message"], "course_id": request.get("course_id"),
+                   "session_id": self.sessions.get(conversation_id)}
+        started = time.monotonic()
+        try:
+            # urllib blocks; one thread per request in flight
+            body = await asyncio.to_thread(self._post, payload)
+        except urllib.error.HTTPError as e:
+            return Sample((time.monotonic() - started) * 1000, False, error=f"HTTP {e.code}")
+        except Exception as e:
+            return Sample((time.monotonic() - started) * 1000, False, error=str(e))
+        latency = (time.monotonic() - started) * 1000
+        self.sessions[conversation_id] = body.get("session_id")
+        metadata = body.get("metadata") or {}
+        return Sample(
+            latency, bool(metadata.get("success", True)),
+            cache_hit=bool(metadata.get("cache_hit")),
+            tokens=metadata.get("tokens_used"),
+            stages=(metadata.get("timings") or {}).get("stages_ms", {}))
+
+    async def close(self):
+        pass
+
+
+async def replay(target, conversations: List[List[Dict[str, Any]]],
+                 concurrency: int, repeat: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: List[Sample] = []
+
+    async def run_conversation(conversation_id: int, requests: List[Dict[str, Any]]):
+        # A conversation's turns are sequential; conversations overlap
+        async with semaphore:
+            for request in requests:
+                samples.append(await target.send(conversation_id, request))
+
+    started = time.monotonic()
+    for round_number in range(repeat):
+        await asyncio.gather(*(
+            run_conversation(round_number * len(conversations) + index, requests)
+            for index, requests in enumerate(conversations)))
+    wall = time.monotonic() - started
+    await target.close()
+    return summarize(samples, wall)
+
+
+def summarize(samples: List[Sample], wall_seconds: float) -> Dict[str, Any]:
+    succeeded = [s for s in samples if s.success]
+    stage_names = sorted({name for s in succeeded for name in s.stages})
+    tokens = [s.tokens for s in succeeded if s.tokens is not None and not s.cache_hit]
+    errors: Dict[str, int] = {}
+    for s in samples:
+        if not s.success:
+            errors[s.error or "unknown"] = errors.get(s.error or "unknown", 0) + 1
+    return {
+        "requests": len(samples),
+        "succeeded": len(succeeded),
+        "wall_seconds": round(wall_seconds, 2),
+        "throughput_rps": round(len(samples) / wall_seconds, 2) if wall_seconds else 0.0,
+        "latency_ms": _distribution([s.latency_ms for s in succeeded]),
+        # Only calls that ran a stage count towards its distribution
+        "stages_ms": {name: _distribution([s.stages[name] for s in succeeded if name in s.stages])
+                      for name in stage_names},
+        "cache_hit_rate": round(sum(s.cache_hit for s in succeeded) / len(succeeded), 3) if succeeded else 0.0,
+        "tokens_per_request": round(sum(tokens) / len(tokens), 1) if tokens else None,
+        "errors": errors
+    }
+
+
+def _delta(current: Optional[float], baseline: Optional[float]) -> str:
+    if current is None or baseline is None:
+        return "       n/a"
+    if not baseline:
+        return "          "
+    return f"{(current - baseline) / baseline * 100:+9.1f}%"
+
+
+def print_report(result: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    base = baseline or {}
+    print(f"Requests: {result['requests']} ({result['succeeded']} succeeded) "
+          f"in {result['wall_seconds']} s, {result['throughput_rps']} req/s "
+          f"{_delta(result['throughput_rps'], base.get('throughput_rps')) if baseline else ''}")
+    print(f"Cache hit rate: {result['cache_hit_rate']:.1%}   "
+          f"Tokens per request: {result['tokens_per_request']}")
+    if result["errors"]:
+        print(f"Errors: {result['errors']}")
+
+    print(f"\n{'stage':<18}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}"
+          + ("   p95 vs baseline" if baseline else ""))
+    rows = [("end_to_end", result["latency_ms"], base.get("latency_ms"))]
+    rows += [(name, dist, (base.get("stages_ms") or {}).get(name))
+             for name, dist in result["stages_ms"].items()]
+    for name, dist, base_dist in rows:
+        line = f"{name:<18}{dist['count']:>7}" + "".join(
+            f"{dist[q]:>9.1f}" if dist[q] is not None else f"{'-':>9}" for q in ("p50", "p95", "p99"))
+        if baseline:
+            line += "  " + _delta(dist["p95"], (base_dist or {}).get("p95"))
+        print(line)
+
+
+def regressions(result: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """End-to-end percentiles or throughput worse than the baseline by more than the limit"""
+    found = []
+    for q in ("p50", "p95", "p99"):
+        current, before = result["latency_ms"][q], baseline["latency_ms"].get(q)
+        if current is not None and before and (current - before) / before * 100 > max_regression:
+            found.append(f"{q} latency {before} -> {current} ms")
+    if baseline.get("throughput_rps") and \
+            (baseline["throughput_rps"] - result["throughput_rps"]) / baseline["throughput_rps"] * 100 > max_regression:
+        found.append(f"throughput {baseline['throughput_rps']} -> {result['throughput_rps']} req/s")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a corpus of chat requests against ECHO and report latency")
+    parser.add_argument("corpus", help="JSONL file of chat requests")
+    parser.add_argument("--mode", choices=("service", "http"), default="service")
+    parser.add_argument("--backend", default="stub",
+                        help="ECHO_BACKEND in service mode (default: stub)")
+    parser.add_argument("--unlimited", action=argparse.BooleanOptionalAction, default=None,
+                        help="Lift ECHO rate limits in service mode (default: only for the stub backend)")
+    parser.add_argument("--url", default="http://localhost:8000",
+                        help="Server for http mode")
+    parser.add_argument("--token", default=os.getenv("ECHO_REPLAY_TOKEN"),
+                        help="Bearer token for http mode (or ECHO_REPLAY_TOKEN)")
+    parser.add_argument("--timeout", type=float, default=60, help="HTTP timeout in seconds")
+    parser.add_argument("--concurrency", type=int, default=8,
+                        help="Conversations replayed at once")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Times to replay the corpus, to exercise caches")
+    parser.add_argument("--limit", type=int, default=None, help="Max requests read from the corpus")
+    parser.add_argument("--output", help="Save the results as JSON")
+    parser.add_argument("--baseline", help="Saved results to compare against")
+    parser.add_argument("--max-regression", type=float, default=None,
+                        help="Fail if latency or throughput is this many percent worse than the baseline")
+    args = parser.parse_args()
+
+    conversations = load_corpus(args.corpus, args.limit)
+    if not conversations:
+        print(f"❌ No requests in {args.corpus}")
+        sys.exit(1)
+
+    if args.mode == "service":
+        target = ServiceTarget(args.backend, args.unlimited)
+    else:
+        target = HttpTarget(args.url, args.token, args.timeout)
+    result = asyncio.run(replay(target, conversations, args.concurrency, args.repeat))
+    result["config"] = {"mode": args.mode, "corpus": args.corpus, "repeat": args.repeat,
+                        "concurrency": args.concurrency}
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as saved:
+            baseline = json.load(saved)
+    print_report(result, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(result, out, indent=2)
+        print(f"\n✅ Results saved to {args.output}")
+
+    if baseline and args.max_regression is not None:
+        found = regressions(result, baseline, args.max_regression)
+        if found:
+            print(f"❌ Regressed more than {args.max_regression}%: {'; '.join(found)}")
+            sys.exit(1)
+        print(f"✅ Within {args.max_regression}% of the baseline")
+
+
+if __name__ == "__main__":
+    main()
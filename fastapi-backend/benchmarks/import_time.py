@@ -0,0 +1,100 @@
+"""
+Import-time benchmark for the backend.
+
+Every worker (and every instance added by autoscaling) imports `main` before
+it can serve a request, so anything slow at import time delays scale-out.
+This imports a module in fresh interpreters, reports the median cumulative
+import time and the slowest imports, and fails if the median goes over a
+limit or if a module that should load lazily was imported.
+
+Run from the fastapi-backend directory:
+
+    python benchmarks/import_time.py --runs 5 --max-ms 1500
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Heavy dependencies that must only be imported when first needed
+LAZY_MODULES = ("google.generativeai", "google.api_core", "boto3",
+                "PyPDF2", "docx", "pandas", "PIL")
+
+
+def measure(module: str) -> Tuple[float, Dict[str, float], List[str]]:
+    """Import `module` in a fresh interpreter.
+
+    Returns its cumulative import time in ms, the cumulative time of every
+    module imported along the way, and the lazy modules that got imported.
+    """
+    check = (f"import sys, {module}; "
+             f"print('lazy:' + ','.join(m for m in {LAZY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", check],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+
+    cumulative = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, total, name = line.split("|")
+        try:
+            cumulative[name.strip()] = int(total) / 1000
+        except ValueError:
+            continue  # the header line
+    # The app prints while importing; the check's line is marked
+    marked = [line for line in result.stdout.splitlines() if line.startswith("lazy:")]
+    loaded = [m for m in marked[-1][len("lazy:"):].split(",") if m]
+    return cumulative.get(module, 0.0), cumulative, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure how long the backend takes to import")
+    parser.add_argument("--module", default="main",
+                        help="Module to import (default: main)")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Fresh interpreters to measure")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Fail if the median import time is above this")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Slowest imports to list")
+    args = parser.parse_args()
+
+    # The first run warms the bytecode cache and is not counted
+    measure(args.module)
+    timings, slowest, loaded = [], {}, []
+    for _ in range(args.runs):
+        total, cumulative, loaded = measure(args.module)
+        timings.append(total)
+        for name, ms in cumulative.items():
+            slowest.setdefault(name, []).append(ms)
+
+    median = statistics.median(timings)
+    print(f"import {args.module}: median {median:.0f} ms, "
+          f"min {min(timings):.0f} ms, max {max(timings):.0f} ms over {args.runs} runs")
+    print("Slowest imports (median cumulative ms):")
+    ranked = sorted(((statistics.median(v), k) for k, v in slowest.items()
+                     if k != args.module and "." not in k), reverse=True)
+    for ms, name in ranked[:args.top]:
+        print(f"   {ms:8.0f}  {name}")
+
+    failed = False
+    if loaded:
+        print(f"❌ Imported at startup but should load lazily: {', '.join(loaded)}")
+        failed = True
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"❌ Median import time {median:.0f} ms is over the {args.max_ms:.0f} ms limit")
+        failed = True
+    if not failed:
+        print("✅ Import time OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
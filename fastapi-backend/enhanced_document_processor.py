@@ -7,29 +7,23 @@ This module handles various document types including PDFs, Word documents, and o
 import os
 import json
 import io
+import importlib.util
 from typing import Optional, Dict, Any
-import boto3
-
-# Document processing libraries
-try:
-    import PyPDF2
-    PDF_AVAILABLE = True
-except ImportError:
-    PDF_AVAILABLE = False
+
+from services.echo_metrics import timed
+
+# Document processing libraries. They are slow to import, so only check that
+# they are installed here and import them when a file of that type arrives
+PDF_AVAILABLE = importlib.util.find_spec("PyPDF2") is not None
+if not PDF_AVAILABLE:
     print("⚠️  PyPDF2 not available. PDF processing will be limited.")
 
-try:
-    from docx import Document
-    DOCX_AVAILABLE = True
-except ImportError:
-    DOCX_AVAILABLE = False
+DOCX_AVAILABLE = importlib.util.find_spec("docx") is not None
+if not DOCX_AVAILABLE:
     print("⚠️  python-docx not available. Word document processing will be limited.")
 
-try:
-    import pandas as pd
-    EXCEL_AVAILABLE = True
-except ImportError:
-    EXCEL_AVAILABLE = False
+EXCEL_AVAILABLE = importlib.util.find_spec("pandas") is not None
+if not EXCEL_AVAILABLE:
     print("⚠️  pandas not available. Excel processing will be limited.")
 
 
@@ -91,33 +85,35 @@ class EnhancedDocumentProcessor:
             format_type = self.supported_formats.get(file_extension, 'unknown')
 
             # Get file from S3
-            if self.s3_client and self.bucket_name:
-                response = self.s3_client.get_object(
-                    Bucket=self.bucket_name, Key=key)
-                file_content = response['Body'].read()
-                metadata = {
-                    'size': response.get('ContentLength', 0),
-                    'content_type': response.get('ContentType', content_type),
-                    'last_modified': response.get('LastModified'),
-                    'etag': response.get('ETag')
-                }
-            else:
-                # For local testing
-                with open(key, 'rb') as f:
-                    file_content = f.read()
-                metadata = {'size': len(file_content)}
+            with timed("s3_fetch"):
+                if self.s3_client and self.bucket_name:
+                    response = self.s3_client.get_object(
+                        Bucket=self.bucket_name, Key=key)
+                    file_content = response['Body'].read()
+                    metadata = {
+                        'size': response.get('ContentLength', 0),
+                        'content_type': response.get('ContentType', content_type),
+                        'last_modified': response.get('LastModified'),
+                        'etag': response.get('ETag')
+                    }
+                else:
+                    # For local testing
+                    with open(key, 'rb') as f:
+                        file_content = f.read()
+                    metadata = {'size': len(file_content)}
 
             # Process based on format
-            if format_type == 'pdf':
-                return self._process_pdf(file_content, metadata)
-            elif format_type == 'docx':
-                return self._process_docx(file_content, metadata)
-            elif format_type == 'excel':
-                return self._process_excel(file_content, metadata)
-            elif format_type in ['text', 'markdown', 'python', 'javascript', 'html', 'css', 'json', 'xml', 'csv']:
-                return self._process_text(file_content, format_type, metadata)
-            else:
-                return self._process_unknown(file_content, format_type, metadata)
+            with timed("extract"):
+                if format_type == 'pdf':
+                    return self._process_pdf(file_content, metadata)
+                elif format_type == 'docx':
+                    return self._process_docx(file_content, metadata)
+                elif format_type == 'excel':
+                    return self._process_excel(file_content, metadata)
+                elif format_type in ['text', 'markdown', 'python', 'javascript', 'html', 'css', 'json', 'xml', 'csv']:
+                    return self._process_text(file_content, format_type, metadata)
+                else:
+                    return self._process_unknown(file_content, format_type, metadata)
 
         except Exception as e:
             return {
@@ -138,6 +134,7 @@ class EnhancedDocumentProcessor:
             }
 
         try:
+            import PyPDF2
             pdf_file = io.BytesIO(file_content)
             pdf_reader = PyPDF2.PdfReader(pdf_file)
 
@@ -185,6 +182,7 @@ class EnhancedDocumentProcessor:
             }
 
         try:
+            from docx import Document
             doc_file = io.BytesIO(file_content)
             doc = Document(doc_file)
 
@@ -243,6 +241,7 @@ class EnhancedDocumentProcessor:
             excel_file = io.BytesIO(file_content)
 
             # Read all sheets
+            import pandas as pd
             excel_data = pd.read_excel(excel_file, sheet_name=None)
 
             text_content = []
@@ -348,6 +347,14 @@ class EnhancedDocumentProcessor:
         """Check if a file format is supported"""
         return file_extension.lower() in self.supported_formats
 
+
+def extract_local_file(file_path: str, content_type: str = '') -> Optional[Dict[str, Any]]:
+    """Extract content from a file on local disk.
+
+    A module-level function so it can be handed to a process pool.
+    """
+    return EnhancedDocumentProcessor().extract_content(file_path, content_type)
+
 # Test function
 
 
@@ -2,14 +2,20 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Depends, HTTPExcept
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
+import asyncio
 import json
 import jwt
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime
 
 from routers import auth, courses, documents, livestream, statistics, chatbot, notifications, notification_preferences
-from database import engine, Base
+from database import engine, Base, SessionLocal
 from config import settings
+from models import User
+from services.gemini_service import get_gemini_service, shutdown_gemini_service
+from services.echo_jobs import get_job_runner, job_events
+from services.message_search import ensure_search_index
+from services.schema_upgrades import ensure_echo_schema
 
 # Create database tables
 Base.metadata.create_all(bind=engine)
@@ -154,6 +160,35 @@ async def get_user_from_token(token: str):
         return None
 
 
+def get_user_id(username: str) -> Optional[int]:
+    db = SessionLocal()
+    try:
+        user = db.query(User.id).filter(User.username == username).first()
+        return user.id if user else None
+    finally:
+        db.close()
+
+
+async def forward_job_updates(websocket: WebSocket, updates: asyncio.Queue):
+    """Push the user's ECHO job updates down the socket"""
+    while True:
+        update = await updates.get()
+        await websocket.send_text(json.dumps({
+            "type": "echo:job_update",
+            "data": update
+        }))
+
+
+async def start_echo():
+    """Build the ECHO service off the event loop, then keep probing its API.
+
+    Startup does not wait for this, so the worker accepts requests while the
+    model SDK and S3 client load.
+    """
+    echo = await asyncio.to_thread(get_gemini_service)
+    await echo.run_health_probe()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
@@ -161,9 +196,29 @@ async def lifespan(app: FastAPI):
     print("✅ Database connected")
     print("✅ WebSocket manager initialized")
     print("✅ All routers loaded")
+    try:
+        added = await asyncio.to_thread(ensure_echo_schema)
+        if added:
+            print(f"✅ Added to the ECHO schema: {', '.join(added)}")
+    except Exception as e:
+        print(f"⚠️  Could not upgrade the ECHO schema: {e}")
+    try:
+        if await asyncio.to_thread(ensure_search_index):
+            print("✅ Chat search index ready")
+        else:
+            print("⚠️  No full-text search on this database. Chat search is disabled.")
+    except Exception as e:
+        print(f"⚠️  Could not create the chat search index: {e}")
+    echo_health_task = asyncio.create_task(start_echo())
+    print("✅ ECHO health probe started")
+    job_events_task = asyncio.create_task(job_events.listen())
     yield
     # Shutdown
     print("🛑 Shutting down VisionWare Backend...")
+    echo_health_task.cancel()
+    job_events_task.cancel()
+    await get_job_runner().shutdown()
+    shutdown_gemini_service()
 
 app = FastAPI(
     title="VisionWare API",
@@ -179,11 +234,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination cursors are returned in headers
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include routers (order matters - more specific routes first)
 app.include_router(auth.router, prefix="/api")
 app.include_router(chatbot.router, prefix="/api")
+app.include_router(chatbot.socket_router)
 app.include_router(statistics.router, prefix="/api")
 app.include_router(notification_preferences.router, prefix="/api")
 app.include_router(notifications.router, prefix="/api")
@@ -296,6 +354,7 @@ async def websocket_livestream_endpoint(websocket: WebSocket, stream_id: int):
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
+    job_forwarder = None
 
     try:
         # Get token from query parameters
@@ -319,6 +378,13 @@ async def websocket_endpoint(websocket: WebSocket):
             }
         }))
 
+        # Push ECHO job updates while the socket is open
+        user_id = await asyncio.to_thread(get_user_id, user.get("sub"))
+        if user_id is not None:
+            job_updates = job_events.subscribe(user_id)
+            job_forwarder = asyncio.create_task(
+                forward_job_updates(websocket, job_updates))
+
         # Handle general messages
         while True:
             try:
@@ -332,6 +398,8 @@ async def websocket_endpoint(websocket: WebSocket):
                         "data": {"timestamp": datetime.utcnow().isoformat()}
                     }))
 
+            except WebSocketDisconnect:
+                raise
             except json.JSONDecodeError:
                 await websocket.send_text(json.dumps({
                     "type": "error",
@@ -346,6 +414,10 @@ async def websocket_endpoint(websocket: WebSocket):
 
     except WebSocketDisconnect:
         print(f"WebSocket disconnected")
+    finally:
+        if job_forwarder is not None:
+            job_forwarder.cancel()
+            job_events.unsubscribe(user_id, job_updates)
 
 
 @app.get("/")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, JSON, Time
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text, Float, JSON, Time, UniqueConstraint, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -367,12 +367,20 @@ class StreamAnalytics(Base):
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # A user's sessions, most recently updated first
+        Index("ix_chat_sessions_user_updated", "user_id", "updated_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     course_id = Column(Integer, ForeignKey("courses.id"), nullable=True)
     session_name = Column(String, default="New Chat")
     is_active = Column(Boolean, default=True)
+    # Running summary of older turns, so prompts stay constant in size
+    summary = Column(Text, nullable=True)
+    # Last ChatMessage.id folded into the summary
+    summarized_through_id = Column(Integer, default=0)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -384,6 +392,10 @@ class ChatSession(Base):
 
 class ChatMessage(Base):
     __tablename__ = "chatbot_messages"
+    __table_args__ = (
+        # Messages of a session in order, and counting them without the table
+        Index("ix_chatbot_messages_session_timestamp", "session_id", "timestamp"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(Integer, ForeignKey("chat_sessions.id"))
@@ -397,6 +409,85 @@ class ChatMessage(Base):
     session = relationship("ChatSession", back_populates="messages")
 
 
+class CourseAnalysis(Base):
+    __tablename__ = "course_analyses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    course_id = Column(Integer, ForeignKey("courses.id"),
+                       unique=True, index=True, nullable=False)
+    # Fingerprint of the S3 course content the analysis was built from
+    content_version = Column(String, nullable=False)
+    # Course document fingerprint at that time, a cheap staleness check
+    document_version = Column(String, nullable=True)
+    analysis = Column(Text, nullable=False)
+    content_count = Column(Integer, default=0)
+    file_types = Column(JSON)
+    model_used = Column(String, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+    # Relationships
+    course = relationship("Course")
+
+
+class LLMUsageEvent(Base):
+    __tablename__ = "llm_usage_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    course_id = Column(Integer, ForeignKey("courses.id"), nullable=True)
+    model = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # chat, chat_files, analysis, summary
+    prompt_tokens = Column(Integer, default=0)
+    response_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+    latency_ms = Column(Float, default=0.0)
+    cache_hit = Column(Boolean, default=False)
+    success = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=func.now(), index=True)
+
+
+class LLMUsageHourly(Base):
+    """Hourly rollup of LLMUsageEvent, updated as each event is written"""
+    __tablename__ = "llm_usage_hourly"
+    __table_args__ = (
+        UniqueConstraint("hour", "user_id", "course_id", "model",
+                         name="uq_llm_usage_hourly_bucket"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    hour = Column(DateTime, nullable=False, index=True)  # UTC, truncated
+    # 0 instead of NULL so every bucket is unique (0 = background work)
+    user_id = Column(Integer, nullable=False, default=0, index=True)
+    course_id = Column(Integer, nullable=False, default=0, index=True)
+    model = Column(String, nullable=False)
+    requests = Column(Integer, default=0)
+    cache_hits = Column(Integer, default=0)
+    failures = Column(Integer, default=0)
+    prompt_tokens = Column(Integer, default=0)
+    response_tokens = Column(Integer, default=0)
+    total_tokens = Column(Integer, default=0)
+    latency_ms_total = Column(Float, default=0.0)
+
+
+class EchoJob(Base):
+    """Long ECHO request run in the background instead of inside an HTTP request"""
+    __tablename__ = "echo_jobs"
+
+    id = Column(String, primary_key=True, default=lambda: uuid.uuid4().hex)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # chat, chat_files, analysis
+    # queued, running, succeeded, failed
+    status = Column(String, nullable=False, default="queued")
+    # Request the job was submitted with, as JSON
+    payload = Column(JSON)
+    result = Column(JSON, nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
 class UserNotificationPreferences(Base):
     __tablename__ = "user_notification_preferences"
 
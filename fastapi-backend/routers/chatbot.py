@@ -1,44 +1,338 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Query, Request, Response, BackgroundTasks, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from typing import List, Optional
-from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+from datetime import datetime, timedelta
 import os
+import json
 import uuid
+import shutil
+import tempfile
 from pathlib import Path
 import asyncio
 import time
 
-from database import get_db
+from config import settings
+from database import SessionLocal, get_db
 from models import User, ChatSession, ChatMessage, Course
 from schemas import (
     ChatSessionCreate, ChatSessionResponse, ChatMessageResponse,
-    ChatbotRequest, ChatbotResponse, CourseAnalysisRequest, CourseAnalysisResponse
+    ChatbotRequest, ChatbotResponse, CourseAnalysisRequest, CourseAnalysisResponse,
+    EchoJobResponse, ChatSearchResult
 )
-from auth import get_current_user
-from services.gemini_service import gemini_service
+from auth import get_current_user, verify_token
+from services.gemini_service import get_gemini_service
+from services.admission_queue import Priority
+from services.rate_limiter import retry_after_seconds
+from services.conversation_summary import refresh_session_summary, summary_due
+from services.session_cache import CachedSession, session_cache
+from services.course_analysis import get_course_analysis
+from services.usage_ledger import GROUP_COLUMNS, day_start, usage_report
+from services.echo_metrics import echo_metrics
+from services.echo_jobs import get_job, job_handler, submit_job
+from services.message_search import SearchUnavailable, search_messages
 
 router = APIRouter(prefix="/chatbot", tags=["chatbot"])
+socket_router = APIRouter(tags=["chatbot"])
+
+# How often to check whether the client is still connected while ECHO works
+DISCONNECT_POLL_INTERVAL = 0.5
+# Recent messages sent verbatim with each chat request
+HISTORY_MESSAGES = 10
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Messages per transcript page when `before_id` is given without `limit`
+DEFAULT_MESSAGE_PAGE = 50
+# Message fields a transcript request can select
+MESSAGE_FIELDS = {
+    'id': ChatMessage.id,
+    'session_id': ChatMessage.session_id,
+    'role': ChatMessage.role,
+    'content': ChatMessage.content,
+    'timestamp': ChatMessage.timestamp,
+    'metadata': ChatMessage.message_metadata
+}
+# Where job uploads wait for their job; must be shared with Celery workers
+JOB_UPLOAD_DIR = os.getenv('ECHO_JOB_UPLOAD_DIR') or None
+
+
+async def run_until_disconnected(http_request: Request, coro, timeout: float):
+    """Await an ECHO coroutine, cancelling it on timeout or client disconnect.
+
+    Raises asyncio.TimeoutError on timeout. A disconnect cancels the work and
+    re-raises CancelledError, since there is nobody left to answer.
+    """
+    task = asyncio.ensure_future(coro)
+
+    async def watch_disconnect():
+        while not task.done():
+            if await http_request.is_disconnected():
+                task.cancel()
+                return
+            await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        return await asyncio.wait_for(task, timeout=timeout)
+    finally:
+        watcher.cancel()
+
+
+def request_priority(user: User, live_stream_id: Optional[int] = None) -> Priority:
+    """Instructors and live-session questions jump ahead of regular chats"""
+    if live_stream_id or user.is_staff or user.is_superuser or user.role in ("teacher", "admin", "super_admin"):
+        return Priority.URGENT
+    return Priority.INTERACTIVE
+
+
+def set_queue_headers(response: Response, echo_response: dict):
+    """Expose admission queue depth, ETA and when to retry to the client"""
+    queue = echo_response.get('queue')
+    if queue:
+        response.headers["X-ECHO-Queue-Depth"] = str(queue.get('queue_depth', queue.get('depth', 0)))
+        response.headers["X-ECHO-Queue-ETA"] = str(queue.get('eta_seconds', 0))
+    if echo_response.get('retry_after') is not None:
+        response.headers["Retry-After"] = str(
+            retry_after_seconds(echo_response['retry_after']))
+
+
+def load_course_info(db: Session, course_id: Optional[int]) -> Optional[dict]:
+    if not course_id:
+        return None
+    course = db.query(Course).filter(Course.id == course_id).first()
+    if not course:
+        return None
+    return {
+        'title': course.title,
+        'description': course.description,
+        'credits': course.credits
+    }
+
+
+def load_session_snapshot(db: Session, session_id: int, user_id: int,
+                          active_only: bool = False) -> Optional[CachedSession]:
+    """Read a chat session and its recent history for the session cache"""
+    query = db.query(ChatSession).filter(
+        ChatSession.id == session_id,
+        ChatSession.user_id == user_id
+    )
+    if active_only:
+        query = query.filter(ChatSession.is_active == True)
+    session = query.first()
+    if not session:
+        return None
+
+    history = db.query(ChatMessage).filter(
+        ChatMessage.session_id == session.id,
+        ChatMessage.id > (session.summarized_through_id or 0)
+    ).order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(HISTORY_MESSAGES).all()
+
+    return CachedSession(
+        id=session.id,
+        user_id=session.user_id,
+        course_id=session.course_id,
+        summary=session.summary,
+        summarized_through_id=session.summarized_through_id or 0,
+        updated_at=session.updated_at,
+        history=[
+            {'id': msg.id, 'role': msg.role, 'content': msg.content}
+            for msg in reversed(history)  # Reverse to get chronological order
+        ]
+    )
+
+
+def cached_chat_session(db: Session, session_id: int, user_id: int) -> Optional[CachedSession]:
+    """The cached session, if the session row still matches it.
+
+    One primary-key read: another worker may have deleted the session or
+    added messages since it was cached.
+    """
+    session = session_cache.get(session_id, user_id)
+    if session is None:
+        return None
+    row = db.query(
+        ChatSession.user_id, ChatSession.is_active, ChatSession.updated_at
+    ).filter(ChatSession.id == session_id).first()
+    if row is None or row.user_id != user_id or not row.is_active \
+            or row.updated_at != session.updated_at:
+        session_cache.invalidate(session_id)
+        return None
+    return session
+
+
+def open_chat_session(db: Session, user_id: int, session_id: Optional[int],
+                      course_id: Optional[int]) -> CachedSession:
+    """The user's active chat session, or a new one if no id is given.
+
+    An active conversation is served from the session cache after a single
+    check of the session row.
+    """
+    if session_id:
+        return active_chat_session(db, session_id, user_id)
+
+    new_session = ChatSession(
+        user_id=user_id,
+        course_id=course_id,
+        session_name=f"ECHO Chat - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
+    )
+    db.add(new_session)
+    db.flush()
+    session = CachedSession(id=new_session.id, user_id=user_id, course_id=course_id,
+                            updated_at=new_session.updated_at)
+    db.commit()
+    session_cache.put(session)
+    return session
+
+
+def active_chat_session(db: Session, session_id: int, user_id: int) -> CachedSession:
+    """The user's session if it exists and is active"""
+    session = cached_chat_session(db, session_id, user_id)
+    if session is None:
+        session = load_session_snapshot(db, session_id, user_id, active_only=True)
+        if not session:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chat session not found"
+            )
+        session_cache.put(session)
+    return session
+
+
+def session_course_info(db: Session, session: CachedSession,
+                        course_id: Optional[int]) -> Optional[dict]:
+    """Course info for the chat, loaded once per course per session"""
+    if course_id != session.info_course_id:
+        session.course_info = load_course_info(db, course_id)
+        session.info_course_id = course_id
+    return session.course_info
+
+
+def chat_metadata(echo_response: dict) -> dict:
+    return {
+        'course_content_used': echo_response.get('course_content_used', False),
+        'content_files_count': echo_response.get('content_files_count', 0),
+        'success': echo_response.get('success', False),
+        'model_used': echo_response.get('model_used', 'unknown'),
+        'route': echo_response.get('route'),
+        'tokens_used': echo_response.get('tokens_used', None),
+        'prompt_tokens': echo_response.get('prompt_tokens'),
+        'prompt_budget': echo_response.get('prompt_budget'),
+        'cache_hit': echo_response.get('cache', {}).get('hit', False),
+        'cache_tier': echo_response.get('cache', {}).get('tier'),
+        'quota_state': echo_response.get('quota', {}).get('state'),
+        'timings': echo_response.get('timings')
+    }
+
+
+def files_chat_metadata(response: dict, file_info: List[dict]) -> dict:
+    return {
+        'course_content_used': response.get('course_content_used', False),
+        'content_files_count': response.get('content_files_count', 0),
+        'files_processed': len(file_info),
+        'model_used': response.get('model_used', 'unknown'),
+        'route': response.get('route'),
+        'tokens_used': response.get('tokens_used'),
+        'prompt_tokens': response.get('prompt_tokens'),
+        'images': response.get('images'),
+        'timings': response.get('timings')
+    }
+
+
+def save_exchange(db: Session, session_id: int, message: str, echo_response: dict,
+                  assistant_metadata: dict, user_metadata: Optional[dict] = None) -> ChatbotResponse:
+    """Save both sides of an exchange in one transaction"""
+    now = datetime.now()
+    user_message = ChatMessage(
+        session_id=session_id,
+        role="user",
+        content=message,
+        timestamp=now,
+        message_metadata=user_metadata
+    )
+    assistant_message = ChatMessage(
+        session_id=session_id,
+        role="assistant",
+        content=echo_response['response'],
+        timestamp=now,
+        message_metadata=assistant_metadata
+    )
+    db.add_all([user_message, assistant_message])
+
+    # Update session timestamp without loading the row
+    db.query(ChatSession).filter(ChatSession.id == session_id).update(
+        {ChatSession.updated_at: now}, synchronize_session=False)
+
+    # Ids are assigned on flush; read them before commit expires the objects
+    db.flush()
+    saved = [
+        {'id': user_message.id, 'role': 'user', 'content': message},
+        {'id': assistant_message.id, 'role': 'assistant',
+         'content': echo_response['response']}
+    ]
+    metadata = assistant_message.message_metadata
+    db.commit()
+    session_cache.append_messages(session_id, saved, updated_at=now)
+
+    return ChatbotResponse(
+        response=echo_response['response'],
+        session_id=session_id,
+        message_id=saved[1]['id'],
+        timestamp=now,
+        course_content_used=echo_response.get('course_content_used', False),
+        content_files_count=echo_response.get('content_files_count', 0),
+        metadata=metadata
+    )
+
+
+def summary_pending(session: CachedSession) -> bool:
+    """Whether older turns should be folded into the running summary.
+
+    The cached history is capped, so a full history always counts as due.
+    """
+    pending = session.unsummarized_count()
+    return summary_due(pending) or pending >= session_cache.history_size
+
+
+async def chat_turn(db: Session, user: User, session: CachedSession, request: ChatbotRequest,
+                    on_text: Optional[Callable[..., None]] = None,
+                    response: Optional[Response] = None) -> ChatbotResponse:
+    """Ask ECHO within a session and save the exchange.
+
+    With `response`, the admission queue headers are set on it.
+    """
+    course_info = session_course_info(db, session, request.course_id)
+    echo_response = await get_gemini_service().chat_with_context(
+        message=request.message,
+        course_id=request.course_id,
+        conversation_history=session.recent_history(HISTORY_MESSAGES),
+        course_info=course_info,
+        db_session=db,
+        user_id=user.id,
+        priority=request_priority(user, request.live_stream_id),
+        conversation_summary=session.summary,
+        on_text=on_text
+    )
+    if response is not None:
+        set_queue_headers(response, echo_response)
+    return save_exchange(
+        db, session.id, request.message, echo_response, chat_metadata(echo_response))
 
 
 @router.get("/status")
 async def get_echo_status():
     """Get ECHO system status and configuration"""
     try:
-        # Add timeout protection for status check
-        status_info = await asyncio.wait_for(
-            asyncio.to_thread(gemini_service.get_echo_status),
-            timeout=10.0
-        )
+        # API health comes from the background probe, no model call here
+        status_info = get_gemini_service().get_echo_status()
+        status_info["session_cache"] = session_cache.describe()
         return {
             "status": "success",
             "data": status_info,
             "message": "ECHO status retrieved successfully"
         }
-    except asyncio.TimeoutError:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="ECHO status check timed out. The service may be experiencing high demand."
-        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -46,6 +340,74 @@ async def get_echo_status():
         )
 
 
+@router.get("/metrics")
+async def get_echo_metrics(
+    format: str = "prometheus",
+    current_user: User = Depends(get_current_user)
+):
+    """ECHO latency histograms per call kind and stage (admins and staff only).
+
+    Prometheus text by default; `format=json` gives approximate percentiles.
+    A scraper authenticates with a bearer token like any other client.
+    """
+    if current_user.role not in ("admin", "super_admin") \
+            and not current_user.is_staff and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied. This endpoint requires admin role or staff privileges."
+        )
+
+    if format == "json":
+        return {"status": "success", "data": echo_metrics.snapshot()}
+    return PlainTextResponse(echo_metrics.render_prometheus(),
+                             media_type="text/plain; version=0.0.4")
+
+
+@router.get("/usage")
+async def get_llm_usage(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: str = "user",
+    user_id: Optional[int] = None,
+    course_id: Optional[int] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """ECHO token usage from the hourly rollups (admins only).
+
+    `group_by` is a comma-separated list of user, course, model and hour.
+    Times are UTC; the default range is the current day.
+    """
+    if current_user.role not in ("admin", "super_admin") and not current_user.is_superuser:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied. This endpoint requires admin role."
+        )
+
+    dimensions = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in dimensions if name not in GROUP_COLUMNS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot group usage by {', '.join(unknown)}; use {', '.join(GROUP_COLUMNS)}"
+        )
+
+    now = datetime.utcnow()
+    start = start or day_start(now)
+    end = end or now + timedelta(hours=1)
+    rows = usage_report(db, start, end, dimensions, user_id, course_id)
+    return {
+        "status": "success",
+        "data": {
+            "start": start,
+            "end": end,
+            "group_by": dimensions,
+            "rows": rows,
+            "quota": get_gemini_service().usage_quota.describe()
+        }
+    }
+
+
 @router.post("/sessions", response_model=ChatSessionResponse)
 async def create_chat_session(
     session_data: ChatSessionCreate,
@@ -92,25 +454,64 @@ async def create_chat_session(
         )
 
 
+def session_cursor(session: ChatSession) -> str:
+    """Cursor for the session list page that ends with `session`"""
+    return f"{session.updated_at.isoformat()},{session.id}"
+
+
+def parse_session_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Split a session list cursor into the updated_at and id it points past"""
+    try:
+        updated_at, session_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(updated_at), int(session_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
 @router.get("/sessions", response_model=List[ChatSessionResponse])
 async def get_chat_sessions(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=100),
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all chat sessions for the current user"""
+    """Get the current user's chat sessions, most recently updated first.
+
+    Without `limit` every session is returned. With it, a full page sets the
+    X-Next-Cursor header; pass it back as `cursor` for the next page.
+    """
     try:
-        sessions = db.query(ChatSession).filter(
+        # Counts come from one grouped join instead of a query per session
+        message_count = func.count(ChatMessage.id).label("message_count")
+        query = db.query(ChatSession, message_count).outerjoin(
+            ChatMessage, ChatMessage.session_id == ChatSession.id
+        ).filter(
             ChatSession.user_id == current_user.id,
             ChatSession.is_active == True
-        ).order_by(ChatSession.updated_at.desc()).all()
+        ).group_by(ChatSession.id)
+
+        if cursor:
+            updated_at, session_id = parse_session_cursor(cursor)
+            query = query.filter(or_(
+                ChatSession.updated_at < updated_at,
+                and_(ChatSession.updated_at == updated_at,
+                     ChatSession.id < session_id)
+            ))
+        query = query.order_by(
+            ChatSession.updated_at.desc(), ChatSession.id.desc())
+        if limit:
+            query = query.limit(limit)
+        rows = query.all()
 
-        session_responses = []
-        for session in sessions:
-            message_count = db.query(ChatMessage).filter(
-                ChatMessage.session_id == session.id
-            ).count()
+        if limit and len(rows) == limit:
+            response.headers["X-Next-Cursor"] = session_cursor(rows[-1][0])
 
-            session_responses.append(ChatSessionResponse(
+        return [
+            ChatSessionResponse(
                 id=session.id,
                 user_id=session.user_id,
                 course_id=session.course_id,
@@ -118,10 +519,12 @@ async def get_chat_sessions(
                 is_active=session.is_active,
                 created_at=session.created_at,
                 updated_at=session.updated_at,
-                message_count=message_count
-            ))
-
-        return session_responses
+                message_count=count
+            )
+            for session, count in rows
+        ]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -132,13 +535,34 @@ async def get_chat_sessions(
 @router.get("/sessions/{session_id}/messages", response_model=List[ChatMessageResponse])
 async def get_chat_messages(
     session_id: int,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=200),
+    before_id: Optional[int] = None,
+    fields: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all messages for a specific chat session"""
+    """Get the messages of a chat session, oldest first.
+
+    Without `limit` or `before_id` the whole transcript is returned. With
+    either, it is paged from the newest message back: a page holds the
+    messages just before `before_id` (or the latest ones), and a full page
+    sets X-Next-Cursor to the `before_id` of the page before it. `fields`
+    (e.g. `id,role,content`) returns only those fields.
+    """
     try:
+        selected = None
+        if fields:
+            selected = [name.strip() for name in fields.split(",") if name.strip()]
+            unknown = set(selected) - set(MESSAGE_FIELDS)
+            if unknown:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Unknown message fields: {', '.join(sorted(unknown))}"
+                )
+
         # Verify session belongs to user
-        session = db.query(ChatSession).filter(
+        session = db.query(ChatSession.id).filter(
             ChatSession.id == session_id,
             ChatSession.user_id == current_user.id
         ).first()
@@ -149,21 +573,44 @@ async def get_chat_messages(
                 detail="Chat session not found"
             )
 
-        messages = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id
-        ).order_by(ChatMessage.timestamp.asc()).all()
-
-        return [
-            ChatMessageResponse(
-                id=msg.id,
-                session_id=msg.session_id,
-                role=msg.role,
-                content=msg.content,
-                timestamp=msg.timestamp,
-                metadata=msg.message_metadata
-            )
-            for msg in messages
-        ]
+        # Only the requested columns are read; metadata can be large
+        names = ['id'] + [name for name in (selected or MESSAGE_FIELDS) if name != 'id']
+        query = db.query(*(MESSAGE_FIELDS[name] for name in names)).filter(
+            ChatMessage.session_id == session_id)
+
+        next_cursor = None
+        paged = limit is not None or before_id is not None
+        if before_id is not None:
+            # Keyset on (timestamp, id), served by the session/timestamp index
+            anchor = db.query(ChatMessage.timestamp).filter(
+                ChatMessage.id == before_id,
+                ChatMessage.session_id == session_id
+            ).scalar_subquery()
+            query = query.filter(or_(
+                ChatMessage.timestamp < anchor,
+                and_(ChatMessage.timestamp == anchor, ChatMessage.id < before_id)
+            ))
+        if paged:
+            page_size = limit or DEFAULT_MESSAGE_PAGE
+            rows = query.order_by(
+                ChatMessage.timestamp.desc(), ChatMessage.id.desc()
+            ).limit(page_size).all()
+            if len(rows) == page_size:
+                next_cursor = str(rows[-1].id)
+                response.headers["X-Next-Cursor"] = next_cursor
+            rows.reverse()
+        else:
+            rows = query.order_by(
+                ChatMessage.timestamp.asc(), ChatMessage.id.asc()).all()
+
+        messages = [dict(zip(names, row)) for row in rows]
+        if selected is not None:
+            return JSONResponse(
+                jsonable_encoder([{name: msg[name] for name in selected} for msg in messages]),
+                headers={"X-Next-Cursor": next_cursor} if next_cursor else None)
+        return [ChatMessageResponse(**msg) for msg in messages]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -171,93 +618,58 @@ async def get_chat_messages(
         )
 
 
+@router.get("/search", response_model=List[ChatSearchResult])
+async def search_chat_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Search the current user's chat messages, best match first"""
+    try:
+        return search_messages(db, current_user.id, q, limit)
+    except SearchUnavailable as e:
+        # 501 if the database cannot search at all, 503 if the index is missing
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE if e.supported
+            else status.HTTP_501_NOT_IMPLEMENTED,
+            detail=f"Chat search is not available: {e}"
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to search chat messages: {str(e)}"
+        )
+
+
 @router.post("/chat", response_model=ChatbotResponse)
 async def chat_with_ai(
     request: ChatbotRequest,
+    http_request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Send a message to ECHO and get a response"""
     try:
-        # Check ECHO status first
-        echo_status = gemini_service.get_echo_status()
-        if not echo_status.get('model_available'):
+        # Check cached ECHO health first
+        if not get_gemini_service().health['model_available']:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="ECHO AI service is currently unavailable. Please try again later."
             )
 
-        # Get or create session
-        if request.session_id:
-            session = db.query(ChatSession).filter(
-                ChatSession.id == request.session_id,
-                ChatSession.user_id == current_user.id
-            ).first()
-            if not session:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Chat session not found"
-                )
-        else:
-            # Create new session
-            session = ChatSession(
-                user_id=current_user.id,
-                course_id=request.course_id,
-                session_name=f"ECHO Chat - {datetime.now().strftime('%Y-%m-%d %H:%M')}"
-            )
-            db.add(session)
-            db.commit()
-            db.refresh(session)
-
-        # Get course info if course_id is provided
-        course_info = None
-        if request.course_id:
-            course = db.query(Course).filter(
-                Course.id == request.course_id).first()
-            if course:
-                course_info = {
-                    'title': course.title,
-                    'description': course.description,
-                    'credits': course.credits
-                }
-
-        # Get conversation history
-        history = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session.id
-        ).order_by(ChatMessage.timestamp.desc()).limit(10).all()
-
-        conversation_history = [
-            {
-                'role': msg.role,
-                'content': msg.content
-            }
-            for msg in reversed(history)  # Reverse to get chronological order
-        ]
-
-        # Save user message
-        user_message = ChatMessage(
-            session_id=session.id,
-            role="user",
-            content=request.message
-        )
-        db.add(user_message)
-        db.commit()
-        db.refresh(user_message)
+        session = open_chat_session(
+            db, current_user.id, request.session_id, request.course_id)
 
-        # Get ECHO response with course context
         # Add timeout protection for ECHO response
         try:
-            # Set a timeout for the ECHO response (30 seconds)
-            echo_response = await asyncio.wait_for(
-                asyncio.to_thread(
-                    gemini_service.chat_with_context,
-                    message=request.message,
-                    course_id=request.course_id,
-                    conversation_history=conversation_history,
-                    course_info=course_info,
-                    db_session=db
-                ),
-                timeout=30.0
+            # Abandon the generation if it times out or the client goes away
+            chat_response = await run_until_disconnected(
+                http_request,
+                chat_turn(db, current_user, session, request, response=response),
+                timeout=get_gemini_service().request_timeout
             )
         except asyncio.TimeoutError:
             # If ECHO times out, return a helpful error message
@@ -265,6 +677,9 @@ async def chat_with_ai(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="ECHO is taking longer than expected to respond. This may be due to high demand on Google's servers. Please try again in a moment."
             )
+        except SQLAlchemyError:
+            # Saving the exchange failed, not ECHO; rolled back below
+            raise
         except Exception as e:
             # Handle other ECHO errors
             raise HTTPException(
@@ -272,37 +687,11 @@ async def chat_with_ai(
                 detail=f"ECHO encountered an error: {str(e)}. Please try again later."
             )
 
-        # Save ECHO response
-        assistant_message = ChatMessage(
-            session_id=session.id,
-            role="assistant",
-            content=echo_response['response'],
-            message_metadata={
-                'course_content_used': echo_response.get('course_content_used', False),
-                'content_files_count': echo_response.get('content_files_count', 0),
-                'success': echo_response.get('success', False),
-                'model_used': echo_response.get('model_used', 'unknown'),
-                'tokens_used': echo_response.get('tokens_used', None)
-            }
-        )
-        db.add(assistant_message)
-
-        # Update session timestamp
-        session.updated_at = datetime.now()
-
-        db.commit()
-        db.refresh(assistant_message)
+        # Fold older turns into the running summary after the reply is sent
+        if summary_pending(session):
+            background_tasks.add_task(refresh_session_summary, session.id)
 
-        return ChatbotResponse(
-            response=echo_response['response'],
-            session_id=session.id,
-            message_id=assistant_message.id,
-            timestamp=assistant_message.timestamp,
-            course_content_used=echo_response.get(
-                'course_content_used', False),
-            content_files_count=echo_response.get('content_files_count', 0),
-            metadata=assistant_message.message_metadata
-        )
+        return chat_response
 
     except HTTPException:
         raise
@@ -317,12 +706,36 @@ async def chat_with_ai(
 @router.post("/send", response_model=ChatbotResponse)
 async def send_chat_message(
     request: ChatbotRequest,
+    http_request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Send a message to ECHO (alias for /chat endpoint)"""
     # Redirect to the existing chat endpoint
-    return await chat_with_ai(request, current_user, db)
+    return await chat_with_ai(request, http_request, response, background_tasks, current_user, db)
+
+
+def analysis_response(analysis: dict, cached: bool) -> CourseAnalysisResponse:
+    if analysis['success']:
+        return CourseAnalysisResponse(
+            analysis=analysis['analysis'],
+            content_count=analysis['content_count'],
+            file_types=analysis['file_types'],
+            success=True,
+            content_version=analysis.get('content_version'),
+            analyzed_at=analysis.get('analyzed_at'),
+            cached=cached,
+            stale=analysis.get('stale', False)
+        )
+    return CourseAnalysisResponse(
+        analysis="",
+        content_count=0,
+        file_types=[],
+        success=False,
+        error=analysis.get('error', 'Unknown error')
+    )
 
 
 @router.post("/analyze-course", response_model=CourseAnalysisResponse)
@@ -334,8 +747,7 @@ async def analyze_course_content(
     """Analyze course content and provide insights"""
     try:
         # Check if analytics is enabled
-        echo_status = gemini_service.get_echo_status()
-        if not echo_status.get('analytics_enabled'):
+        if not get_gemini_service().analytics_enabled:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="ECHO analytics is currently disabled"
@@ -350,24 +762,11 @@ async def analyze_course_content(
                 detail="Course not found"
             )
 
-        # Analyze course content using ECHO
-        analysis = gemini_service.analyze_course_content(request.course_id)
+        # Stored analysis, recomputed here only on an explicit refresh
+        analysis, cached = await get_course_analysis(
+            request.course_id, user_id=current_user.id, refresh=request.refresh)
 
-        if analysis['success']:
-            return CourseAnalysisResponse(
-                analysis=analysis['analysis'],
-                content_count=analysis['content_count'],
-                file_types=analysis['file_types'],
-                success=True
-            )
-        else:
-            return CourseAnalysisResponse(
-                analysis="",
-                content_count=0,
-                file_types=[],
-                success=False,
-                error=analysis.get('error', 'Unknown error')
-            )
+        return analysis_response(analysis, cached)
 
     except HTTPException:
         raise
@@ -378,8 +777,45 @@ async def analyze_course_content(
         )
 
 
+async def save_upload(upload: UploadFile, directory: Path, max_bytes: int) -> dict:
+    """Stream an upload to `directory` in chunks, refusing files over `max_bytes`"""
+    file_path = directory / f"{uuid.uuid4()}{Path(upload.filename).suffix}"
+    size = 0
+    with open(file_path, "wb") as buffer:
+        while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"{upload.filename} is larger than {max_bytes // (1024 * 1024)} MB"
+                )
+            await asyncio.to_thread(buffer.write, chunk)
+    return {
+        "original_name": upload.filename,
+        "saved_path": str(file_path),
+        "file_size": size,
+        "content_type": upload.content_type
+    }
+
+
+async def save_uploads(uploads: List[UploadFile], directory: Path) -> List[dict]:
+    """Save uploads concurrently; if one fails, stop the others before re-raising"""
+    tasks = [asyncio.ensure_future(save_upload(upload, directory, settings.max_file_size))
+             for upload in uploads]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
 @router.post("/chat-with-files", response_model=ChatbotResponse)
 async def chat_with_files(
+    http_request: Request,
+    http_response: Response,
+    background_tasks: BackgroundTasks,
     session_id: int = Form(...),
     message: str = Form(...),
     course_id: Optional[int] = Form(None),
@@ -388,103 +824,57 @@ async def chat_with_files(
     db: Session = Depends(get_db)
 ):
     """Chat with ECHO using uploaded files (images, documents, etc.)"""
+    # Uploads only live for the duration of the request
+    upload_dir = Path(tempfile.mkdtemp(prefix="echo-upload-"))
     try:
         # Verify session exists and belongs to user
-        session = db.query(ChatSession).filter(
-            ChatSession.id == session_id,
-            ChatSession.user_id == current_user.id,
-            ChatSession.is_active == True
-        ).first()
+        session = active_chat_session(db, session_id, current_user.id)
 
-        if not session:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Chat session not found"
-            )
-
-        # Create uploads directory if it doesn't exist
-        uploads_dir = Path("uploads")
-        uploads_dir.mkdir(exist_ok=True)
-
-        # Process uploaded files
-        file_info = []
-        for file in files:
-            if file.filename:
-                # Generate unique filename
-                file_extension = Path(file.filename).suffix
-                unique_filename = f"{uuid.uuid4()}{file_extension}"
-                file_path = uploads_dir / unique_filename
-
-                # Save file
-                with open(file_path, "wb") as buffer:
-                    content = await file.read()
-                    buffer.write(content)
-
-                file_info.append({
-                    "original_name": file.filename,
-                    "saved_path": str(file_path),
-                    "file_size": len(content),
-                    "content_type": file.content_type
-                })
+        # Stream all uploads to temp storage at once
+        file_info = await save_uploads(
+            [file for file in files if file.filename], upload_dir)
 
         # Get course info if course_id is provided
-        course_info = None
-        if course_id:
-            course = db.query(Course).filter(Course.id == course_id).first()
-            if course:
-                course_info = {
-                    "title": course.title,
-                    "description": course.description,
-                    "credits": getattr(course, 'credits', None)
-                }
+        session_course_info(db, session, course_id)
 
         # Process message with files using ECHO
-        response = gemini_service.chat_with_files(
-            message=message,
-            files=file_info,
-            course_id=course_id,
-            conversation_history=None,  # Could be enhanced to include history
-            course_info=course_info,
-            db_session=db
-        )
+        try:
+            response = await run_until_disconnected(
+                http_request,
+                get_gemini_service().chat_with_files(
+                    message=message,
+                    files=file_info,
+                    course_id=course_id,
+                    conversation_history=session.recent_history(HISTORY_MESSAGES),
+                    course_info=session.course_info,
+                    db_session=db,
+                    user_id=current_user.id,
+                    priority=request_priority(current_user),
+                    conversation_summary=session.summary
+                ),
+                timeout=get_gemini_service().request_timeout
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="ECHO is taking longer than expected to respond. This may be due to high demand on Google's servers. Please try again in a moment."
+            )
+
+        set_queue_headers(http_response, response)
 
         if response.get('success', False):
-            # Save user message
-            user_message = ChatMessage(
-                session_id=session_id,
-                role='user',
-                content=message,
-                metadata={
+            chat_response = save_exchange(
+                db, session_id, message, response,
+                files_chat_metadata(response, file_info),
+                user_metadata={
                     'files_uploaded': len(file_info),
                     'file_names': [f['original_name'] for f in file_info]
-                }
-            )
-            db.add(user_message)
-
-            # Save assistant response
-            assistant_message = ChatMessage(
-                session_id=session_id,
-                role='assistant',
-                content=response['response'],
-                metadata={
-                    'course_content_used': response.get('course_content_used', False),
-                    'content_files_count': response.get('content_files_count', 0),
-                    'files_processed': len(file_info)
-                }
-            )
-            db.add(assistant_message)
-
-            # Update session
-            session.updated_at = datetime.utcnow()
-            db.commit()
-
-            return ChatbotResponse(
-                response=response['response'],
-                success=True,
-                course_content_used=response.get('course_content_used', False),
-                content_files_count=response.get('content_files_count', 0),
-                files_processed=len(file_info)
-            )
+                })
+
+            if summary_pending(session):
+                background_tasks.add_task(refresh_session_summary, session_id)
+
+            return chat_response
         else:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -500,6 +890,171 @@ async def chat_with_files(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to process message with files: {str(e)}"
         )
+    finally:
+        await asyncio.to_thread(shutil.rmtree, upload_dir, True)
+
+
+# Background jobs: long requests answered by polling or a push on /ws instead
+# of holding the HTTP connection open
+
+
+def job_user(db: Session, user_id: int) -> User:
+    """The user a job runs for; they may have been deleted since it was queued"""
+    user = db.query(User).filter(User.id == user_id).first()
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User no longer exists"
+        )
+    return user
+
+
+@router.post("/jobs/chat", response_model=EchoJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_chat_job(
+    request: ChatbotRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue a message to ECHO; the reply is stored on the job"""
+    if not get_gemini_service().health['model_available']:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="ECHO AI service is currently unavailable. Please try again later."
+        )
+    # Open the session now so the client knows where the reply will land
+    session = open_chat_session(
+        db, current_user.id, request.session_id, request.course_id)
+    payload = {**request.model_dump(), 'session_id': session.id}
+    return await submit_job(current_user.id, "chat", payload)
+
+
+@job_handler("chat")
+async def run_chat_job(user_id: int, payload: dict) -> dict:
+    request = ChatbotRequest(**payload)
+    db = SessionLocal()
+    try:
+        user = job_user(db, user_id)
+        session = open_chat_session(
+            db, user_id, request.session_id, request.course_id)
+        chat_response = await chat_turn(db, user, session, request)
+        # Already off the request path, so the summary is refreshed in line
+        if summary_pending(session):
+            await refresh_session_summary(session.id)
+        return chat_response.model_dump(mode="json")
+    finally:
+        db.close()
+
+
+@router.post("/jobs/chat-with-files", response_model=EchoJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_chat_with_files_job(
+    session_id: int = Form(...),
+    message: str = Form(...),
+    course_id: Optional[int] = Form(None),
+    files: List[UploadFile] = File([]),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue a message with uploaded files; the reply is stored on the job"""
+    active_chat_session(db, session_id, current_user.id)
+    # Uploads are kept until the job has used them
+    if JOB_UPLOAD_DIR:
+        os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+    upload_dir = Path(tempfile.mkdtemp(prefix="echo-job-", dir=JOB_UPLOAD_DIR))
+    try:
+        file_info = await save_uploads(
+            [file for file in files if file.filename], upload_dir)
+    except BaseException:
+        await asyncio.to_thread(shutil.rmtree, upload_dir, True)
+        raise
+    return await submit_job(current_user.id, "chat_files", {
+        'session_id': session_id,
+        'message': message,
+        'course_id': course_id,
+        'files': file_info,
+        'upload_dir': str(upload_dir)
+    })
+
+
+@job_handler("chat_files")
+async def run_chat_with_files_job(user_id: int, payload: dict) -> dict:
+    file_info = payload['files']
+    db = SessionLocal()
+    try:
+        user = job_user(db, user_id)
+        session = active_chat_session(db, payload['session_id'], user_id)
+        course_info = session_course_info(db, session, payload.get('course_id'))
+        response = await get_gemini_service().chat_with_files(
+            message=payload['message'],
+            files=file_info,
+            course_id=payload.get('course_id'),
+            conversation_history=session.recent_history(HISTORY_MESSAGES),
+            course_info=course_info,
+            db_session=db,
+            user_id=user_id,
+            priority=request_priority(user),
+            conversation_summary=session.summary
+        )
+        if not response.get('success', False):
+            raise RuntimeError(response.get(
+                'error', 'Failed to process message with files'))
+        chat_response = save_exchange(
+            db, session.id, payload['message'], response,
+            files_chat_metadata(response, file_info),
+            user_metadata={
+                'files_uploaded': len(file_info),
+                'file_names': [f['original_name'] for f in file_info]
+            })
+        if summary_pending(session):
+            await refresh_session_summary(session.id)
+        return chat_response.model_dump(mode="json")
+    finally:
+        db.close()
+        await asyncio.to_thread(shutil.rmtree, payload['upload_dir'], True)
+
+
+@router.post("/jobs/analyze-course", response_model=EchoJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def submit_course_analysis_job(
+    request: CourseAnalysisRequest,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Queue a course analysis; the analysis is stored on the job"""
+    if not get_gemini_service().analytics_enabled:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="ECHO analytics is currently disabled"
+        )
+    if not db.query(Course.id).filter(Course.id == request.course_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Course not found"
+        )
+    return await submit_job(current_user.id, "analysis", request.model_dump())
+
+
+@job_handler("analysis")
+async def run_course_analysis_job(user_id: int, payload: dict) -> dict:
+    request = CourseAnalysisRequest(**payload)
+    analysis, cached = await get_course_analysis(
+        request.course_id, user_id=user_id, refresh=request.refresh)
+    if not analysis['success']:
+        raise RuntimeError(analysis.get('error', 'Unknown error'))
+    return analysis_response(analysis, cached).model_dump(mode="json")
+
+
+@router.get("/jobs/{job_id}", response_model=EchoJobResponse)
+async def get_echo_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Status of a background job, with its result once it has finished"""
+    job = await asyncio.to_thread(get_job, job_id, current_user.id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
 
 
 @router.delete("/sessions/{session_id}")
@@ -523,6 +1078,7 @@ async def delete_chat_session(
 
         session.is_active = False
         db.commit()
+        session_cache.invalidate(session_id)
 
         return {"message": "ECHO chat session deleted successfully"}
 
@@ -570,3 +1126,186 @@ async def rename_chat_session(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to rename chat session: {str(e)}"
         )
+
+
+# ECHO conversations over a WebSocket; mounted without the /api/chatbot prefix
+
+
+def load_echo_socket_state(username: str, session_id: int):
+    """User and active chat session for an ECHO socket, or None for either"""
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(
+            User.username == username, User.is_active == True).first()
+        if user is None:
+            return None, None
+        db.expunge(user)
+        try:
+            return user, active_chat_session(db, session_id, user.id)
+        except HTTPException:
+            return user, None
+    finally:
+        db.close()
+
+
+async def stream_echo_reply(websocket: WebSocket, user: User, session_id: int,
+                            data: dict, background: set):
+    """Answer one message on an ECHO socket, streaming the reply as it arrives"""
+    request_id = data.get("request_id")
+
+    async def send(message_type: str, payload: dict):
+        await websocket.send_text(json.dumps({
+            "type": message_type,
+            "data": {"request_id": request_id, **payload}
+        }, default=str))
+
+    # Checked on every message: another worker may have deleted the session
+    # or added to it since the socket opened
+    db = SessionLocal()
+    try:
+        session = active_chat_session(db, session_id, user.id)
+    except HTTPException as e:
+        await send("echo:error", {"message": e.detail})
+        return
+    finally:
+        db.close()
+
+    try:
+        request = ChatbotRequest(
+            message=data.get("message") or "",
+            session_id=session.id,
+            course_id=data.get("course_id", session.course_id),
+            live_stream_id=data.get("live_stream_id"))
+    except ValueError as e:
+        await send("echo:error", {"message": f"Invalid message: {e}"})
+        return
+    echo = get_gemini_service()
+    if not echo.health['model_available']:
+        await send("echo:error", {"message": "ECHO AI service is currently unavailable. Please try again later."})
+        return
+
+    # Tokens are queued so a slow socket never stalls the model stream
+    tokens: asyncio.Queue = asyncio.Queue()
+    streamed = False
+
+    async def send_tokens():
+        nonlocal streamed
+        current_attempt = 0
+        while (item := await tokens.get()) is not None:
+            text, attempt = item
+            if attempt != current_attempt:
+                # A retry starts the reply over
+                current_attempt = attempt
+                await send("echo:restart", {"attempt": attempt})
+            streamed = True
+            await send("echo:token", {"text": text})
+
+    sender = asyncio.create_task(send_tokens())
+    try:
+        db = SessionLocal()
+        try:
+            reply = await asyncio.wait_for(
+                chat_turn(db, user, session, request,
+                          on_text=lambda text, attempt: tokens.put_nowait((text, attempt))),
+                timeout=echo.request_timeout)
+        finally:
+            db.close()
+        tokens.put_nowait(None)
+        await sender
+        if not streamed:
+            # Cached answers arrive whole
+            await send("echo:token", {"text": reply.response})
+        await send("echo:done", reply.model_dump(mode="json"))
+    except asyncio.TimeoutError:
+        await send("echo:error", {"message": "ECHO is taking longer than expected to respond. Please try again in a moment."})
+        return
+    except asyncio.CancelledError:
+        try:
+            await send("echo:cancelled", {})
+        except Exception:
+            pass  # the socket is gone
+        raise
+    except Exception as e:
+        await send("echo:error", {"message": f"ECHO encountered an error: {e}"})
+        return
+    finally:
+        sender.cancel()
+
+    if summary_pending(session):
+        task = asyncio.create_task(refresh_session_summary(session.id))
+        background.add(task)
+        task.add_done_callback(background.discard)
+
+
+@socket_router.websocket("/ws/echo/{session_id}")
+async def websocket_echo_endpoint(websocket: WebSocket, session_id: int):
+    """One ECHO conversation over one socket.
+
+    The token, user and session are checked once when the socket opens, and
+    the session stays in memory until it closes. Send
+    {"type": "echo:message", "data": {"message", "course_id", "request_id"}}
+    and the reply streams back as echo:token messages ending in echo:done;
+    {"type": "echo:cancel"} stops the reply in flight.
+    """
+    await websocket.accept()
+
+    token = websocket.query_params.get("token")
+    if not token:
+        await websocket.close(code=4001, reason="No token provided")
+        return
+    payload = verify_token(token)
+    if not payload or payload.get("sub") is None:
+        await websocket.close(code=4001, reason="Invalid token")
+        return
+    user, session = await asyncio.to_thread(
+        load_echo_socket_state, payload.get("sub"), session_id)
+    if user is None:
+        await websocket.close(code=4001, reason="Invalid token")
+        return
+    if session is None:
+        await websocket.close(code=4004, reason="Chat session not found")
+        return
+
+    await websocket.send_text(json.dumps({
+        "type": "echo:session",
+        "data": {"session_id": session.id, "course_id": session.course_id}
+    }))
+
+    reply: Optional[asyncio.Task] = None
+    background = set()
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except json.JSONDecodeError:
+                await websocket.send_text(json.dumps({
+                    "type": "error",
+                    "data": {"message": "Invalid JSON"}
+                }))
+                continue
+
+            message_type = message.get("type")
+            if message_type == "echo:message":
+                if reply is not None and not reply.done():
+                    await websocket.send_text(json.dumps({
+                        "type": "echo:error",
+                        "data": {"request_id": message.get("data", {}).get("request_id"),
+                                 "message": "Wait for the current reply or cancel it first"}
+                    }))
+                    continue
+                reply = asyncio.create_task(stream_echo_reply(
+                    websocket, user, session.id, message.get("data", {}), background))
+            elif message_type == "echo:cancel":
+                if reply is not None and not reply.done():
+                    reply.cancel()
+            elif message_type == "ping":
+                await websocket.send_text(json.dumps({
+                    "type": "pong",
+                    "data": {"timestamp": datetime.utcnow().isoformat()}
+                }))
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if reply is not None:
+            reply.cancel()
@@ -5,8 +5,6 @@ from database import get_db
 from models import Course, User, Application, CourseDocument, Enrollment, Notification
 from schemas import CourseCreate, CourseResponse, CourseUpdate, ApplicationCreate, ApplicationResponse
 from auth import get_current_user
-import boto3
-from botocore.exceptions import ClientError
 from config import settings
 from sqlalchemy import func
 from schemas import EnrolledCourseResponse, UserResponse
@@ -15,30 +13,48 @@ from services.notification_service import NotificationService
 router = APIRouter(prefix="/courses", tags=["courses"])
 
 
+_presign_client = None
+
+
+def get_presign_client():
+    """S3 client for signing URLs, created on first use and shared.
+
+    Only a client that was created is kept; a failure is retried next time.
+    """
+    global _presign_client
+    if _presign_client is None:
+        _presign_client = create_presign_client()
+    return _presign_client
+
+
+def create_presign_client():
+    import boto3
+    if settings.use_iam_role:
+        return boto3.client('s3', region_name=settings.aws_region)
+    return boto3.client(
+        's3',
+        aws_access_key_id=settings.aws_access_key_id,
+        aws_secret_access_key=settings.aws_secret_access_key,
+        region_name=settings.aws_region
+    )
+
+
 def generate_presigned_url(bucket_name: str, object_key: str, expiration: int = 3600) -> str:
     """Generate a pre-signed URL for S3 object access"""
     try:
-        if settings.use_iam_role:
-            s3_client = boto3.client('s3', region_name=settings.aws_region)
-        else:
-            s3_client = boto3.client(
-                's3',
-                aws_access_key_id=settings.aws_access_key_id,
-                aws_secret_access_key=settings.aws_secret_access_key,
-                region_name=settings.aws_region
-            )
-
-        presigned_url = s3_client.generate_presigned_url(
+        presigned_url = get_presign_client().generate_presigned_url(
             'get_object',
             Params={'Bucket': bucket_name, 'Key': object_key},
             ExpiresIn=expiration
         )
         return presigned_url
-    except ClientError as e:
-        print(f"Error generating presigned URL: {e}")
-        return None
     except Exception as e:
-        print(f"Unexpected error generating presigned URL: {e}")
+        # Imported here; botocore is only loaded once boto3 is
+        from botocore.exceptions import ClientError
+        if isinstance(e, ClientError):
+            print(f"Error generating presigned URL: {e}")
+        else:
+            print(f"Unexpected error generating presigned URL: {e}")
         return None
 
 
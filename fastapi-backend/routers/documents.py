@@ -2,27 +2,42 @@ from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File,
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
-import boto3
 import os
 import uuid
 import mimetypes
 from pathlib import Path
-from botocore.exceptions import ClientError
 
 from database import get_db
 from models import Course, CourseDocument, User
 from schemas import CourseDocumentCreate, CourseDocumentResponse, DocumentUploadResponse
 from auth import get_current_user
 from config import settings
+from services.gemini_service import invalidate_course_caches
 
 router = APIRouter(tags=["documents"])
 
 # Initialize S3 client with IAM role support
 
 
+_s3_client = None
+
+
 def get_s3_client():
-    """Get S3 client using IAM role (EC2) or access keys (local development)"""
+    """Get S3 client using IAM role (EC2) or access keys (local development).
+
+    Created on first use and shared; boto3 is only imported then. A missing
+    client is not remembered, so credentials configured later are picked up.
+    """
+    global _s3_client
+    if _s3_client is None:
+        _s3_client = create_s3_client()
+    return _s3_client
+
+
+def create_s3_client():
+    """New S3 client, or None if S3 is not configured"""
     try:
+        import boto3
         if settings.use_iam_role:
             # Use IAM role attached to EC2 instance (recommended for production)
             return boto3.client('s3', region_name=settings.aws_region)
@@ -44,10 +59,6 @@ def get_s3_client():
         return None
 
 
-# Initialize S3 client
-s3_client = get_s3_client()
-
-
 def get_file_extension(filename: str) -> str:
     """Extract file extension from filename"""
     return os.path.splitext(filename)[1].lower()
@@ -63,6 +74,7 @@ def upload_to_s3(file_content: bytes, s3_key: str, content_type: str) -> str:
     """Upload file to S3 and return the S3 URL"""
     try:
         # Check if S3 client is available
+        s3_client = get_s3_client()
         if s3_client is None:
             print("📁 S3 not configured, using local storage")
             return upload_to_local_storage(file_content, s3_key, content_type)
@@ -80,12 +92,13 @@ def upload_to_s3(file_content: bytes, s3_key: str, content_type: str) -> str:
         s3_url = f"https://{settings.s3_bucket_name}.s3.{settings.aws_region}.amazonaws.com/{s3_key}"
         print(f"✅ File uploaded to S3: {s3_url}")
         return s3_url
-    except ClientError as e:
-        print(f"❌ S3 upload failed: {e}")
-        print("📁 Falling back to local storage")
-        return upload_to_local_storage(file_content, s3_key, content_type)
     except Exception as e:
-        print(f"❌ Unexpected error in S3 upload: {e}")
+        # Imported here; botocore is only loaded once boto3 is
+        from botocore.exceptions import ClientError
+        if isinstance(e, ClientError):
+            print(f"❌ S3 upload failed: {e}")
+        else:
+            print(f"❌ Unexpected error in S3 upload: {e}")
         print("📁 Falling back to local storage")
         return upload_to_local_storage(file_content, s3_key, content_type)
 
@@ -202,6 +215,7 @@ async def upload_course_document(
         db.add(document)
         db.commit()
         db.refresh(document)
+        invalidate_course_caches(course_id)
 
         return DocumentUploadResponse(
             success=True,
@@ -311,14 +325,16 @@ async def delete_document(
 
     try:
         # Delete from S3
-        s3_client.delete_object(
+        get_s3_client().delete_object(
             Bucket=document.s3_bucket,
             Key=document.s3_key
         )
 
         # Delete from database
+        course_id = document.course_id
         db.delete(document)
         db.commit()
+        invalidate_course_caches(course_id)
 
         return {"message": "Document deleted successfully"}
 
@@ -371,6 +387,7 @@ async def update_document(
         document.updated_at = datetime.utcnow()
         db.commit()
         db.refresh(document)
+        invalidate_course_caches(document.course_id)
 
         return CourseDocumentResponse.from_orm(document)
 
@@ -694,6 +694,8 @@ class ChatbotRequest(BaseModel):
     course_id: Optional[int] = None
     include_course_content: bool = Field(
         default=True, description="Whether to include course content in context")
+    live_stream_id: Optional[int] = Field(
+        default=None, description="Live stream the question was asked during, if any")
 
 
 class ChatbotResponse(BaseModel):
@@ -708,6 +710,8 @@ class ChatbotResponse(BaseModel):
 
 class CourseAnalysisRequest(BaseModel):
     course_id: int
+    # Recompute even if the stored analysis matches the current content
+    refresh: bool = False
 
 
 class CourseAnalysisResponse(BaseModel):
@@ -716,3 +720,33 @@ class CourseAnalysisResponse(BaseModel):
     file_types: List[str]
     success: bool
     error: Optional[str] = None
+    content_version: Optional[str] = None
+    analyzed_at: Optional[datetime] = None
+    cached: bool = False
+    # The course documents changed since; a refresh is under way
+    stale: bool = False
+
+
+class ChatSearchResult(BaseModel):
+    message_id: int
+    session_id: int
+    session_name: Optional[str] = None
+    role: str
+    timestamp: datetime
+    # HTML-escaped excerpt with matches wrapped in <mark>
+    snippet: str
+    score: float
+
+
+class EchoJobResponse(BaseModel):
+    id: str
+    kind: str
+    status: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
@@ -0,0 +1,190 @@
+"""
+Priority admission queue in front of the ECHO model.
+
+When the rate limiter has no token for a request, the request waits here
+instead of being rejected. Waiters are admitted in priority order as tokens
+refill, and are shed once their deadline passes or the queue is full.
+"""
+
+import asyncio
+import bisect
+import itertools
+import time
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import List, Optional
+
+from services.rate_limiter import TokenBucketRateLimiter
+
+# Longest the dispatcher sleeps before re-checking the buckets
+MAX_DISPATCH_SLEEP = 1.0
+
+
+class Priority(IntEnum):
+    """Admission classes, lower values are admitted first"""
+    URGENT = 0       # instructors and questions asked during a live session
+    INTERACTIVE = 1  # regular student chats
+    BACKGROUND = 2   # course analysis and other non-interactive work
+
+
+class AdmissionRejected(Exception):
+    """The request was shed instead of admitted"""
+
+    def __init__(self, reason: str, retry_after: float, scope: Optional[str] = None):
+        super().__init__(reason)
+        self.reason = reason  # "queue_full" or "deadline"
+        self.retry_after = retry_after
+        self.scope = scope
+
+
+@dataclass
+class Admission:
+    """How a request got through the queue, reported back to the client"""
+    queued: bool
+    wait_seconds: float = 0.0
+    queue_depth: int = 0
+    eta_seconds: float = 0.0
+
+    def to_dict(self):
+        return {
+            "queued": self.queued,
+            "wait_ms": round(self.wait_seconds * 1000, 1),
+            "queue_depth": self.queue_depth,
+            "eta_seconds": round(self.eta_seconds, 2)
+        }
+
+
+@dataclass(order=True)
+class _Ticket:
+    priority: int
+    seq: int
+    user_id: Optional[int] = field(compare=False)
+    course_id: Optional[int] = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    # Bucket that last refused this ticket, and when it has a token again
+    scope: str = field(default="global", compare=False)
+    retry_after: float = field(default=0.0, compare=False)
+
+
+class AdmissionQueue:
+    """Bounded priority queue that meters requests through the rate limiter"""
+
+    def __init__(self, limiter: TokenBucketRateLimiter, max_depth: int = 100):
+        self.limiter = limiter
+        self.max_depth = max_depth
+        # Kept sorted by (priority, arrival order)
+        self._waiters: List[_Ticket] = []
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def depth(self) -> int:
+        return len(self._waiters)
+
+    def estimate_wait(self, position: int) -> float:
+        """Seconds until `position` requests ahead drain at the global refill rate"""
+        return position / self.limiter.global_spec.refill_rate
+
+    def describe(self):
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "eta_seconds": round(self.estimate_wait(self.depth), 2)
+        }
+
+    async def admit(self, priority: Priority, user_id: Optional[int] = None,
+                    course_id: Optional[int] = None, deadline: float = 10.0) -> Admission:
+        """Wait until the request may call the model.
+
+        Raises AdmissionRejected if the queue is full, or if the request would
+        still be waiting `deadline` seconds from now.
+        """
+        # Fast path: nobody is waiting and a token is available
+        if not self._waiters:
+            decision = await self.limiter.acquire(user_id, course_id)
+            if decision.allowed:
+                return Admission(queued=False)
+            if decision.retry_after > deadline:
+                raise AdmissionRejected(
+                    "deadline", decision.retry_after, decision.scope)
+
+        if len(self._waiters) >= self.max_depth:
+            raise AdmissionRejected(
+                "queue_full", self.estimate_wait(len(self._waiters)), "global")
+
+        ticket = _Ticket(priority, next(self._seq), user_id, course_id,
+                         asyncio.get_running_loop().create_future())
+        bisect.insort(self._waiters, ticket)
+        position = self._waiters.index(ticket)
+        eta = self.estimate_wait(position + 1)
+        self._ensure_dispatcher()
+        self._changed.set()
+
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(ticket.future, timeout=deadline)
+        except asyncio.TimeoutError:
+            if ticket.scope == "global":
+                retry_after = self.estimate_wait(len(self._waiters))
+            else:
+                # Held back by the user's or course's own bucket
+                retry_after = ticket.retry_after
+            raise AdmissionRejected("deadline", retry_after, ticket.scope)
+        finally:
+            # Covers deadline shedding and cancelled callers
+            if ticket in self._waiters:
+                self._waiters.remove(ticket)
+
+        return Admission(queued=True, wait_seconds=time.monotonic() - started,
+                         queue_depth=position + 1, eta_seconds=eta)
+
+    def _ensure_dispatcher(self):
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    def _hand_token(self, ticket: _Ticket):
+        """Admit `ticket` with the token just taken for it.
+
+        The waiter may have been shed or cancelled while the token was being
+        taken; the token then goes to the next waiter in line rather than
+        being wasted.
+        """
+        for waiter in [ticket] + list(self._waiters):
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            if not waiter.future.done():
+                waiter.future.set_result(True)
+                return
+
+    async def _dispatch(self):
+        """Hand out tokens to waiters in priority order until the queue drains"""
+        while self._waiters:
+            self._changed.clear()
+            sleep_for = MAX_DISPATCH_SLEEP
+            admitted = False
+
+            for ticket in list(self._waiters):
+                if ticket.future.done():
+                    continue
+                decision = await self.limiter.acquire(
+                    ticket.user_id, ticket.course_id)
+                if decision.allowed:
+                    self._hand_token(ticket)
+                    admitted = True
+                    break
+                ticket.scope = decision.scope
+                ticket.retry_after = decision.retry_after
+                sleep_for = min(sleep_for, decision.retry_after)
+                if decision.scope == "global":
+                    # Nobody behind this ticket can go either
+                    break
+                # Only this user's or course's bucket is empty; let later
+                # waiters past so one heavy user cannot stall the queue
+
+            if admitted:
+                continue
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=max(sleep_for, 0.01))
+            except asyncio.TimeoutError:
+                pass
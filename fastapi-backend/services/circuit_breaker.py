@@ -0,0 +1,125 @@
+"""
+Circuit breaker for calls to the LLM provider.
+
+After enough consecutive provider failures the breaker opens and calls fail
+immediately instead of retrying against a provider that is down. Once the
+recovery timeout passes, a limited number of trial calls are let through
+(half-open); a success closes the breaker, a failure opens it again.
+"""
+
+import threading
+import time
+from enum import Enum
+from typing import Any, Dict, Optional
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the provider while the breaker is open"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Circuit open, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker shared by every call to one provider"""
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0,
+                 half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._half_open_calls = 0
+        self._total_opens = 0
+        self._lock = threading.Lock()
+
+    def _retry_after(self, now: float) -> float:
+        return max(0.0, self._opened_at + self.recovery_timeout - now)
+
+    def _refresh(self, now: float):
+        # Caller holds the lock
+        if self._state == CircuitState.OPEN and self._retry_after(now) == 0:
+            self._state = CircuitState.HALF_OPEN
+            self._half_open_calls = 0
+
+    @property
+    def state(self) -> CircuitState:
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self._state
+
+    def is_open(self) -> bool:
+        """Peek without reserving a trial call: True while calls would be refused"""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            if self._state == CircuitState.OPEN:
+                return True
+            return (self._state == CircuitState.HALF_OPEN
+                    and self._half_open_calls >= self.half_open_max_calls)
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._opened_at is None:
+                return 0.0
+            return self._retry_after(time.monotonic())
+
+    def before_call(self):
+        """Reserve permission for one provider call or raise CircuitOpenError"""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            if self._state == CircuitState.OPEN:
+                raise CircuitOpenError(self._retry_after(now))
+            if self._state == CircuitState.HALF_OPEN:
+                if self._half_open_calls >= self.half_open_max_calls:
+                    raise CircuitOpenError(self.recovery_timeout)
+                self._half_open_calls += 1
+
+    def release(self):
+        """Give back a reserved call that ended without an outcome (e.g. cancelled)"""
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def record_success(self):
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._consecutive_failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self._consecutive_failures += 1
+            if (self._state == CircuitState.HALF_OPEN
+                    or self._consecutive_failures >= self.failure_threshold):
+                if self._state != CircuitState.OPEN:
+                    self._total_opens += 1
+                self._state = CircuitState.OPEN
+                self._opened_at = now
+                self._half_open_calls = 0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Breaker state for status reporting"""
+        with self._lock:
+            now = time.monotonic()
+            self._refresh(now)
+            return {
+                "state": self._state.value,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "recovery_timeout": self.recovery_timeout,
+                "retry_after": round(self._retry_after(now), 1) if self._state == CircuitState.OPEN else 0.0,
+                "times_opened": self._total_opens
+            }
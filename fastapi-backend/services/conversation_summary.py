@@ -0,0 +1,126 @@
+"""
+Rolling conversation summaries for long ECHO sessions.
+
+Only the most recent turns of a session are sent verbatim. Older turns are
+folded into ChatSession.summary by a background task after each reply, so
+the prompt stays roughly constant in size however long the session runs.
+"""
+
+import asyncio
+import os
+from typing import List, Optional
+
+from database import SessionLocal
+from models import ChatSession, ChatMessage
+from services.gemini_service import get_gemini_service
+from services.prompt_budget import estimate_tokens
+from services.session_cache import session_cache
+
+# Turns always sent verbatim, never folded into the summary
+KEEP_VERBATIM = int(os.getenv('ECHO_SUMMARY_KEEP_MESSAGES', '6'))
+# Fold older turns once at least this many have piled up, to batch model calls
+SUMMARY_BATCH = int(os.getenv('ECHO_SUMMARY_BATCH', '4'))
+# Most turns, and transcript tokens, folded in by one summary call; a long
+# backlog (such as the first summary of an old session) is folded in chunks
+FOLD_CHUNK = int(os.getenv('ECHO_SUMMARY_CHUNK', '40'))
+FOLD_CHUNK_TOKENS = int(os.getenv('ECHO_SUMMARY_CHUNK_TOKENS', '6000'))
+
+# Sessions with a summary update in flight in this worker
+_in_progress = set()
+
+
+def _load_unsummarized(session_id: int, limit: int):
+    """The session's summary and its oldest `limit` unsummarized turns"""
+    db = SessionLocal()
+    try:
+        session = db.query(ChatSession).filter(
+            ChatSession.id == session_id).first()
+        if not session:
+            return None, []
+        messages = db.query(ChatMessage).filter(
+            ChatMessage.session_id == session_id,
+            ChatMessage.id > (session.summarized_through_id or 0)
+        ).order_by(ChatMessage.id.asc()).limit(limit).all()
+        return {
+            "summary": session.summary,
+            "summarized_through_id": session.summarized_through_id or 0
+        }, [{"id": m.id, "role": m.role, "content": m.content} for m in messages]
+    finally:
+        db.close()
+
+
+def _store_summary(session_id: int, expected_through_id: int, summary: str, through_id: int):
+    db = SessionLocal()
+    try:
+        # Only advance if nobody else folded these turns in the meantime.
+        # updated_at is kept as is: a summary is not activity in the session,
+        # and it keys both the session list pages and the session cache.
+        updated = db.query(ChatSession).filter(
+            ChatSession.id == session_id,
+            ChatSession.summarized_through_id == expected_through_id
+        ).update({
+            ChatSession.summary: summary,
+            ChatSession.summarized_through_id: through_id,
+            ChatSession.updated_at: ChatSession.updated_at
+        }, synchronize_session=False)
+        db.commit()
+        if updated:
+            session_cache.update_summary(session_id, summary, through_id)
+    finally:
+        db.close()
+
+
+def summary_due(unsummarized_count: int) -> bool:
+    """Whether enough unsummarized turns piled up to be worth a refresh"""
+    return unsummarized_count >= KEEP_VERBATIM + SUMMARY_BATCH
+
+
+def messages_to_fold(messages: List[dict]) -> List[dict]:
+    """Older unsummarized turns that are due to be folded into the summary,
+    at most one chunk of them"""
+    if not summary_due(len(messages)):
+        return []
+    to_fold, tokens = [], 0
+    for message in messages[:-KEEP_VERBATIM][:FOLD_CHUNK]:
+        tokens += estimate_tokens(message.get("content") or "")
+        if to_fold and tokens > FOLD_CHUNK_TOKENS:
+            break
+        to_fold.append(message)
+    return to_fold
+
+
+async def refresh_session_summary(session_id: int) -> Optional[str]:
+    """Fold the session's older turns into its running summary, if enough piled up.
+
+    A backlog longer than one chunk is folded one chunk per model call, oldest
+    first, so no single prompt carries the whole transcript.
+    """
+    if session_id in _in_progress:
+        return None
+    _in_progress.add(session_id)
+    try:
+        summary = None
+        while True:
+            session, messages = await asyncio.to_thread(
+                _load_unsummarized, session_id, FOLD_CHUNK + KEEP_VERBATIM)
+            if not session:
+                return summary
+            to_fold = messages_to_fold(messages)
+            if not to_fold:
+                return summary
+
+            folded = await get_gemini_service().summarize_conversation(
+                session["summary"], to_fold)
+            if not folded:
+                # Try again after the next reply
+                return summary
+
+            await asyncio.to_thread(
+                _store_summary, session_id, session["summarized_through_id"],
+                folded, to_fold[-1]["id"])
+            summary = folded
+    except Exception as e:
+        print(f"Error updating summary for chat session {session_id}: {e}")
+        return None
+    finally:
+        _in_progress.discard(session_id)
@@ -0,0 +1,245 @@
+"""
+Stored ECHO course analyses.
+
+An analysis is expensive (every course file is fetched and extracted, then
+the model is called), but it only changes when the course content does. Each
+result is stored with the S3 content version it was built from. The endpoint
+serves the stored row without touching S3; if the course documents changed
+since, the row is marked stale and refreshed in the background. The batch job
+below refreshes courses offline. It waits in the admission queue far longer
+than a user would, and retries courses that were shed anyway.
+
+Run the batch job from the fastapi-backend directory:
+
+    python -m services.course_analysis --only-changed --concurrency 4
+"""
+
+import argparse
+import asyncio
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import Course, CourseAnalysis
+from services.gemini_service import get_gemini_service
+
+# Courses analyzed at once by the batch job; each holds S3 downloads and a model call
+DEFAULT_CONCURRENCY = int(os.getenv('ECHO_ANALYSIS_CONCURRENCY', '4'))
+# Seconds a batch analysis may wait for a rate-limit token; nobody is waiting on it
+BATCH_QUEUE_DEADLINE = float(os.getenv('ECHO_ANALYSIS_QUEUE_DEADLINE', '600'))
+# Times a course shed by the admission queue is tried again
+BATCH_RETRIES = int(os.getenv('ECHO_ANALYSIS_RETRIES', '3'))
+
+# Courses with a background refresh in flight in this worker, and their tasks
+_refreshing = set()
+_refresh_tasks = set()
+
+
+def _row_to_dict(row: CourseAnalysis, document_version: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "success": True,
+        "analysis": row.analysis,
+        "content_count": row.content_count or 0,
+        "file_types": row.file_types or [],
+        "content_version": row.content_version,
+        "analyzed_at": row.updated_at or row.created_at,
+        "stale": document_version is not None and row.document_version != document_version
+    }
+
+
+def _document_version(db, course_id: int) -> str:
+    return get_gemini_service().get_course_context_version(course_id, db)
+
+
+def _load_stored(course_id: int) -> Optional[Dict[str, Any]]:
+    """The stored analysis, marked stale if the course documents changed since"""
+    db = SessionLocal()
+    try:
+        row = db.query(CourseAnalysis).filter(
+            CourseAnalysis.course_id == course_id).first()
+        return _row_to_dict(row, _document_version(db, course_id)) if row else None
+    finally:
+        db.close()
+
+
+def _mark_current(course_id: int, document_version: str):
+    """Record that the stored analysis still matches the course content"""
+    db = SessionLocal()
+    try:
+        db.query(CourseAnalysis).filter(CourseAnalysis.course_id == course_id).update(
+            {CourseAnalysis.document_version: document_version}, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _store(course_id: int, version: str, document_version: str,
+           result: Dict[str, Any]) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        for attempt in range(2):
+            row = db.query(CourseAnalysis).filter(
+                CourseAnalysis.course_id == course_id).first()
+            if row is None:
+                row = CourseAnalysis(course_id=course_id)
+                db.add(row)
+            row.content_version = version
+            row.document_version = document_version
+            row.analysis = result["analysis"]
+            row.content_count = result["content_count"]
+            row.file_types = result["file_types"]
+            row.model_used = result.get("model_used")
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another run stored this course first; update its row instead
+                db.rollback()
+                if attempt:
+                    raise
+                continue
+            db.refresh(row)
+            return _row_to_dict(row)
+    finally:
+        db.close()
+
+
+def _course_ids() -> List[int]:
+    db = SessionLocal()
+    try:
+        return [course_id for (course_id,) in db.query(Course.id).order_by(Course.id).all()]
+    finally:
+        db.close()
+
+
+def _current_versions(course_id: int) -> Tuple[str, str]:
+    """S3 content version and course document version of the course"""
+    db = SessionLocal()
+    try:
+        document_version = _document_version(db, course_id)
+    finally:
+        db.close()
+    return get_gemini_service().get_s3_content_version(course_id), document_version
+
+
+async def refresh_course_analysis(course_id: int, user_id: Optional[int] = None,
+                                  force: bool = False,
+                                  queue_deadline: Optional[float] = None) -> Tuple[Dict[str, Any], bool]:
+    """Analyze the course again unless the stored analysis matches its S3 content.
+
+    Lists the course's S3 files and may call the model, so request paths only
+    come here on an explicit refresh. Returns the analysis and whether it
+    came from storage.
+    """
+    (version, document_version), stored = await asyncio.gather(
+        asyncio.to_thread(_current_versions, course_id),
+        asyncio.to_thread(_load_stored, course_id))
+    if stored and not force and stored["content_version"] == version:
+        if stored["stale"]:
+            # Documents changed without changing the files the analysis reads
+            await asyncio.to_thread(_mark_current, course_id, document_version)
+            stored["stale"] = False
+        return stored, True
+
+    result = await get_gemini_service().analyze_course_content(
+        course_id, user_id=user_id, queue_deadline=queue_deadline)
+    # Only keep real model output; failures and placeholders are retried next time
+    if result["success"] and result.get("model_used"):
+        return await asyncio.to_thread(_store, course_id, version, document_version, result), False
+    return result, False
+
+
+async def _refresh_in_background(course_id: int):
+    try:
+        await refresh_course_analysis(course_id, queue_deadline=BATCH_QUEUE_DEADLINE)
+    except Exception as e:
+        print(f"Error refreshing the analysis of course {course_id}: {e}")
+    finally:
+        _refreshing.discard(course_id)
+
+
+def schedule_refresh(course_id: int):
+    """Refresh a stale analysis without holding up the request that found it"""
+    if course_id in _refreshing:
+        return
+    _refreshing.add(course_id)
+    task = asyncio.get_running_loop().create_task(_refresh_in_background(course_id))
+    _refresh_tasks.add(task)
+    task.add_done_callback(_refresh_tasks.discard)
+
+
+async def get_course_analysis(course_id: int, user_id: Optional[int] = None,
+                              refresh: bool = False,
+                              queue_deadline: Optional[float] = None) -> Tuple[Dict[str, Any], bool]:
+    """The stored analysis; a fresh one with `refresh` or if none is stored yet.
+
+    A stored analysis whose course documents changed since is returned with
+    `stale` set and refreshed in the background. Returns the analysis and
+    whether it came from storage.
+    """
+    if not refresh:
+        stored = await asyncio.to_thread(_load_stored, course_id)
+        if stored:
+            if stored["stale"]:
+                schedule_refresh(course_id)
+            return stored, True
+    return await refresh_course_analysis(
+        course_id, user_id=user_id, force=refresh, queue_deadline=queue_deadline)
+
+
+async def run_batch(course_ids: Optional[List[int]] = None, only_changed: bool = True,
+                    concurrency: int = DEFAULT_CONCURRENCY) -> Dict[str, int]:
+    """Analyze the given courses (default: all), a few at a time"""
+    if course_ids is None:
+        course_ids = await asyncio.to_thread(_course_ids)
+    semaphore = asyncio.Semaphore(concurrency)
+    totals = {"analyzed": 0, "unchanged": 0, "failed": 0}
+
+    async def analyze(course_id: int):
+        for attempt in range(BATCH_RETRIES + 1):
+            async with semaphore:
+                try:
+                    result, stored = await refresh_course_analysis(
+                        course_id, force=not only_changed,
+                        queue_deadline=BATCH_QUEUE_DEADLINE)
+                except Exception as e:
+                    result, stored = {"success": False, "error": str(e)}, False
+            # Shed by the admission queue: wait it out and try again
+            if "retry_after" not in result or attempt == BATCH_RETRIES:
+                break
+            print(f"⏳ course {course_id}: ECHO busy, retrying in {result['retry_after']:.0f}s")
+            await asyncio.sleep(result["retry_after"])
+        if stored:
+            totals["unchanged"] += 1
+            print(f"= course {course_id}: unchanged")
+        elif result["success"]:
+            totals["analyzed"] += 1
+            print(f"✅ course {course_id}: analyzed {result['content_count']} files")
+        else:
+            totals["failed"] += 1
+            print(f"⚠️  course {course_id}: {result.get('error', 'analysis failed')}")
+
+    await asyncio.gather(*(analyze(course_id) for course_id in course_ids))
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Analyze course content with ECHO and store the results")
+    parser.add_argument("--course", type=int, action="append", dest="course_ids",
+                        help="Course id to analyze (repeatable, default: all courses)")
+    parser.add_argument("--only-changed", action="store_true",
+                        help="Skip courses whose stored analysis matches the current content")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Courses analyzed at once")
+    args = parser.parse_args()
+
+    totals = asyncio.run(run_batch(
+        args.course_ids, only_changed=args.only_changed, concurrency=args.concurrency))
+    print(f"Done: {totals['analyzed']} analyzed, {totals['unchanged']} unchanged, "
+          f"{totals['failed']} failed")
+
+
+if __name__ == "__main__":
+    main()
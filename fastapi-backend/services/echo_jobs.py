@@ -0,0 +1,304 @@
+"""
+Background jobs for long ECHO requests.
+
+Chats with large files and course analyses can run past the HTTP timeout.
+Submitted as a job instead, the request is stored in the echo_jobs table and
+the endpoint answers right away with the job id; the work runs outside the
+request and its result is stored on the job. Clients poll
+GET /api/chatbot/jobs/{id} or wait for an `echo:job_update` message on /ws.
+
+Jobs run in-process (a few at a time per worker) by default. With
+ECHO_JOB_BACKEND=celery they are sent to Celery workers instead
+(`celery -A services.echo_worker worker`), so no uvicorn worker holds them.
+When REDIS_URL is set, job updates are published through Redis so every web
+worker can push them to its own sockets.
+"""
+
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+from sqlalchemy import and_, or_
+
+from database import SessionLocal
+from models import EchoJob
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+# Longest a job may run; far above the HTTP request timeout
+JOB_TIMEOUT = float(os.getenv('ECHO_JOB_TIMEOUT', '300'))
+# Jobs run at once by each web worker with the in-process backend
+JOB_WORKERS = int(os.getenv('ECHO_JOB_WORKERS', '4'))
+EVENTS_CHANNEL = "echo:jobs"
+
+# kind -> coroutine taking (user_id, payload) and returning the job result
+JobHandler = Callable[[int, Dict[str, Any]], Awaitable[Dict[str, Any]]]
+_handlers: Dict[str, JobHandler] = {}
+
+# Modules registering handlers; Celery workers import them before running jobs
+HANDLER_MODULES = ("routers.chatbot",)
+
+
+def job_handler(kind: str):
+    """Register the coroutine that runs jobs of `kind`"""
+    def register(handler: JobHandler) -> JobHandler:
+        _handlers[kind] = handler
+        return handler
+    return register
+
+
+def job_to_dict(job: EchoJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+
+def _create(user_id: int, kind: str, payload: Dict[str, Any]) -> str:
+    db = SessionLocal()
+    try:
+        job = EchoJob(user_id=user_id, kind=kind, status=QUEUED, payload=payload)
+        db.add(job)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def _start(job_id: str) -> Optional[Dict[str, Any]]:
+    """Mark a job running; None if it is gone or already taken.
+
+    A job still marked running after JOB_TIMEOUT lost its worker (a live
+    run would have timed out by then), so a redelivery takes it over.
+    """
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        # Conditional update, so a redelivered job only runs once
+        claimed = db.query(EchoJob).filter(
+            EchoJob.id == job_id,
+            or_(EchoJob.status == QUEUED,
+                and_(EchoJob.status == RUNNING,
+                     EchoJob.started_at < now - timedelta(seconds=JOB_TIMEOUT)))
+        ).update({EchoJob.status: RUNNING, EchoJob.started_at: now},
+                 synchronize_session=False)
+        db.commit()
+        if not claimed:
+            return None
+        job = db.query(EchoJob).filter(EchoJob.id == job_id).first()
+        return {"user_id": job.user_id, "kind": job.kind, "payload": job.payload or {}}
+    finally:
+        db.close()
+
+
+def _finish(job_id: str, status: str, result: Optional[Dict[str, Any]] = None,
+            error: Optional[str] = None) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        job = db.query(EchoJob).filter(EchoJob.id == job_id).first()
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        return job_to_dict(job)
+    finally:
+        db.close()
+
+
+def get_job(job_id: str, user_id: int) -> Optional[EchoJob]:
+    db = SessionLocal()
+    try:
+        return db.query(EchoJob).filter(
+            EchoJob.id == job_id, EchoJob.user_id == user_id).first()
+    finally:
+        db.close()
+
+
+async def run_job(job_id: str):
+    """Run a queued job and store its outcome"""
+    job = await asyncio.to_thread(_start, job_id)
+    if job is None:
+        return
+    user_id = job["user_id"]
+    await job_events.publish(user_id, {"id": job_id, "kind": job["kind"], "status": RUNNING})
+
+    handler = _handlers.get(job["kind"])
+    result, error = None, None
+    try:
+        if handler is None:
+            raise ValueError(f"No handler for ECHO job kind {job['kind']}")
+        result = await asyncio.wait_for(handler(user_id, job["payload"]), timeout=JOB_TIMEOUT)
+    except asyncio.TimeoutError:
+        error = f"ECHO did not finish within {JOB_TIMEOUT:.0f} seconds"
+    except asyncio.CancelledError:
+        # Shutting down; record it rather than leave the job running forever.
+        # Shielded so the update is not lost to a second cancellation
+        await asyncio.shield(_record_outcome(
+            job_id, user_id, None, "Interrupted before ECHO finished"))
+        raise
+    except Exception as e:
+        # HTTPException carries the user-facing message in `detail`
+        error = str(getattr(e, 'detail', None) or e)
+
+    await _record_outcome(job_id, user_id, result, error)
+
+
+async def _record_outcome(job_id: str, user_id: int, result: Optional[Dict[str, Any]],
+                          error: Optional[str]):
+    """Store how a job ended and tell its user"""
+    finished = await asyncio.to_thread(
+        _finish, job_id, FAILED if error else SUCCEEDED, result, error)
+    await job_events.publish(user_id, finished)
+
+
+class InProcessJobRunner:
+    """Runs jobs as tasks in this worker, a few at a time"""
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = workers
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, job_id: str):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        task = asyncio.get_running_loop().create_task(self._run(job_id))
+        # Keep a reference so the task is not garbage collected mid-run
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job_id: str):
+        async with self._semaphore:
+            try:
+                await run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error running ECHO job {job_id}: {e}")
+
+    async def shutdown(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": "inprocess", "workers": self.workers, "active": len(self._tasks)}
+
+
+class CeleryJobRunner:
+    """Sends jobs to Celery workers"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def submit(self, job_id: str):
+        # Talks to the broker; keep it off the event loop
+        await asyncio.to_thread(self.app.send_task, "echo.run_job", args=[job_id])
+
+    async def shutdown(self):
+        pass
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": "celery", "broker": self.app.conf.broker_url.split("@")[-1]}
+
+
+@lru_cache(maxsize=1)
+def get_job_runner():
+    if os.getenv('ECHO_JOB_BACKEND', 'inprocess').lower() == 'celery':
+        try:
+            from services.echo_worker import app
+            return CeleryJobRunner(app)
+        except ImportError:
+            print("⚠️  celery not installed. ECHO jobs run in-process.")
+    return InProcessJobRunner()
+
+
+async def submit_job(user_id: int, kind: str, payload: Dict[str, Any]) -> EchoJob:
+    """Store a job and hand it to the runner"""
+    job_id = await asyncio.to_thread(_create, user_id, kind, payload)
+    await get_job_runner().submit(job_id)
+    return await asyncio.to_thread(get_job, job_id, user_id)
+
+
+class JobEvents:
+    """Delivers job updates to the /ws connections of the job's user"""
+
+    def __init__(self):
+        # user id -> queues of that user's open sockets in this worker
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+        self._redis = None
+        self._redis_url = os.getenv('REDIS_URL')
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def deliver(self, user_id: int, event: Dict[str, Any]):
+        for queue in self._subscribers.get(user_id, ()):
+            queue.put_nowait(event)
+
+    def _publish_redis(self, message: str):
+        if self._redis is None:
+            import redis
+            self._redis = redis.Redis.from_url(
+                self._redis_url, socket_timeout=1, socket_connect_timeout=1)
+        self._redis.publish(EVENTS_CHANNEL, message)
+
+    async def publish(self, user_id: int, event: Dict[str, Any]):
+        """Send an update to every worker's sockets, or this worker's without Redis"""
+        if self._redis_url:
+            try:
+                await asyncio.to_thread(
+                    self._publish_redis, json.dumps({"user_id": user_id, "event": event}))
+                return
+            except Exception as e:
+                print(f"⚠️  Could not publish ECHO job update ({e}). Delivering locally.")
+        self.deliver(user_id, event)
+
+    async def listen(self):
+        """Relay updates published by any process to this worker's sockets"""
+        if not self._redis_url:
+            return
+        try:
+            import redis.asyncio as aioredis
+        except ImportError:
+            return
+        while True:
+            try:
+                client = aioredis.Redis.from_url(self._redis_url)
+                pubsub = client.pubsub()
+                await pubsub.subscribe(EVENTS_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    update = json.loads(message["data"])
+                    self.deliver(update["user_id"], update["event"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️  ECHO job updates unavailable ({e}), retrying")
+                await asyncio.sleep(5)
+
+
+job_events = JobEvents()
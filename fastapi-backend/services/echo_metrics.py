@@ -0,0 +1,247 @@
+"""
+Latency instrumentation for ECHO calls.
+
+Each call to the service runs inside a trace that collects how long every
+stage took: admission queue wait, course context build (S3 list, fetch and
+extract), model time-to-first-token and total time, retry backoff, plus the
+retry count and circuit breaker state. Stages are timed with `timed()` from
+anywhere below the call, including worker threads started with
+asyncio.to_thread, which copy the current context.
+
+Finished traces feed in-process histograms, exported in the Prometheus text
+format by /chatbot/metrics, and are attached to the chat message metadata.
+"""
+
+import bisect
+import contextvars
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Upper bounds in seconds, from cache hits to slow multi-file requests
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+@dataclass
+class CallTrace:
+    kind: str
+    started: float = field(default_factory=time.monotonic)
+    # Seconds per stage, summed if a stage runs more than once
+    stages: Dict[str, float] = field(default_factory=dict)
+    counts: Dict[str, int] = field(default_factory=dict)
+    retries: int = 0
+    breaker_state: Optional[str] = None
+    # Model tier the call was routed to, and the tokens it used
+    tier: Optional[str] = None
+    tokens: int = 0
+    # "won" or "lost" if a hedged attempt was sent
+    hedge: Optional[str] = None
+    outcome: str = "success"
+    total: float = 0.0
+
+    def add(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self.counts[stage] = self.counts.get(stage, 0) + 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_ms": round(self.total * 1000, 1),
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+            "stage_counts": dict(self.counts),
+            "retries": self.retries,
+            "breaker_state": self.breaker_state,
+            "tier": self.tier,
+            "hedge": self.hedge
+        }
+
+
+_current_trace: contextvars.ContextVar[Optional[CallTrace]] = contextvars.ContextVar(
+    "echo_current_trace", default=None)
+
+
+def current_trace() -> Optional[CallTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Add the time spent in the block to the current trace, if any"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        trace.add(stage, time.monotonic() - started)
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-quantile"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class EchoMetrics:
+    """Histograms and counters fed by finished call traces"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (metric, labels) -> histogram
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+        self._counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {}
+
+    def observe(self, metric: str, value: float, **labels: str):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, metric: str, amount: float = 1, **labels: str):
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def record(self, trace: CallTrace):
+        self.observe("echo_call_seconds", trace.total,
+                     kind=trace.kind, outcome=trace.outcome)
+        for stage, seconds in trace.stages.items():
+            self.observe("echo_stage_seconds", seconds,
+                         kind=trace.kind, stage=stage)
+        self.inc("echo_calls_total", kind=trace.kind, outcome=trace.outcome)
+        if trace.retries:
+            self.inc("echo_retries_total", trace.retries, kind=trace.kind)
+        if trace.tier:
+            # Per-tier latency and spend, for tuning the routing thresholds
+            self.observe("echo_tier_seconds", trace.total,
+                         kind=trace.kind, tier=trace.tier)
+            self.inc("echo_tier_calls_total", kind=trace.kind, tier=trace.tier)
+            self.inc("echo_tier_tokens_total", trace.tokens,
+                     kind=trace.kind, tier=trace.tier)
+
+    @contextmanager
+    def trace(self, kind: str) -> Iterator[CallTrace]:
+        """Trace one ECHO call; stages timed inside are attributed to it"""
+        trace = CallTrace(kind)
+        token = _current_trace.set(trace)
+        try:
+            yield trace
+        except BaseException:
+            trace.outcome = "error"
+            raise
+        finally:
+            _current_trace.reset(token)
+            trace.total = time.monotonic() - trace.started
+            self.record(trace)
+
+    @staticmethod
+    def _labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = labels + extra
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+    def render_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        declared = set()
+        for (metric, labels), histogram in histograms:
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} histogram")
+                declared.add(metric)
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{self._labels(labels, (('le', le),))} {cumulative}")
+            lines.append(f"{metric}_sum{self._labels(labels)} {histogram.sum:.6f}")
+            lines.append(f"{metric}_count{self._labels(labels)} {histogram.count}")
+        for (metric, labels), value in counters:
+            if metric not in declared:
+                lines.append(f"# TYPE {metric} counter")
+                declared.add(metric)
+            lines.append(f"{metric}{self._labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Count, mean and approximate p50/p95/p99 per histogram"""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+        result = {}
+        for (metric, labels), histogram in histograms:
+            name = metric + self._labels(labels)
+            result[name] = {
+                "count": histogram.count,
+                "mean_ms": round(histogram.sum / histogram.count * 1000, 1) if histogram.count else None,
+                "p50_ms_le": _ms(histogram.quantile(0.5)),
+                "p95_ms_le": _ms(histogram.quantile(0.95)),
+                "p99_ms_le": _ms(histogram.quantile(0.99))
+            }
+        return result
+
+
+def _outcome(result: Any) -> str:
+    if result is None:
+        return "failed"
+    if isinstance(result, dict):
+        if (result.get("cache") or {}).get("hit"):
+            return "cache_hit"
+        return "success" if result.get("success", True) else "failed"
+    return "success"
+
+
+def traced(kind: str, attach: bool = False):
+    """Run an async service call inside a trace of the given kind.
+
+    With `attach`, the call's timings are added to its result dict.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with echo_metrics.trace(kind) as trace:
+                result = await func(*args, **kwargs)
+                trace.outcome = _outcome(result)
+            if attach and isinstance(result, dict):
+                result["timings"] = trace.to_dict()
+            return result
+        return wrapper
+    return decorator
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    if seconds is None or seconds == float("inf"):
+        return seconds
+    return round(seconds * 1000, 1)
+
+
+echo_metrics = EchoMetrics()
@@ -0,0 +1,40 @@
+"""
+Celery worker for ECHO background jobs.
+
+Used when ECHO_JOB_BACKEND=celery. The broker is ECHO_JOB_BROKER_URL, or
+REDIS_URL if that is not set. Start workers from the fastapi-backend
+directory:
+
+    celery -A services.echo_worker worker --concurrency 4
+"""
+
+import asyncio
+import importlib
+import os
+
+from celery import Celery
+
+from services.echo_jobs import HANDLER_MODULES, run_job
+
+BROKER_URL = os.getenv('ECHO_JOB_BROKER_URL') or os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+app = Celery("echo", broker=BROKER_URL)
+# A job lost with its worker is redelivered; run_job skips jobs already taken
+# unless they have been running for longer than ECHO_JOB_TIMEOUT
+app.conf.task_acks_late = True
+app.conf.worker_prefetch_multiplier = 1
+
+# The ECHO service keeps asyncio primitives bound to one loop, so every job in
+# this worker process runs on the same loop
+_loop = None
+
+
+@app.task(name="echo.run_job")
+def run_echo_job(job_id: str):
+    global _loop
+    if _loop is None:
+        for module in HANDLER_MODULES:
+            importlib.import_module(module)
+        _loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_loop)
+    _loop.run_until_complete(run_job(job_id))
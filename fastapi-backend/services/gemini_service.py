@@ -1,111 +1,142 @@
-import google.generativeai as genai
-import boto3
+import functools
+import hashlib
 import json
 import os
-from typing import List, Dict, Any, Optional
-from botocore.exceptions import ClientError, NoCredentialsError
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from dotenv import load_dotenv
-from enhanced_document_processor import EnhancedDocumentProcessor
-from google.api_core import exceptions as google_exceptions
+from enhanced_document_processor import EnhancedDocumentProcessor, extract_local_file
 import time
 import random
 import asyncio
-from datetime import datetime, timedelta
-from collections import deque
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from datetime import datetime
+from services.rate_limiter import TokenBucketRateLimiter, retry_after_seconds
+from services.admission_queue import AdmissionQueue, AdmissionRejected, Priority
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+from services.response_cache import ResponseCache
+from services.prompt_budget import PromptAssembler, BudgetReport, estimate_tokens
+from services.llm_backends import LLMResponse, create_backend
+from services.prefix_cache import PrefixCache, PrefixHandle
+from services.image_preprocessor import ImagePreprocessor
+from services.usage_ledger import UsageQuota, UsageRecord, QuotaStatus, record_usage
+from services.echo_metrics import current_trace, timed, traced
+from services.model_router import ModelRouter, RouteDecision, FAST, STRONG
+from services.request_hedger import RequestHedger
 
 # Load environment variables
 load_dotenv()
 
-# Rate limiting configuration
-
-
-class RateLimiter:
-    def __init__(self, max_requests: int = 10, window_seconds: int = 60):
-        self.max_requests = max_requests
-        self.window_seconds = window_seconds
-        self.requests = deque()
-
-    def can_make_request(self) -> bool:
-        now = datetime.now()
-        # Remove old requests outside the window
-        while self.requests and (now - self.requests[0]) > timedelta(seconds=self.window_seconds):
-            self.requests.popleft()
-
-        if len(self.requests) < self.max_requests:
-            self.requests.append(now)
-            return True
-        return False
-
-    def get_wait_time(self) -> float:
-        if not self.requests:
-            return 0
-        oldest_request = self.requests[0]
-        return max(0, self.window_seconds - (datetime.now() - oldest_request).total_seconds())
-
-
 class GeminiService:
     def __init__(self):
         # Initialize Gemini AI with environment variable
         self.api_key = os.getenv('GEMINI_API_KEY')
-        # Initialize rate limiter
-        self.rate_limiter = RateLimiter(
-            max_requests=int(os.getenv('ECHO_RATE_LIMIT', '10')),
-            window_seconds=int(os.getenv('ECHO_RATE_WINDOW', '60'))
+        # Initialize rate limiter (global, per-course and per-user buckets)
+        self.rate_limiter = TokenBucketRateLimiter.from_env()
+        # Requests wait here for a token instead of being rejected outright
+        self.admission_queue = AdmissionQueue(
+            self.rate_limiter,
+            max_depth=int(os.getenv('ECHO_QUEUE_MAX_DEPTH', '100'))
         )
+        self.queue_deadline = float(os.getenv('ECHO_QUEUE_DEADLINE', '10'))
 
         # Connection and timeout configuration
         self.request_timeout = int(os.getenv('ECHO_REQUEST_TIMEOUT', '30'))
         self.max_retries = int(os.getenv('ECHO_MAX_RETRIES', '3'))
+        if self.max_retries < 1:
+            # Counts attempts, the first one included
+            raise ValueError("ECHO_MAX_RETRIES must be at least 1")
         self.retry_delay_base = float(
             os.getenv('ECHO_RETRY_DELAY_BASE', '1.0'))
 
-        if not self.api_key:
-            print("Warning: GEMINI_API_KEY environment variable not set")
-            self.model = None
-        else:
-            genai.configure(api_key=self.api_key)
+        # Bound in-flight model calls so bursts queue on the event loop
+        # instead of piling up provider connections
+        self.max_concurrency = int(os.getenv('ECHO_MAX_CONCURRENCY', '32'))
+        self.generation_semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        # Second attempt for calls slower than recent ones (ECHO_HEDGE_ENABLED)
+        self.hedger = RequestHedger.from_env()
+
+        # Fail fast while the provider is down instead of retrying into it
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=int(
+                os.getenv('ECHO_BREAKER_FAILURE_THRESHOLD', '5')),
+            recovery_timeout=float(
+                os.getenv('ECHO_BREAKER_RECOVERY_TIMEOUT', '30')),
+            half_open_max_calls=int(
+                os.getenv('ECHO_BREAKER_HALF_OPEN_CALLS', '1'))
+        )
 
-            try:
-                # Use environment variable for model selection
-                model_name = os.getenv('ECHO_MODEL', 'gemini-1.5-flash')
-                self.model = genai.GenerativeModel(model_name)
-                print(f"✅ ECHO initialized with {model_name}")
-            except Exception as e:
-                print(f"Warning: Could not initialize Gemini model: {e}")
-                # Fallback to basic model
-                try:
-                    self.model = genai.GenerativeModel('gemini-1.5-flash')
-                    print("✅ ECHO initialized with fallback model")
-                except Exception as fallback_error:
-                    print(
-                        f"Warning: Could not initialize fallback model: {fallback_error}")
-                    self.model = None
-
-        # Initialize S3 client
-        use_iam_role = os.getenv('USE_IAM_ROLE', 'false').lower() == 'true'
-
-        if use_iam_role:
-            # Use IAM role (no credentials needed)
-            self.s3_client = boto3.client(
-                's3',
-                region_name=os.getenv('AWS_REGION', 'us-east-1')
-            )
-        else:
-            # Use access keys
-            self.s3_client = boto3.client(
-                's3',
-                region_name=os.getenv('AWS_REGION', 'us-east-1'),
-                aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-                aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-            )
+        # Input token budget split across system prompt, context, history and message
+        self.prompt_assembler = PromptAssembler(
+            budget=int(os.getenv('ECHO_PROMPT_TOKEN_BUDGET', '16000')),
+            context_share=float(os.getenv('ECHO_CONTEXT_BUDGET_SHARE', '0.6'))
+        )
+
+        # Length cap for the rolling summary of long sessions
+        self.summary_max_words = int(
+            os.getenv('ECHO_SUMMARY_MAX_WORDS', '250'))
+
+        # Answers shared across students asking the same question in a course
+        self.cache_enabled = os.getenv(
+            'ECHO_CACHE_ENABLED', 'true').lower() == 'true'
+        self.response_cache = ResponseCache(
+            max_entries=int(os.getenv('ECHO_CACHE_MAX_ENTRIES', '1000')),
+            ttl_seconds=float(os.getenv('ECHO_CACHE_TTL', '3600')),
+            similarity_enabled=os.getenv(
+                'ECHO_CACHE_SIMILARITY_ENABLED', 'false').lower() == 'true',
+            similarity_threshold=float(
+                os.getenv('ECHO_CACHE_SIMILARITY_THRESHOLD', '0.85'))
+        )
+
+        # Background API health probe; request paths only read the cached result
+        self.health_probe_interval = float(
+            os.getenv('ECHO_HEALTH_PROBE_INTERVAL', '60'))
+        self.health_probe_jitter = float(
+            os.getenv('ECHO_HEALTH_PROBE_JITTER', '10'))
+
+        # Gemini, or the local stub for load tests (ECHO_BACKEND)
+        self.backend = create_backend()
+        self.model_name = self.backend.model_name if self.backend else os.getenv(
+            'ECHO_MODEL', 'gemini-1.5-flash')
+        # Fast and strong model tiers, picked per request (ECHO_MODEL_ROUTING)
+        self.model_router = ModelRouter.from_env(self.backend)
+
+        # System prompt + course context registered once with the provider
+        self.prefix_cache = PrefixCache(
+            self.backend,
+            enabled=os.getenv('ECHO_PREFIX_CACHE_ENABLED',
+                              'true').lower() == 'true',
+            ttl_seconds=float(os.getenv('ECHO_PREFIX_CACHE_TTL', '3600')),
+            min_tokens=int(os.getenv('ECHO_PREFIX_CACHE_MIN_TOKENS', '32768')),
+            max_tokens=int(os.getenv('ECHO_PREFIX_CACHE_MAX_TOKENS', '131072')),
+            max_entries=int(os.getenv('ECHO_PREFIX_CACHE_MAX_ENTRIES', '100'))
+        )
+
+        # Uploaded images are shrunk and re-encoded before they are sent
+        self.image_preprocessor = ImagePreprocessor.from_env()
+        # Uploaded documents are parsed in a process pool, created on first use
+        self.extract_workers = int(os.getenv('ECHO_EXTRACT_WORKERS', '2'))
+        self._extract_pool: Optional[ProcessPoolExecutor] = None
+
+        # Daily token quotas, enforced from the hourly usage rollups
+        self.usage_quota = UsageQuota.from_env()
+        # Ledger writes in flight, referenced so they are not garbage collected
+        self._usage_writes = set()
+
+        # Nothing is known about the API until the first probe completes
+        self._set_health("unknown")
 
-        # S3 bucket configuration
+        # S3 bucket configuration; the client and the document processor
+        # are created on first use, boto3 is slow to import
         self.bucket_name = os.getenv(
             'S3_BUCKET_NAME', 'visionware-lecture-courses')
-
-        # Initialize enhanced document processor
-        self.document_processor = EnhancedDocumentProcessor(
-            self.s3_client, self.bucket_name)
+        self._s3_client = None
+        self._document_processor: Optional[EnhancedDocumentProcessor] = None
+        self._lazy_lock = threading.Lock()
 
         # ECHO configuration from environment
         self.max_tokens = int(os.getenv('ECHO_MAX_TOKENS', '2048'))
@@ -185,6 +216,40 @@ As ECHO, your role is to process, understand, and reflect back knowledge to help
 - Clean and concise communication style
 """
 
+    @property
+    def s3_client(self):
+        """S3 client, created on first use"""
+        if self._s3_client is None:
+            with self._lazy_lock:
+                if self._s3_client is None:
+                    import boto3
+                    use_iam_role = os.getenv(
+                        'USE_IAM_ROLE', 'false').lower() == 'true'
+
+                    if use_iam_role:
+                        # Use IAM role (no credentials needed)
+                        self._s3_client = boto3.client(
+                            's3',
+                            region_name=os.getenv('AWS_REGION', 'us-east-1')
+                        )
+                    else:
+                        # Use access keys
+                        self._s3_client = boto3.client(
+                            's3',
+                            region_name=os.getenv('AWS_REGION', 'us-east-1'),
+                            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
+                        )
+        return self._s3_client
+
+    @property
+    def document_processor(self) -> EnhancedDocumentProcessor:
+        """Enhanced document processor reading from the course bucket"""
+        if self._document_processor is None:
+            self._document_processor = EnhancedDocumentProcessor(
+                self.s3_client, self.bucket_name)
+        return self._document_processor
+
     def get_s3_course_content(self, course_id: int) -> List[Dict[str, Any]]:
         """Retrieve course content from S3 bucket"""
         if not self.course_content_enabled:
@@ -193,10 +258,11 @@ As ECHO, your role is to process, understand, and reflect back knowledge to help
         try:
             # List objects in the course folder
             prefix = f"courses/{course_id}/"
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=prefix
-            )
+            with timed("s3_list"):
+                response = self.s3_client.list_objects_v2(
+                    Bucket=self.bucket_name,
+                    Prefix=prefix
+                )
 
             course_content = []
 
@@ -227,6 +293,29 @@ As ECHO, your role is to process, understand, and reflect back knowledge to help
             # Return empty list instead of raising exception
             return []
 
+    def get_s3_content_version(self, course_id: int) -> str:
+        """Fingerprint of the course's S3 files from the listing alone.
+
+        Keys, sizes and ETags change whenever a file is added, replaced or
+        removed, so nothing has to be downloaded to tell whether content changed.
+        """
+        if not self.course_content_enabled:
+            return "disabled"
+        try:
+            digest = hashlib.sha256()
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=self.bucket_name, Prefix=f"courses/{course_id}/"):
+                for obj in page.get('Contents', []):
+                    if obj['Key'].endswith('/'):
+                        continue
+                    digest.update(
+                        f"{obj['Key']}:{obj.get('Size', 0)}:{obj.get('ETag', '')}\n".encode("utf-8"))
+            return digest.hexdigest()[:32]
+        except Exception as e:
+            print(
+                f"Error listing S3 content for course {course_id}: {str(e)}")
+            return "unavailable"
+
     def _extract_file_content(self, key: str, content_type: str) -> Optional[str]:
         """Extract text content from different file types using enhanced processor"""
         try:
@@ -253,8 +342,12 @@ As ECHO, your role is to process, understand, and reflect back knowledge to help
 
     def get_course_context(self, course_id: int, db_session=None) -> str:
         """Get comprehensive course context for ECHO from both S3 and database"""
+        return self._build_course_context(course_id, db_session)[0]
+
+    def _build_course_context(self, course_id: int, db_session=None) -> Tuple[str, int]:
+        """Build the course context text and return it with the number of S3 files used"""
         if not self.course_content_enabled:
-            return "Course content integration is disabled."
+            return "Course content integration is disabled.", 0
 
         context_parts = [f"Course ID: {course_id}"]
 
@@ -303,175 +396,474 @@ As ECHO, your role is to process, understand, and reflect back knowledge to help
         total_content = s3_content_count + db_content_count
 
         if total_content == 0:
-            return f"No course content found for Course ID: {course_id}. This course may not have any uploaded materials yet, or the content may be stored in a different location. In a local development environment, course content from S3 may not be available."
+            return f"No course content found for Course ID: {course_id}. This course may not have any uploaded materials yet, or the content may be stored in a different location. In a local development environment, course content from S3 may not be available.", 0
 
         context_parts.insert(
             1, f"Total Available Content Files: {total_content}")
-        return "\n".join(context_parts)
-
-    def chat_with_context(self, message: str, course_id: Optional[int] = None, conversation_history: List[Dict] = None, course_info: Optional[Dict] = None, db_session=None) -> Dict[str, Any]:
-        """Chat with ECHO using course context"""
-        # Check rate limiting
-        if not self.rate_limiter.can_make_request():
-            wait_time = self.rate_limiter.get_wait_time()
-            return {
-                "response": f"I apologize, but the system is currently experiencing high demand. Please wait {int(wait_time)} seconds and try again.",
-                "success": False,
-                "error": "Rate limit exceeded",
-                "course_content_used": False,
-                "content_files_count": 0,
-                "retry_after": int(wait_time)
-            }
-
-        for attempt in range(self.max_retries):
-            try:
-                # Check if model is available
-                if not self.model:
-                    return {
-                        "response": "I apologize, but the AI service is currently unavailable. Please try again later or contact support.",
-                        "success": False,
-                        "error": "Gemini model not initialized",
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
-
-                # Build the conversation context
-                conversation = []
-
-                # Add system prompt
-                conversation.append({
-                    "role": "user",
-                    "parts": [self.system_prompt]
-                })
-
-                # Add course context if available
-                if course_id and self.course_content_enabled:
-                    course_context = self.get_course_context(
-                        course_id, db_session)
-
-                    # Add course info if available
-                    if course_info:
-                        course_info_text = f"""
+        return "\n".join(context_parts), s3_content_count
+
+    def get_course_context_version(self, course_id: Optional[int], db_session=None) -> str:
+        """Cheap fingerprint of the course documents that feed the context.
+
+        Any upload, edit or delete of a course document changes it, in every
+        worker, without reading S3. It assumes course files only change through
+        the document endpoints, which keep CourseDocument rows in step with S3;
+        an object replaced in S3 directly is only picked up once cached answers
+        expire (ECHO_CACHE_TTL). get_s3_content_version() reads the
+        listing instead, where that cost is acceptable.
+        """
+        if not course_id or not self.course_content_enabled:
+            return "none"
+        if db_session is None:
+            return "unknown"
+        from sqlalchemy import func
+        from models import CourseDocument
+        count, max_id, last_updated = db_session.query(
+            func.count(CourseDocument.id),
+            func.max(CourseDocument.id),
+            func.max(CourseDocument.updated_at)
+        ).filter(CourseDocument.course_id == course_id).one()
+        return f"{count}:{max_id or 0}:{last_updated.isoformat() if last_updated else '-'}"
+
+    def _course_context(self, course_id: Optional[int], course_info: Optional[Dict] = None, db_session=None) -> Tuple[Optional[str], int]:
+        """Course context text and the number of course files it draws on.
+
+        This touches S3 and the database, so async callers run it in a
+        worker thread.
+        """
+        if not course_id or not self.course_content_enabled:
+            return None, 0
+        course_context, content_files_count = self._build_course_context(
+            course_id, db_session)
+
+        # Add course info if available
+        if course_info:
+            course_info_text = f"""
 Course Information:
 - Title: {course_info.get('title', 'Unknown')}
 - Description: {course_info.get('description', 'No description available')}
 - Credits: {course_info.get('credits', 'Unknown')}
 """
-                        course_context = course_info_text + "\n" + course_context
-
-                    conversation.append({
-                        "role": "user",
-                        "parts": [f"Course Context:\n{course_context}"]
-                    })
-
-                # Add conversation history (limited to max_history)
-                if conversation_history:
-                    # Limit to last max_history messages
-                    for msg in conversation_history[-self.max_history:]:
-                        conversation.append({
-                            "role": msg.get("role", "user"),
-                            "parts": [msg.get("content", "")]
-                        })
-
-                # Add current message
-                conversation.append({
-                    "role": "user",
-                    "parts": [message]
-                })
-
-                # Generate response with ECHO configuration
-                generation_config = {
-                    'temperature': self.temperature,
-                    'max_output_tokens': self.max_tokens,
-                }
-
-                response = self.model.generate_content(
-                    conversation,
-                    generation_config=generation_config
-                )
-
-                # Extract course content info
-                course_content_available = course_id is not None and self.course_content_enabled
-                course_content_files = self.get_s3_course_content(
-                    course_id) if course_id and self.course_content_enabled else []
-                course_content_used = len(course_content_files) > 0
-                content_files_count = len(course_content_files)
+            course_context = course_info_text + "\n" + course_context
+        return course_context, content_files_count
+
+    def _route(self, tier: Optional[str] = None, **signals) -> RouteDecision:
+        """Pick the model tier and note it on the current trace"""
+        route = self.model_router.route(tier=tier, **signals)
+        trace = current_trace()
+        if trace is not None:
+            trace.tier = route.tier
+        return route
+
+    async def _build_conversation(self, message: str, course_id: Optional[int] = None, conversation_history: List[Dict] = None, course_info: Optional[Dict] = None, db_session=None, message_parts: Optional[List[Any]] = None, conversation_summary: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int, BudgetReport, Optional[PrefixHandle], RouteDecision]:
+        """Assemble the model conversation within the prompt token budget.
+
+        Returns the conversation, the number of course files used, the budget
+        report, the cached prompt prefix the conversation continues, if any,
+        and the model tier it is routed to.
+        """
+        # Context building reads S3 and the database, keep it off the event loop
+        with timed("context_build"):
+            course_context, content_files_count = await asyncio.to_thread(
+                self._course_context, course_id, course_info, db_session)
+
+        # Limit to last max_history messages, the budget may drop more
+        history = (conversation_history or [])[-self.max_history:]
+
+        context_tokens = estimate_tokens(course_context) if course_context else 0
+        route = self._route(
+            message_tokens=estimate_tokens(message),
+            context_tokens=context_tokens,
+            history_messages=len(history),
+            attachments=len(message_parts or [message]) - 1)
+
+        # A cached context is sent whole, however much of the prompt budget
+        # it would take; the provider minimum means only large ones qualify
+        prefix = None
+        if course_context:
+            with timed("prefix_cache"):
+                prefix = await self.prefix_cache.get_or_create(
+                    course_id, self.system_prompt,
+                    self.prompt_assembler.context_label + course_context,
+                    route.backend)
+
+        conversation, report = self.prompt_assembler.assemble(
+            self.system_prompt, course_context, history,
+            message_parts or [message], summary=conversation_summary,
+            cached_prefix=prefix is not None)
+        return conversation, content_files_count, report, prefix, route
+
+    def _token_counts(self, response: Any, prompt_estimate: int = 0) -> Tuple[int, int]:
+        """Prompt and response tokens as billed by the provider, or our estimates.
+
+        google-generativeai 0.3.2 reports no usage at all, so with the pinned
+        SDK the estimates are what the ledger and quotas see.
+        """
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', None) or prompt_estimate
+        response_tokens = getattr(usage, 'candidates_token_count', None)
+        if not response_tokens and response is not None:
+            response_tokens = estimate_tokens(getattr(response, 'text', None) or "")
+        return prompt_tokens, response_tokens or 0
+
+    def _prompt_tokens(self, response: Any, budget: BudgetReport) -> int:
+        """Prompt token count as billed by the provider, or our estimate"""
+        return self._token_counts(response, budget.total_tokens)[0]
+
+    def _is_transient_error(self, error: Exception) -> bool:
+        """Whether a provider error is worth retrying with backoff"""
+        from google.api_core import exceptions as google_exceptions
+        if isinstance(error, (google_exceptions.ServiceUnavailable, google_exceptions.RetryError, google_exceptions.DeadlineExceeded)):
+            return True
+        error_message = str(error)
+        return "timeout" in error_message.lower() or "503" in error_message
+
+    def _retry_delay(self, attempt: int) -> float:
+        """Exponential backoff with jitter"""
+        return self.retry_delay_base * (2 ** attempt) + random.uniform(0, 1)
+
+    async def _stream_response(self, contents: Any, backend=None, on_first_output=None, on_text=None, **kwargs) -> LLMResponse:
+        """Stream one response, timing the first token, and join the chunks.
+
+        `on_text` is called with each chunk's text as it arrives.
+        """
+        trace = current_trace()
+        started = time.monotonic()
+        parts = []
+        usage = None
+        async for chunk in (backend or self.backend).stream(contents, **kwargs):
+            if not parts:
+                if trace is not None:
+                    trace.add("model_ttft", time.monotonic() - started)
+                if on_first_output is not None:
+                    on_first_output()
+            parts.append(chunk.text)
+            if on_text is not None:
+                on_text(chunk.text)
+            # Usage comes on the last chunk, if the SDK reports it at all
+            usage = getattr(chunk, 'usage_metadata', None) or usage
+        return LLMResponse("".join(parts), usage)
+
+    async def _may_hedge(self) -> bool:
+        """Whether a hedged attempt fits now; takes a global rate-limit token if so.
+
+        Hedges never jump ahead of queued requests, wait for a concurrency
+        slot or probe a recovering provider.
+        """
+        return (self.circuit_breaker.state == CircuitState.CLOSED
+                and self.admission_queue.depth == 0
+                and not self.generation_semaphore.locked()
+                and (await self.rate_limiter.acquire()).allowed)
+
+    async def _hedged_response(self, contents: Any, backend=None, on_text=None, **kwargs) -> LLMResponse:
+        """One model attempt, hedged with a second one if it is slow.
+
+        Text already streamed to the client cannot be taken back, so calls
+        with `on_text` are never hedged.
+        """
+        if on_text is not None:
+            return await self._stream_response(contents, backend, on_text=on_text, **kwargs)
+
+        async def attempt(on_first_output):
+            return await self._stream_response(
+                contents, backend, on_first_output=on_first_output, **kwargs)
+
+        async def hedge_attempt(on_first_output):
+            # The primary already holds a slot; the hedge needs its own
+            async with self.generation_semaphore:
+                return await attempt(on_first_output)
+
+        return await self.hedger.run(
+            (backend or self.backend).model_name, attempt, hedge_attempt, self._may_hedge)
+
+    async def _generate_with_retries(self, contents: Any, backend=None, on_text=None, **kwargs) -> Any:
+        """Call the model without blocking the event loop.
+
+        Each attempt holds a concurrency slot only while the request is in flight;
+        backoff sleeps release it. Cancellation (client disconnect or timeout)
+        propagates out of both the call and the sleep. Every attempt goes
+        through the circuit breaker, so an outage stops the retry loop early.
+        Attempts, breaker state and model timings go into the current trace.
+        `backend` is the routed model tier, the default backend if not given.
+        `on_text(text, attempt)` receives streamed text; a new attempt number
+        means the text of the failed attempt should be discarded.
+        """
+        trace = current_trace()
+        for attempt in range(self.max_retries):
+            if trace is not None:
+                trace.retries = attempt
+                trace.breaker_state = self.circuit_breaker.state.value
+            self.circuit_breaker.before_call()
+            try:
+                with timed("concurrency_wait"):
+                    await self.generation_semaphore.acquire()
+                try:
+                    stream_to = None
+                    if on_text is not None:
+                        stream_to = functools.partial(on_text, attempt=attempt)
+                    with timed("model_total"):
+                        response = await self._hedged_response(
+                            contents, backend, on_text=stream_to, **kwargs)
+                finally:
+                    self.generation_semaphore.release()
+            except asyncio.CancelledError:
+                self.circuit_breaker.release()
+                raise
+            except Exception as e:
+                if not self._is_transient_error(e):
+                    # The provider answered, the request itself was bad
+                    self.circuit_breaker.record_success()
+                    raise
+                self.circuit_breaker.record_failure()
+                if attempt < self.max_retries - 1:
+                    with timed("retry_backoff"):
+                        await asyncio.sleep(self._retry_delay(attempt))
+                    continue
+                raise
+            self.circuit_breaker.record_success()
+            return response
+
+    def invalidate_course(self, course_id: int):
+        """Forget cached answers and prompt prefixes after course documents change"""
+        self.response_cache.invalidate_course(course_id)
+        self.prefix_cache.invalidate_course(course_id)
+
+    def _discard_stale_prefix(self, prefix: Optional[PrefixHandle], error: Exception):
+        """Forget a cached prefix the provider no longer has"""
+        from google.api_core import exceptions as google_exceptions
+        if prefix is not None and isinstance(error, google_exceptions.NotFound):
+            self.prefix_cache.discard(prefix.key)
+
+    def _error_response(self, response: str, error: str, **extra) -> Dict[str, Any]:
+        """Build a failed ECHO response payload"""
+        result = {
+            "response": response,
+            "success": False,
+            "error": error,
+            "course_content_used": False,
+            "content_files_count": 0
+        }
+        result.update(extra)
+        return result
+
+    def _provider_error_response(self, error: Exception, with_files: bool = False) -> Dict[str, Any]:
+        """Map a provider exception to the user-facing failure payload"""
+        if isinstance(error, CircuitOpenError):
+            return self._circuit_open_response(error.retry_after)
+        from google.api_core import exceptions as google_exceptions
+        if isinstance(error, google_exceptions.ServiceUnavailable):
+            return self._error_response(
+                "I apologize, but Google's AI service is currently experiencing high demand and is temporarily unavailable. This is a temporary issue on Google's servers. Please try again in a few minutes.",
+                "Google API service unavailable")
+        if isinstance(error, (google_exceptions.RetryError, google_exceptions.DeadlineExceeded)):
+            return self._error_response(
+                "I apologize, but the request to Google's AI service timed out. This can happen during periods of high demand. Please try again in a moment.",
+                "Google API timeout")
+        if isinstance(error, google_exceptions.ResourceExhausted):
+            return self._error_response(
+                "I apologize, but the API quota has been exceeded. Please try again later or contact support if this issue persists.",
+                "API quota exceeded")
+
+        error_message = str(error)
+        if "timeout" in error_message.lower() or "503" in error_message:
+            user_message = "I apologize, but Google's AI service is currently experiencing issues. Please try again in a few minutes."
+        elif with_files:
+            user_message = f"I apologize, but I encountered an error while processing your request with files: {error_message}. Please try again or contact support if the issue persists."
+        else:
+            user_message = f"I apologize, but I encountered an error while processing your request: {error_message}. Please try again or contact support if the issue persists."
+        return self._error_response(user_message, error_message)
 
+    def _rate_limited_response(self, rejected: AdmissionRejected) -> Dict[str, Any]:
+        wait_time = retry_after_seconds(rejected.retry_after)
+        if rejected.scope == "user":
+            response = f"You're sending messages faster than ECHO can keep up with. Please wait {wait_time} seconds and try again."
+        else:
+            response = f"I apologize, but the system is currently experiencing high demand. Please wait {wait_time} seconds and try again."
+        return self._error_response(
+            response,
+            "Rate limit exceeded",
+            retry_after=rejected.retry_after,
+            rate_limit_scope=rejected.scope,
+            queue=self.admission_queue.describe())
+
+    def _circuit_open_response(self, retry_after: float) -> Dict[str, Any]:
+        return self._error_response(
+            "I apologize, but Google's AI service is currently unavailable. ECHO will retry automatically, please try again in a minute.",
+            "Circuit breaker open",
+            retry_after=round(retry_after, 1),
+            circuit_state=self.circuit_breaker.state.value)
+
+    def _quota_exceeded_response(self, quota: QuotaStatus) -> Dict[str, Any]:
+        if quota.scope == "course":
+            response = "This course has used up today's ECHO allowance. Please try again tomorrow or contact your instructor."
+        else:
+            response = "You've used up today's ECHO allowance. Please try again tomorrow."
+        return self._error_response(
+            response,
+            "Usage quota exceeded",
+            retry_after=quota.resets_in,
+            quota=quota.to_dict())
+
+    async def _check_quota(self, user_id: Optional[int], course_id: Optional[int]) -> QuotaStatus:
+        if not self.usage_quota.enabled or not (user_id or course_id):
+            return QuotaStatus("ok")
+        try:
+            return await asyncio.to_thread(self.usage_quota.check, user_id, course_id)
+        except Exception as e:
+            # Never block chats because the ledger is unreadable
+            print(f"Error checking ECHO usage quota: {e}")
+            return QuotaStatus("ok")
+
+    def _record_usage(self, kind: str, started: float, response: Any = None,
+                      user_id: Optional[int] = None, course_id: Optional[int] = None,
+                      cache_hit: bool = False, success: bool = True,
+                      model: Optional[str] = None, prompt_estimate: int = 0):
+        """Write a usage ledger entry in the background.
+
+        `prompt_estimate` is used when the provider does not count the prompt.
+        """
+        prompt_tokens, response_tokens = (
+            self._token_counts(response, prompt_estimate) if response is not None else (0, 0))
+        record = UsageRecord(
+            model=model or self.model_name,
+            kind=kind,
+            user_id=user_id,
+            course_id=course_id,
+            prompt_tokens=prompt_tokens,
+            response_tokens=response_tokens,
+            latency_ms=round((time.monotonic() - started) * 1000, 1),
+            cache_hit=cache_hit,
+            success=success
+        )
+        self.usage_quota.add(record)
+        trace = current_trace()
+        if trace is not None:
+            trace.tokens += record.total_tokens
+        task = asyncio.get_running_loop().create_task(
+            asyncio.to_thread(record_usage, record))
+        self._usage_writes.add(task)
+        task.add_done_callback(self._usage_writes.discard)
+
+    async def _admit(self, priority: Priority, user_id: Optional[int], course_id: Optional[int],
+                     deadline: Optional[float] = None):
+        """Wait for a rate-limit token in the admission queue"""
+        with timed("queue_wait"):
+            return await self.admission_queue.admit(
+                priority, user_id=user_id, course_id=course_id,
+                deadline=deadline or self.queue_deadline)
+
+    def _model_unavailable_response(self) -> Dict[str, Any]:
+        return self._error_response(
+            "I apologize, but the AI service is currently unavailable. Please try again later or contact support.",
+            "Gemini model not initialized")
+
+    @traced("chat", attach=True)
+    async def chat_with_context(self, message: str, course_id: Optional[int] = None, conversation_history: List[Dict] = None, course_info: Optional[Dict] = None, db_session=None, user_id: Optional[int] = None, priority: Priority = Priority.INTERACTIVE, conversation_summary: Optional[str] = None, on_text: Optional[Callable[..., None]] = None) -> Dict[str, Any]:
+        """Chat with ECHO using course context.
+
+        `on_text(text, attempt)` is called with the reply as it streams in;
+        cached answers are not streamed.
+        """
+        started = time.monotonic()
+        # Standalone questions can be answered from the cache; answers that
+        # depend on earlier turns cannot
+        context_version = None
+        if self.cache_enabled and not conversation_history and not conversation_summary:
+            with timed("cache_lookup"):
+                context_version = await asyncio.to_thread(
+                    self.get_course_context_version, course_id, db_session)
+                hit = self.response_cache.get(course_id, context_version, message)
+            if hit is not None:
+                self._record_usage("chat", started, user_id=user_id,
+                                   course_id=course_id, cache_hit=True)
                 return {
-                    "response": response.text,
-                    "success": True,
-                    "course_content_used": course_content_used,
-                    "content_files_count": content_files_count,
-                    "model_used": os.getenv('ECHO_MODEL', 'gemini-1.5-flash'),
-                    "tokens_used": response.usage_metadata.total_token_count if hasattr(response, 'usage_metadata') else None
+                    **hit.response,
+                    "tokens_used": 0,
+                    "cache": {
+                        "hit": True,
+                        "tier": hit.tier,
+                        "similarity": hit.similarity,
+                        "age_seconds": round(hit.age_seconds, 1)
+                    }
                 }
 
-            except google_exceptions.ServiceUnavailable as e:
-                if attempt < self.max_retries - 1:
-                    # Exponential backoff with jitter
-                    delay = self.retry_delay_base * \
-                        (2 ** attempt) + random.uniform(0, 1)
-                    time.sleep(delay)
-                    continue
-                else:
-                    return {
-                        "response": "I apologize, but Google's AI service is currently experiencing high demand and is temporarily unavailable. This is a temporary issue on Google's servers. Please try again in a few minutes.",
-                        "success": False,
-                        "error": "Google API service unavailable",
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
+        # Over the hard quota nothing is sent; over the soft quota the
+        # request yields to everyone else
+        quota = await self._check_quota(user_id, course_id)
+        if quota.state == "hard":
+            return self._quota_exceeded_response(quota)
+        if quota.state == "soft":
+            priority = Priority.BACKGROUND
 
-            except google_exceptions.RetryError as e:
-                if attempt < self.max_retries - 1:
-                    # Exponential backoff with jitter
-                    delay = self.retry_delay_base * \
-                        (2 ** attempt) + random.uniform(0, 1)
-                    time.sleep(delay)
-                    continue
-                else:
-                    return {
-                        "response": "I apologize, but the request to Google's AI service timed out. This can happen during periods of high demand. Please try again in a moment.",
-                        "success": False,
-                        "error": "Google API timeout",
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
+        # Fail fast during a provider outage, before spending a rate-limit token
+        if self.circuit_breaker.is_open():
+            return self._circuit_open_response(self.circuit_breaker.retry_after())
 
-            except Exception as e:
-                # Handle other errors
-                error_message = str(e)
-                if "timeout" in error_message.lower() or "503" in error_message:
-                    if attempt < self.max_retries - 1:
-                        # Exponential backoff with jitter
-                        delay = self.retry_delay_base * \
-                            (2 ** attempt) + random.uniform(0, 1)
-                        time.sleep(delay)
-                        continue
-                    else:
-                        user_message = "I apologize, but Google's AI service is currently experiencing issues. Please try again in a few minutes."
-                else:
-                    user_message = f"I apologize, but I encountered an error while processing your request: {error_message}. Please try again or contact support if the issue persists."
+        # Wait for a rate-limit token, shed if it takes too long
+        try:
+            admission = await self._admit(priority, user_id, course_id)
+        except AdmissionRejected as rejected:
+            return self._rate_limited_response(rejected)
 
-                return {
-                    "response": user_message,
-                    "success": False,
-                    "error": str(e),
-                    "course_content_used": False,
-                    "content_files_count": 0
-                }
+        # Check if model is available
+        if not self.backend:
+            return self._model_unavailable_response()
 
-        # This should never be reached, but just in case
-        return {
-            "response": "I apologize, but the AI service is currently experiencing issues. Please try again in a few minutes.",
-            "success": False,
-            "error": "Max retries exceeded",
-            "course_content_used": False,
-            "content_files_count": 0
-        }
+        prefix = route = None
+        try:
+            conversation, content_files_count, budget, prefix, route = await self._build_conversation(
+                message, course_id, conversation_history, course_info, db_session,
+                None, conversation_summary)
+
+            # Generate response with ECHO configuration
+            generation_config = {
+                'temperature': self.temperature,
+                'max_output_tokens': self.max_tokens,
+            }
 
-    def analyze_course_content(self, course_id: int) -> Dict[str, Any]:
-        """Analyze course content and provide insights"""
+            response = await self._generate_with_retries(
+                conversation,
+                backend=route.backend,
+                on_text=on_text,
+                cached_prefix=prefix.provider_handle if prefix else None,
+                generation_config=generation_config
+            )
+        except Exception as e:
+            self._discard_stale_prefix(prefix, e)
+            self._record_usage("chat", started, user_id=user_id,
+                               course_id=course_id, success=False,
+                               model=route.model_name if route else None)
+            return self._provider_error_response(e)
+
+        self._record_usage("chat", started, response,
+                           user_id=user_id, course_id=course_id,
+                           model=route.model_name, prompt_estimate=budget.total_tokens)
+
+        result = {
+            "response": response.text,
+            "success": True,
+            "course_content_used": content_files_count > 0,
+            "content_files_count": content_files_count,
+            "model_used": route.model_name,
+            "route": route.to_dict(),
+            "tokens_used": getattr(response.usage_metadata, 'total_token_count', None),
+            "prompt_tokens": self._prompt_tokens(response, budget),
+            "prompt_budget": budget.to_dict()
+        }
+        if context_version is not None:
+            self.response_cache.put(
+                course_id, context_version, message, result)
+        return {**result, "queue": admission.to_dict(), "cache": {"hit": False},
+                "quota": quota.to_dict()}
+
+    @traced("analysis")
+    async def analyze_course_content(self, course_id: int, user_id: Optional[int] = None,
+                                     queue_deadline: Optional[float] = None) -> Dict[str, Any]:
+        """Analyze course content and provide insights.
+
+        `queue_deadline` overrides how long the analysis may wait in the
+        admission queue, for offline callers that can wait longer than a user.
+        """
         if not self.course_content_enabled:
             return {
                 "success": False,
@@ -482,7 +874,8 @@ Course Information:
             }
 
         try:
-            course_content = self.get_s3_course_content(course_id)
+            with timed("context_build"):
+                course_content = await asyncio.to_thread(self.get_s3_course_content, course_id)
 
             if not course_content:
                 return {
@@ -517,9 +910,23 @@ Please provide:
 Keep the analysis educational and actionable.
 """
 
-            if self.model:
-                response = self.model.generate_content(analysis_prompt)
+            model_used = None
+            if self.backend:
+                if self.circuit_breaker.is_open():
+                    raise CircuitOpenError(self.circuit_breaker.retry_after())
+                # Analysis yields to interactive chats in the admission queue
+                await self._admit(Priority.BACKGROUND, user_id, course_id, queue_deadline)
+                # A synthesis over every course file, always the strong tier
+                route = self._route(tier=STRONG)
+                started = time.monotonic()
+                response = await self._generate_with_retries(
+                    analysis_prompt, backend=route.backend)
+                self._record_usage("analysis", started, response,
+                                   user_id=user_id, course_id=course_id,
+                                   model=route.model_name,
+                                   prompt_estimate=estimate_tokens(analysis_prompt))
                 analysis = response.text
+                model_used = route.model_name
             else:
                 analysis = "AI model not available for content analysis."
 
@@ -527,280 +934,297 @@ Keep the analysis educational and actionable.
                 "success": True,
                 "analysis": analysis,
                 "content_count": len(course_content),
-                "file_types": file_types
+                "file_types": file_types,
+                "model_used": model_used
             }
 
-        except Exception as e:
+        except CircuitOpenError:
             return {
                 "success": False,
-                "error": str(e),
+                "error": "Google's AI service is currently unavailable. Please try the analysis again in a few minutes.",
                 "analysis": "",
                 "content_count": 0,
                 "file_types": []
             }
-
-    def chat_with_files(self, message: str, files: List[Dict], course_id: Optional[int] = None, conversation_history: List[Dict] = None, course_info: Optional[Dict] = None, db_session=None) -> Dict[str, Any]:
-        """Chat with ECHO using uploaded files (images, documents, etc.)"""
-        # Check rate limiting
-        if not self.rate_limiter.can_make_request():
-            wait_time = self.rate_limiter.get_wait_time()
+        except AdmissionRejected as rejected:
+            return {
+                "success": False,
+                "error": "ECHO is busy with interactive requests. Please try the analysis again later.",
+                "retry_after": rejected.retry_after,
+                "analysis": "",
+                "content_count": 0,
+                "file_types": []
+            }
+        except Exception as e:
             return {
-                "response": f"I apologize, but the system is currently experiencing high demand. Please wait {int(wait_time)} seconds and try again.",
                 "success": False,
-                "error": "Rate limit exceeded",
-                "course_content_used": False,
-                "content_files_count": 0,
-                "retry_after": int(wait_time)
+                "error": str(e),
+                "analysis": "",
+                "content_count": 0,
+                "file_types": []
             }
 
-        for attempt in range(self.max_retries):
-            try:
-                # Check if model is available
-                if not self.model:
-                    return {
-                        "response": "I apologize, but the AI service is currently unavailable. Please try again later or contact support.",
-                        "success": False,
-                        "error": "Gemini model not initialized",
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
+    @traced("summary")
+    async def summarize_conversation(self, previous_summary: Optional[str], messages: List[Dict]) -> Optional[str]:
+        """Fold older conversation turns into a running summary.
 
-                # Build the conversation context
-                conversation = []
-
-                # Add system prompt
-                conversation.append({
-                    "role": "user",
-                    "parts": [self.system_prompt]
-                })
-
-                # Process uploaded files
-                file_contents = []
-                for file_info in files:
-                    try:
-                        file_path = file_info['saved_path']
-                        file_name = file_info['original_name']
-                        content_type = file_info['content_type']
-
-                        # Extract content based on file type
-                        if content_type and content_type.startswith('image/'):
-                            # Handle images
-                            with open(file_path, 'rb') as f:
-                                image_data = f.read()
-
-                            file_contents.append({
-                                "type": "image",
-                                "name": file_name,
-                                "data": image_data,
-                                "mime_type": content_type
-                            })
-                        else:
-                            # Handle documents and other files
-                            result = self.document_processor.extract_content(
-                                file_path, content_type)
-                            if result and result.get('content'):
-                                file_contents.append({
-                                    "type": "document",
-                                    "name": file_name,
-                                    "content": result['content'],
-                                    "format": result.get('format', 'unknown')
-                                })
-                    except Exception as e:
-                        print(
-                            f"Error processing file {file_info['original_name']}: {e}")
-                        continue
+        Runs as background work behind interactive chats and only draws on the
+        global rate limit, not the student's own quota. Returns None if the
+        model is unavailable or busy, and the caller tries again later.
+        """
+        if not self.backend or self.circuit_breaker.is_open():
+            return None
 
-                # Add course context if available
-                if course_id and self.course_content_enabled:
-                    course_context = self.get_course_context(
-                        course_id, db_session)
+        transcript = "\n\n".join(
+            f"{'Student' if msg.get('role') == 'user' else 'ECHO'}: {msg.get('content', '')}"
+            for msg in messages)
+        summary_prompt = f"""
+You maintain a running summary of a tutoring conversation between a student and ECHO.
 
-                    # Add course info if available
-                    if course_info:
-                        course_info_text = f"""
-Course Information:
-- Title: {course_info.get('title', 'Unknown')}
-- Description: {course_info.get('description', 'No description available')}
-- Credits: {course_info.get('credits', 'Unknown')}
+Current summary:
+{previous_summary or "(none yet)"}
+
+New conversation turns to fold in:
+{transcript}
+
+Write the updated summary. Keep the topics covered, the student's questions and
+difficulties, key explanations and any open follow-ups. Use at most
+{self.summary_max_words} words. Reply with the summary only.
 """
-                        course_context = course_info_text + "\n" + course_context
+        try:
+            await self._admit(Priority.BACKGROUND, None, None)
+            route = self._route(tier=FAST)
+            started = time.monotonic()
+            response = await self._generate_with_retries(
+                summary_prompt,
+                backend=route.backend,
+                generation_config={
+                    'temperature': 0.2,
+                    'max_output_tokens': self.summary_max_words * 2
+                }
+            )
+            self._record_usage("summary", started, response,
+                               model=route.model_name,
+                               prompt_estimate=estimate_tokens(summary_prompt))
+            return response.text.strip() or None
+        except (AdmissionRejected, CircuitOpenError):
+            return None
+        except Exception as e:
+            print(f"Error summarizing conversation: {e}")
+            return None
 
-                    conversation.append({
-                        "role": "user",
-                        "parts": [f"Course Context:\n{course_context}"]
-                    })
+    def _extraction_pool(self) -> ProcessPoolExecutor:
+        """Process pool for document extraction, started on first use"""
+        if self._extract_pool is None:
+            # fork is unsafe in a threaded server process
+            self._extract_pool = ProcessPoolExecutor(
+                max_workers=self.extract_workers,
+                mp_context=multiprocessing.get_context("spawn"))
+        return self._extract_pool
+
+    def shutdown_extraction_pool(self):
+        """Stop the extraction worker processes; a new pool starts on next use"""
+        pool, self._extract_pool = self._extract_pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _load_uploaded_file(self, file_info: Dict) -> Optional[Dict[str, Any]]:
+        """Read an uploaded image, or extract text from an uploaded document"""
+        file_path = file_info['saved_path']
+        file_name = file_info['original_name']
+        content_type = file_info['content_type']
+        try:
+            # Extract content based on file type
+            if content_type and content_type.startswith('image/'):
+                # Handle images
+                image_data = await asyncio.to_thread(Path(file_path).read_bytes)
+                return {
+                    "type": "image",
+                    "name": file_name,
+                    "data": image_data,
+                    "mime_type": content_type
+                }
 
-                # Add conversation history (limited to max_history)
-                if conversation_history:
-                    # Limit to last max_history messages
-                    for msg in conversation_history[-self.max_history:]:
-                        conversation.append({
-                            "role": msg.get("role", "user"),
-                            "parts": [msg.get("content", "")]
-                        })
+            # Handle documents and other files; parsing is CPU-bound, so it
+            # runs in another process rather than holding the GIL
+            pool = self._extraction_pool()
+            result = await asyncio.get_running_loop().run_in_executor(
+                pool, extract_local_file, file_path, content_type)
+            if result and result.get('content'):
+                return {
+                    "type": "document",
+                    "name": file_name,
+                    "content": result['content'],
+                    "format": result.get('format', 'unknown')
+                }
+        except BrokenProcessPool as e:
+            # A worker died (e.g. out of memory); stop what is left of the
+            # pool and start a fresh one next time, unless a concurrent
+            # upload already has
+            if self._extract_pool is pool:
+                self._extract_pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+            print(f"Error processing file {file_name}: {e}")
+        except Exception as e:
+            print(f"Error processing file {file_name}: {e}")
+        return None
 
-                # Add current message with files
-                message_parts = [message]
+    async def _load_uploaded_files(self, files: List[Dict]) -> List[Dict[str, Any]]:
+        """Load all uploaded files concurrently, skipping those that fail"""
+        loaded = await asyncio.gather(*(self._load_uploaded_file(f) for f in files))
+        return [f for f in loaded if f is not None]
 
-                # Add file contents to message
-                for file_content in file_contents:
-                    if file_content["type"] == "image":
-                        # Add image to message parts
-                        message_parts.append({
-                            "mime_type": file_content["mime_type"],
-                            "data": file_content["data"]
-                        })
-                    elif file_content["type"] == "document":
-                        # Add document content as text
-                        message_parts.append(
-                            f"\n\n[Document: {file_content['name']}]\n{file_content['content']}")
-
-                conversation.append({
-                    "role": "user",
-                    "parts": message_parts
-                })
-
-                # Generate response
-                if self.model:
-                    response = self.model.generate_content(conversation)
-
-                    # Determine if course content was used
-                    course_content_used = course_id is not None and self.course_content_enabled
-                    course_content_files = self.get_s3_course_content(
-                        course_id) if course_id and self.course_content_enabled else []
-                    content_files_count = len(course_content_files)
-
-                    return {
-                        "response": response.text,
-                        "success": True,
-                        "course_content_used": course_content_used,
-                        "content_files_count": content_files_count,
-                        "files_processed": len(files),
-                        "model_used": os.getenv('ECHO_MODEL', 'gemini-1.5-flash'),
-                        "tokens_used": response.usage_metadata.total_token_count if hasattr(response, 'usage_metadata') else None
-                    }
-                else:
-                    return {
-                        "response": "I apologize, but the AI model is not available at the moment.",
-                        "success": False,
-                        "error": "Model not available",
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
+    @traced("chat_files", attach=True)
+    async def chat_with_files(self, message: str, files: List[Dict], course_id: Optional[int] = None, conversation_history: List[Dict] = None, course_info: Optional[Dict] = None, db_session=None, user_id: Optional[int] = None, priority: Priority = Priority.INTERACTIVE, conversation_summary: Optional[str] = None) -> Dict[str, Any]:
+        """Chat with ECHO using uploaded files (images, documents, etc.)"""
+        started = time.monotonic()
+        quota = await self._check_quota(user_id, course_id)
+        if quota.state == "hard":
+            return self._quota_exceeded_response(quota)
+        if quota.state == "soft":
+            priority = Priority.BACKGROUND
+
+        # Fail fast during a provider outage, before spending a rate-limit token
+        if self.circuit_breaker.is_open():
+            return self._circuit_open_response(self.circuit_breaker.retry_after())
+
+        # Wait for a rate-limit token, shed if it takes too long
+        try:
+            admission = await self._admit(priority, user_id, course_id)
+        except AdmissionRejected as rejected:
+            return self._rate_limited_response(rejected)
 
-            except google_exceptions.ServiceUnavailable as e:
-                if attempt < self.max_retries - 1:
-                    # Exponential backoff with jitter
-                    delay = self.retry_delay_base * \
-                        (2 ** attempt) + random.uniform(0, 1)
-                    time.sleep(delay)
-                    continue
-                else:
-                    return {
-                        "response": "I apologize, but Google's AI service is currently experiencing high demand and is temporarily unavailable. This is a temporary issue on Google's servers. Please try again in a few minutes.",
-                        "success": False,
-                        "error": "Google API service unavailable",
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
-            except google_exceptions.RetryError as e:
-                if attempt < self.max_retries - 1:
-                    # Exponential backoff with jitter
-                    delay = self.retry_delay_base * \
-                        (2 ** attempt) + random.uniform(0, 1)
-                    time.sleep(delay)
-                    continue
-                else:
-                    return {
-                        "response": "I apologize, but the request to Google's AI service timed out. This can happen during periods of high demand. Please try again in a moment.",
-                        "success": False,
-                        "error": "Google API timeout",
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
-            except Exception as e:
-                # Handle specific Google API errors
-                if isinstance(e, google_exceptions.ServiceUnavailable):
-                    return {
-                        "response": "I apologize, but Google's AI service is currently experiencing high demand and is temporarily unavailable. This is a temporary issue on Google's servers. Please try again in a few minutes.",
-                        "success": False,
-                        "error": "Google API service unavailable",
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
-                elif isinstance(e, google_exceptions.RetryError):
-                    return {
-                        "response": "I apologize, but the request to Google's AI service timed out. This can happen during periods of high demand. Please try again in a moment.",
-                        "success": False,
-                        "error": "Google API timeout",
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
-                elif isinstance(e, google_exceptions.QuotaExceeded):
-                    return {
-                        "response": "I apologize, but the API quota has been exceeded. Please try again later or contact support if this issue persists.",
-                        "success": False,
-                        "error": "API quota exceeded",
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
-                else:
-                    # Handle other errors
-                    error_message = str(e)
-                    if "timeout" in error_message.lower() or "503" in error_message:
-                        user_message = "I apologize, but Google's AI service is currently experiencing issues. Please try again in a few minutes."
-                    else:
-                        user_message = f"I apologize, but I encountered an error while processing your request with files: {error_message}. Please try again or contact support if the issue persists."
-
-                    return {
-                        "response": user_message,
-                        "success": False,
-                        "error": str(e),
-                        "course_content_used": False,
-                        "content_files_count": 0
-                    }
+        # Check if model is available
+        if not self.backend:
+            return self._model_unavailable_response()
+
+        prefix = route = None
+        try:
+            # Process uploaded files
+            with timed("file_load"):
+                file_contents = await self._load_uploaded_files(files)
+
+            # Shrink images in the worker pool, all at once
+            images = [f for f in file_contents if f["type"] == "image"]
+            with timed("image_preprocess"):
+                processed_images = await asyncio.gather(*(
+                    self.image_preprocessor.process(f["data"], f["mime_type"]) for f in images))
+            for file_content, processed in zip(images, processed_images):
+                file_content["data"] = processed.data
+                file_content["mime_type"] = processed.mime_type
+
+            # Add file contents to message
+            message_parts = [message]
+            for file_content in file_contents:
+                if file_content["type"] == "image":
+                    # Add image to message parts
+                    message_parts.append({
+                        "mime_type": file_content["mime_type"],
+                        "data": file_content["data"]
+                    })
+                elif file_content["type"] == "document":
+                    # Add document content as text
+                    message_parts.append(
+                        f"\n\n[Document: {file_content['name']}]\n{file_content['content']}")
+
+            conversation, content_files_count, budget, prefix, route = await self._build_conversation(
+                message, course_id, conversation_history, course_info, db_session,
+                message_parts, conversation_summary)
+
+            response = await self._generate_with_retries(
+                conversation, backend=route.backend,
+                cached_prefix=prefix.provider_handle if prefix else None)
+        except Exception as e:
+            self._discard_stale_prefix(prefix, e)
+            self._record_usage("chat_files", started, user_id=user_id,
+                               course_id=course_id, success=False,
+                               model=route.model_name if route else None)
+            return self._provider_error_response(e, with_files=True)
+
+        self._record_usage("chat_files", started, response,
+                           user_id=user_id, course_id=course_id,
+                           model=route.model_name, prompt_estimate=budget.total_tokens)
 
-        # This should never be reached, but just in case
         return {
-            "response": "I apologize, but the AI service is currently experiencing issues. Please try again in a few minutes.",
-            "success": False,
-            "error": "Max retries exceeded",
-            "course_content_used": False,
-            "content_files_count": 0
+            "response": response.text,
+            "success": True,
+            "course_content_used": course_id is not None and self.course_content_enabled,
+            "content_files_count": content_files_count,
+            "files_processed": len(files),
+            "images": [dict(name=f["name"], **p.to_dict()) for f, p in zip(images, processed_images)],
+            "model_used": route.model_name,
+            "route": route.to_dict(),
+            "tokens_used": getattr(response.usage_metadata, 'total_token_count', None),
+            "prompt_tokens": self._prompt_tokens(response, budget),
+            "prompt_budget": budget.to_dict(),
+            "queue": admission.to_dict(),
+            "quota": quota.to_dict()
+        }
+
+    def _set_health(self, api_status: str, api_error: Optional[str] = None, latency_ms: Optional[float] = None):
+        """Publish a new health snapshot; readers always see a complete dict"""
+        self.health = {
+            "model_available": self.backend is not None,
+            "api_status": api_status,
+            "api_error": api_error,
+            "latency_ms": latency_ms,
+            "checked_at": datetime.utcnow().isoformat() if api_status != "unknown" else None
         }
 
+    async def probe_api_health(self):
+        """Make one minimal model call and record the API health it reveals"""
+        if not self.backend:
+            self._set_health("not_initialized", "Model not initialized")
+            return
+
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(
+                self.backend.generate(
+                    "ping", generation_config={'max_output_tokens': 1}),
+                timeout=self.request_timeout
+            )
+            self._set_health("connected", latency_ms=round(
+                (time.monotonic() - started) * 1000, 1))
+        except Exception as e:
+            from google.api_core import exceptions as google_exceptions
+            if isinstance(e, google_exceptions.ServiceUnavailable):
+                self._set_health("service_unavailable",
+                                 "Google API service is currently overloaded")
+            elif isinstance(e, (google_exceptions.RetryError, asyncio.TimeoutError)):
+                self._set_health("timeout", "Google API request timed out")
+            else:
+                self._set_health("error", str(e))
+
+    async def run_health_probe(self):
+        """Refresh the cached API health forever, with jitter between probes.
+
+        The jitter keeps the workers of one deployment from probing in lockstep.
+        """
+        while True:
+            await self.probe_api_health()
+            await asyncio.sleep(self.health_probe_interval +
+                                random.uniform(0, self.health_probe_jitter))
+
     def get_echo_status(self) -> Dict[str, Any]:
-        """Get ECHO system status and configuration"""
+        """Get ECHO system status and configuration.
+
+        API connectivity comes from the background health probe, so this never
+        calls the model itself.
+        """
         try:
             # Get document processing capabilities
             supported_formats = self.document_processor.get_supported_formats()
-
-            # Test API connectivity
-            api_status = "unknown"
-            api_error = None
-            if self.model:
-                try:
-                    # Simple test call
-                    response = self.model.generate_content("test")
-                    api_status = "connected"
-                except google_exceptions.ServiceUnavailable:
-                    api_status = "service_unavailable"
-                    api_error = "Google API service is currently overloaded"
-                except google_exceptions.RetryError:
-                    api_status = "timeout"
-                    api_error = "Google API request timed out"
-                except Exception as e:
-                    api_status = "error"
-                    api_error = str(e)
-            else:
-                api_status = "not_initialized"
-                api_error = "Model not initialized"
+            health = self.health
 
             return {
-                "model_available": self.model is not None,
-                "model_name": os.getenv('ECHO_MODEL', 'gemini-1.5-flash'),
-                "api_status": api_status,
-                "api_error": api_error,
+                "model_available": health["model_available"],
+                "model_name": self.model_name,
+                "backend": self.backend.describe() if self.backend else None,
+                "api_status": health["api_status"],
+                "api_error": health["api_error"],
+                "api_latency_ms": health["latency_ms"],
+                "api_checked_at": health["checked_at"],
                 "course_content_enabled": self.course_content_enabled,
                 "analytics_enabled": self.analytics_enabled,
                 "voice_enabled": self.voice_enabled,
@@ -808,6 +1232,15 @@ Course Information:
                 "max_tokens": self.max_tokens,
                 "temperature": self.temperature,
                 "max_history": self.max_history,
+                "rate_limits": self.rate_limiter.describe(),
+                "admission_queue": self.admission_queue.describe(),
+                "circuit_breaker": self.circuit_breaker.snapshot(),
+                "response_cache": self.response_cache.describe() if self.cache_enabled else None,
+                "prefix_cache": self.prefix_cache.describe(),
+                "model_routing": self.model_router.describe(),
+                "hedging": self.hedger.describe(),
+                "usage_quota": self.usage_quota.describe(),
+                "image_preprocessing": self.image_preprocessor.describe(),
                 "s3_bucket": self.bucket_name,
                 "aws_configured": bool(os.getenv('AWS_ACCESS_KEY_ID') or os.getenv('USE_IAM_ROLE') == 'true'),
                 "document_processing": {
@@ -827,5 +1260,36 @@ Course Information:
             }
 
 
-# Global instance
-gemini_service = GeminiService()
+_gemini_service: Optional[GeminiService] = None
+_gemini_service_lock = threading.Lock()
+
+
+def get_gemini_service() -> GeminiService:
+    """The process-wide ECHO service, created on first use.
+
+    Building it configures the model SDK and reads environment config, so
+    it is deferred until a request (or the startup warm-up) needs it rather
+    than paid by every import of this module.
+    """
+    global _gemini_service
+    if _gemini_service is None:
+        with _gemini_service_lock:
+            if _gemini_service is None:
+                _gemini_service = GeminiService()
+    return _gemini_service
+
+
+def shutdown_gemini_service():
+    """Release the ECHO service's worker processes, if the service is running"""
+    if _gemini_service is not None:
+        _gemini_service.shutdown_extraction_pool()
+
+
+def invalidate_course_caches(course_id: int):
+    """Drop a course's cached ECHO answers and prefixes, if the service is running.
+
+    Before the service exists nothing has been cached, so document changes
+    do not need to build it.
+    """
+    if _gemini_service is not None:
+        _gemini_service.invalidate_course(course_id)
@@ -0,0 +1,147 @@
+"""
+Image preprocessing for multimodal ECHO calls.
+
+Phone photos of whiteboards and slides are often several MB and far larger
+than the model needs. Before an image is sent it is decoded, rotated upright,
+scaled down to a maximum dimension and re-encoded as JPEG without its EXIF
+metadata. The work runs in a worker pool off the event loop, and results are
+cached by content hash so re-sent images are processed once.
+"""
+
+import asyncio
+import hashlib
+import importlib.util
+import io
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+# Pillow is imported by the worker on first use, not at server start
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
+if not PIL_AVAILABLE:
+    print("⚠️  Pillow not available. Images will be sent to ECHO unprocessed.")
+
+
+@dataclass
+class ProcessedImage:
+    data: bytes
+    mime_type: str
+    original_bytes: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    cached: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "original_bytes": self.original_bytes,
+            "sent_bytes": len(self.data),
+            "width": self.width,
+            "height": self.height,
+            "mime_type": self.mime_type,
+            "cached": self.cached
+        }
+
+
+def downscale_image(data: bytes, max_dimension: int, quality: int) -> Tuple[bytes, int, int]:
+    """Decode, orient, shrink and re-encode one image as a metadata-free JPEG"""
+    from PIL import Image, ImageOps
+    with Image.open(io.BytesIO(data)) as image:
+        # Apply the EXIF rotation before the EXIF block is dropped
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha; flatten onto white like a page
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=quality, optimize=True)
+        return output.getvalue(), image.width, image.height
+
+
+class ImagePreprocessor:
+    """Shrinks images in a worker pool, with an LRU cache keyed by content hash"""
+
+    def __init__(self, max_dimension: int = 1568, quality: int = 80,
+                 cache_max_bytes: int = 64 * 1024 * 1024, workers: int = 2):
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.cache_max_bytes = cache_max_bytes
+        # Pillow releases the GIL while decoding and resizing
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="echo-image")
+        self._cache: "OrderedDict[str, ProcessedImage]" = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"processed": 0, "cache_hits": 0, "failures": 0,
+                      "bytes_in": 0, "bytes_out": 0}
+
+    @classmethod
+    def from_env(cls) -> "ImagePreprocessor":
+        return cls(
+            max_dimension=int(os.getenv('ECHO_IMAGE_MAX_DIMENSION', '1568')),
+            quality=int(os.getenv('ECHO_IMAGE_QUALITY', '80')),
+            cache_max_bytes=int(os.getenv('ECHO_IMAGE_CACHE_MB', '64')) * 1024 * 1024,
+            workers=int(os.getenv('ECHO_IMAGE_WORKERS', '2'))
+        )
+
+    def _cache_get(self, key: str) -> Optional[ProcessedImage]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def _cache_put(self, key: str, entry: ProcessedImage):
+        with self._lock:
+            if key in self._cache:
+                return
+            self._cache[key] = entry
+            self._cache_bytes += len(entry.data)
+            while self._cache_bytes > self.cache_max_bytes and self._cache:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted.data)
+
+    async def process(self, data: bytes, mime_type: str) -> ProcessedImage:
+        """Model-ready version of an image; the original if it cannot be processed"""
+        if not PIL_AVAILABLE:
+            return ProcessedImage(data, mime_type, len(data))
+
+        key = hashlib.sha256(data).hexdigest()
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return ProcessedImage(cached.data, cached.mime_type, len(data),
+                                  cached.width, cached.height, cached=True)
+
+        try:
+            processed, width, height = await asyncio.get_running_loop().run_in_executor(
+                self._executor, downscale_image, data, self.max_dimension, self.quality)
+        except Exception as e:
+            # Unknown or corrupt formats go to the model as uploaded
+            self.stats["failures"] += 1
+            print(f"⚠️  Could not preprocess image: {e}")
+            return ProcessedImage(data, mime_type, len(data))
+
+        result = ProcessedImage(processed, "image/jpeg", len(data), width, height)
+        self.stats["processed"] += 1
+        self.stats["bytes_in"] += len(data)
+        self.stats["bytes_out"] += len(processed)
+        self._cache_put(key, result)
+        return result
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "enabled": PIL_AVAILABLE,
+            "max_dimension": self.max_dimension,
+            "quality": self.quality,
+            "cache_entries": len(self._cache),
+            "cache_bytes": self._cache_bytes,
+            **self.stats
+        }
@@ -0,0 +1,326 @@
+"""
+LLM backends behind the ECHO service.
+
+GeminiService only talks to a backend through `generate` and `stream`, which
+return Gemini-shaped responses (`.text` and `.usage_metadata`). The backend is
+picked with ECHO_BACKEND:
+
+- `gemini` (default): Google Gemini through google-generativeai, imported
+  only when the backend is created since the SDK takes a while to load
+- `stub`: a local deterministic model with configurable latency, streaming,
+  token accounting and injected failures, for load tests and CI without a
+  network or an API key
+"""
+
+import asyncio
+import datetime
+import hashlib
+import math
+import os
+import random
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Optional
+
+from services.prompt_budget import estimate_part_tokens
+
+DEFAULT_MODEL = 'gemini-1.5-flash'
+
+
+class LLMBackend:
+    """Interface every ECHO backend implements"""
+
+    name = "base"
+    # Whether the provider can hold a prompt prefix between calls
+    supports_prefix_cache = False
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    async def generate(self, contents: Any, cached_prefix: Any = None, **kwargs) -> Any:
+        """One complete response for `contents`, after `cached_prefix` if given"""
+        raise NotImplementedError
+
+    def stream(self, contents: Any, cached_prefix: Any = None, **kwargs) -> AsyncIterator[Any]:
+        """Response chunks as they are produced; the last one carries usage"""
+        raise NotImplementedError
+
+    async def create_prefix(self, system_prompt: str, context_text: str, ttl_seconds: float) -> Any:
+        """Register a prompt prefix with the provider and return its handle"""
+        raise NotImplementedError
+
+    async def delete_prefix(self, handle: Any):
+        pass
+
+    def describe(self):
+        return {"backend": self.name, "model_name": self.model_name}
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini through google-generativeai"""
+
+    name = "gemini"
+
+    def __init__(self, model: Any, model_name: str):
+        super().__init__(model_name)
+        self.model = model
+
+    @classmethod
+    def from_env(cls, model_name: Optional[str] = None) -> Optional["GeminiBackend"]:
+        api_key = os.getenv('GEMINI_API_KEY')
+        if not api_key:
+            print("Warning: GEMINI_API_KEY environment variable not set")
+            return None
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+
+        try:
+            # Use environment variable for model selection
+            model_name = model_name or os.getenv('ECHO_MODEL', DEFAULT_MODEL)
+            backend = cls(genai.GenerativeModel(model_name), model_name)
+            print(f"✅ ECHO initialized with {model_name}")
+            return backend
+        except Exception as e:
+            print(f"Warning: Could not initialize Gemini model: {e}")
+            # Fallback to basic model
+            try:
+                backend = cls(genai.GenerativeModel(DEFAULT_MODEL), DEFAULT_MODEL)
+                print("✅ ECHO initialized with fallback model")
+                return backend
+            except Exception as fallback_error:
+                print(
+                    f"Warning: Could not initialize fallback model: {fallback_error}")
+                return None
+
+    @property
+    def supports_prefix_cache(self) -> bool:
+        # Context caching arrived in google-generativeai 0.7; the 0.3.2
+        # pinned in requirements.txt does not have it
+        import google.generativeai as genai
+        return hasattr(genai, 'caching')
+
+    def _model_for(self, cached_prefix: Any):
+        return cached_prefix.model if cached_prefix is not None else self.model
+
+    async def generate(self, contents: Any, cached_prefix: Any = None, **kwargs) -> Any:
+        return await self._model_for(cached_prefix).generate_content_async(contents, **kwargs)
+
+    async def stream(self, contents: Any, cached_prefix: Any = None, **kwargs) -> AsyncIterator[Any]:
+        response = await self._model_for(cached_prefix).generate_content_async(
+            contents, stream=True, **kwargs)
+        async for chunk in response:
+            yield chunk
+
+    async def create_prefix(self, system_prompt: str, context_text: str, ttl_seconds: float) -> Any:
+        import google.generativeai as genai
+
+        def create():
+            cached = genai.caching.CachedContent.create(
+                model=self.model_name,
+                system_instruction=system_prompt,
+                contents=[{"role": "user", "parts": [context_text]}],
+                ttl=datetime.timedelta(seconds=ttl_seconds)
+            )
+            return GeminiPrefix(cached, genai.GenerativeModel.from_cached_content(cached_content=cached))
+        return await asyncio.to_thread(create)
+
+    async def delete_prefix(self, handle: Any):
+        await asyncio.to_thread(handle.cached_content.delete)
+
+
+@dataclass
+class GeminiPrefix:
+    """A Gemini cached content and a model bound to it"""
+    cached_content: Any
+    model: Any
+
+
+@dataclass
+class LLMUsage:
+    prompt_token_count: int
+    candidates_token_count: int
+    total_token_count: int
+
+
+@dataclass
+class LLMResponse:
+    """Gemini-shaped response built outside the SDK (stub answers, collected streams)"""
+    text: str
+    usage_metadata: Optional[LLMUsage] = None
+
+
+# Injectable failures: the google.api_core exception the provider would raise
+STUB_FAILURES = {
+    "unavailable": ("ServiceUnavailable", "Stub backend: service unavailable"),
+    "deadline": ("DeadlineExceeded", "Stub backend: deadline exceeded"),
+    "exhausted": ("ResourceExhausted", "Stub backend: quota exhausted"),
+    "invalid": ("InvalidArgument", "Stub backend: invalid request"),
+}
+
+STUB_WORDS = ("the", "course", "lecture", "concept", "example", "students",
+              "notes", "topic", "review", "practice", "chapter", "assignment")
+
+
+def _prompt_tokens(contents: Any) -> int:
+    """Estimate input tokens of a prompt in any shape Gemini accepts"""
+    if isinstance(contents, dict):
+        return _prompt_tokens(contents.get("parts", []))
+    if isinstance(contents, (list, tuple)):
+        return sum(_prompt_tokens(c) for c in contents)
+    return estimate_part_tokens(contents)
+
+
+def _last_user_text(contents: Any) -> str:
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)) and contents:
+        last = contents[-1]
+        parts = last.get("parts", []) if isinstance(last, dict) else [last]
+        return " ".join(p for p in parts if isinstance(p, str))
+    return ""
+
+
+class StubBackend(LLMBackend):
+    """Deterministic local model for load tests.
+
+    The answer depends only on the prompt, so repeated runs are comparable.
+    Latency is drawn from the configured distribution for the time to the
+    first token, then output tokens arrive at `tokens_per_second`.
+    """
+
+    name = "stub"
+
+    def __init__(self, latency_ms: float = 300.0, latency_dist: str = "lognormal",
+                 jitter_ms: float = 100.0, tokens_per_second: float = 200.0,
+                 output_tokens: int = 120, failure_rate: float = 0.0,
+                 failure_kind: str = "unavailable", seed: Optional[int] = None,
+                 model_name: str = "echo-stub"):
+        super().__init__(model_name)
+        self.latency_ms = latency_ms
+        self.latency_dist = latency_dist
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.output_tokens = output_tokens
+        self.failure_rate = failure_rate
+        if failure_kind not in STUB_FAILURES:
+            raise ValueError(f"Unknown stub failure kind: {failure_kind}")
+        self.failure_kind = failure_kind
+        self._random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, model_name: Optional[str] = None) -> "StubBackend":
+        seed = os.getenv('ECHO_STUB_SEED')
+        return cls(
+            latency_ms=float(os.getenv('ECHO_STUB_LATENCY_MS', '300')),
+            latency_dist=os.getenv('ECHO_STUB_LATENCY_DIST', 'lognormal'),
+            jitter_ms=float(os.getenv('ECHO_STUB_JITTER_MS', '100')),
+            tokens_per_second=float(
+                os.getenv('ECHO_STUB_TOKENS_PER_SECOND', '200')),
+            output_tokens=int(os.getenv('ECHO_STUB_OUTPUT_TOKENS', '120')),
+            failure_rate=float(os.getenv('ECHO_STUB_FAILURE_RATE', '0')),
+            failure_kind=os.getenv('ECHO_STUB_FAILURE_KIND', 'unavailable'),
+            seed=int(seed) if seed else None,
+            model_name=model_name or "echo-stub"
+        )
+
+    def _first_token_delay(self) -> float:
+        """Seconds until the first token, from the configured distribution"""
+        mean, spread = self.latency_ms, self.jitter_ms
+        if self.latency_dist == "fixed":
+            ms = mean
+        elif self.latency_dist == "uniform":
+            ms = self._random.uniform(mean - spread, mean + spread)
+        elif self.latency_dist == "normal":
+            ms = self._random.gauss(mean, spread)
+        elif self.latency_dist == "lognormal":
+            # Long right tail like a real provider; mean stays at `mean`
+            sigma = math.sqrt(math.log(1 + (spread / mean) ** 2)) if mean > 0 else 0.0
+            ms = self._random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma) if mean > 0 else 0.0
+        else:
+            raise ValueError(f"Unknown stub latency distribution: {self.latency_dist}")
+        return max(ms, 0.0) / 1000
+
+    def _answer(self, contents: Any, max_tokens: Optional[int]) -> str:
+        question = _last_user_text(contents).strip()
+        digest = hashlib.sha256(question.encode("utf-8")).digest()
+        count = min(self.output_tokens, max_tokens) if max_tokens else self.output_tokens
+        words = [STUB_WORDS[digest[i % len(digest)] % len(STUB_WORDS)]
+                 for i in range(max(count - 1, 0))]
+        return " ".join([f"[stub] {question[:80]}"] + words) if count > 1 else "[stub]"
+
+    def _maybe_fail(self):
+        self.calls += 1
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            self.failures += 1
+            # Imported here; google.api_core pulls in grpc
+            from google.api_core import exceptions as google_exceptions
+            name, message = STUB_FAILURES[self.failure_kind]
+            raise getattr(google_exceptions, name)(message)
+
+    def _usage(self, contents: Any, text: str) -> LLMUsage:
+        prompt = _prompt_tokens(contents)
+        output = len(text.split())
+        return LLMUsage(prompt, output, prompt + output)
+
+    @staticmethod
+    def _max_tokens(kwargs) -> Optional[int]:
+        config = kwargs.get("generation_config") or {}
+        return config.get("max_output_tokens") if isinstance(config, dict) else None
+
+    async def generate(self, contents: Any, cached_prefix: Any = None, **kwargs) -> LLMResponse:
+        await asyncio.sleep(self._first_token_delay())
+        self._maybe_fail()
+        text = self._answer(contents, self._max_tokens(kwargs))
+        usage = self._usage(contents, text)
+        if self.tokens_per_second:
+            await asyncio.sleep(usage.candidates_token_count / self.tokens_per_second)
+        return LLMResponse(text, usage)
+
+    async def stream(self, contents: Any, cached_prefix: Any = None, **kwargs) -> AsyncIterator[LLMResponse]:
+        await asyncio.sleep(self._first_token_delay())
+        self._maybe_fail()
+        text = self._answer(contents, self._max_tokens(kwargs))
+        words = text.split(" ")
+        # A handful of words per chunk, roughly like the provider
+        chunk_size = 8
+        for start in range(0, len(words), chunk_size):
+            chunk = " ".join(words[start:start + chunk_size])
+            if start:
+                chunk = " " + chunk
+                if self.tokens_per_second:
+                    await asyncio.sleep(chunk_size / self.tokens_per_second)
+            last = start + chunk_size >= len(words)
+            yield LLMResponse(chunk, self._usage(contents, text) if last else None)
+
+    def describe(self):
+        return {
+            **super().describe(),
+            "latency_ms": self.latency_ms,
+            "latency_dist": self.latency_dist,
+            "failure_rate": self.failure_rate,
+            "failure_kind": self.failure_kind,
+            "calls": self.calls,
+            "injected_failures": self.failures
+        }
+
+
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "stub": StubBackend,
+}
+
+
+def create_backend(name: Optional[str] = None, model_name: Optional[str] = None) -> Optional[LLMBackend]:
+    """Build the backend named by ECHO_BACKEND; None if it cannot be used.
+
+    `model_name` overrides ECHO_MODEL, e.g. for the routing tiers.
+    """
+    name = (name or os.getenv('ECHO_BACKEND', 'gemini')).lower()
+    if name not in BACKENDS:
+        print(f"Warning: Unknown ECHO_BACKEND '{name}', falling back to gemini")
+        name = "gemini"
+    backend = BACKENDS[name].from_env(model_name)
+    if backend is not None and name != "gemini":
+        print(f"✅ ECHO using the {name} backend")
+    return backend
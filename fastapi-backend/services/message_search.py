@@ -0,0 +1,212 @@
+"""
+Full-text search over ECHO chat history.
+
+Messages are indexed by the database itself, so a search never scans
+chatbot_messages:
+
+- SQLite: an external-content FTS5 table, chatbot_messages_fts, kept in step
+  with chatbot_messages by triggers.
+- PostgreSQL: a generated tsvector column, chatbot_messages.content_tsv,
+  with a GIN index.
+
+`ensure_search_index()` creates whichever applies and is safe to run on
+every startup. If the database has no full-text search, or the index could
+not be built, searches raise SearchUnavailable instead of failing in SQL.
+Snippets are HTML-escaped, with matches wrapped in <mark>.
+"""
+
+import html
+import re
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from database import engine
+
+# Marks matches inside snippets before escaping; never present in chat text
+START, STOP = "\x02", "\x03"
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chatbot_messages_fts USING fts5(
+        content, content='chatbot_messages', content_rowid='id',
+        tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS chatbot_messages_fts_insert
+        AFTER INSERT ON chatbot_messages BEGIN
+        INSERT INTO chatbot_messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chatbot_messages_fts_delete
+        AFTER DELETE ON chatbot_messages BEGIN
+        INSERT INTO chatbot_messages_fts(chatbot_messages_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chatbot_messages_fts_update
+        AFTER UPDATE OF content ON chatbot_messages BEGIN
+        INSERT INTO chatbot_messages_fts(chatbot_messages_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO chatbot_messages_fts(rowid, content) VALUES (new.id, new.content);
+    END""",
+]
+
+POSTGRES_DDL = [
+    """ALTER TABLE chatbot_messages ADD COLUMN IF NOT EXISTS content_tsv tsvector
+        GENERATED ALWAYS AS (to_tsvector('english', coalesce(content, ''))) STORED""",
+    """CREATE INDEX IF NOT EXISTS ix_chatbot_messages_content_tsv
+        ON chatbot_messages USING GIN (content_tsv)""",
+]
+
+SQLITE_SEARCH = text("""
+    SELECT m.id, m.session_id, s.session_name, m.role, m.timestamp,
+           snippet(chatbot_messages_fts, 0, :start, :stop, '…', 16) AS snippet,
+           -bm25(chatbot_messages_fts) AS score
+    FROM chatbot_messages_fts
+    JOIN chatbot_messages m ON m.id = chatbot_messages_fts.rowid
+    JOIN chat_sessions s ON s.id = m.session_id
+    WHERE chatbot_messages_fts MATCH :query
+      AND s.user_id = :user_id AND s.is_active
+    ORDER BY score DESC, m.id DESC
+    LIMIT :limit
+""")
+
+# Headlines are only built for the page of results, not every match
+POSTGRES_SEARCH = text("""
+    SELECT top.id, top.session_id, top.session_name, top.role, top.timestamp,
+           ts_headline('english', top.content, top.query,
+                       'StartSel=' || :start || ', StopSel=' || :stop
+                       || ', MaxFragments=2, MaxWords=20, MinWords=8') AS snippet,
+           top.score
+    FROM (
+        SELECT m.id, m.session_id, s.session_name, m.role, m.timestamp, m.content,
+               q.query, ts_rank(m.content_tsv, q.query) AS score
+        FROM chatbot_messages m
+        JOIN chat_sessions s ON s.id = m.session_id,
+             websearch_to_tsquery('english', :query) AS q(query)
+        WHERE m.content_tsv @@ q.query
+          AND s.user_id = :user_id AND s.is_active
+        ORDER BY score DESC, m.id DESC
+        LIMIT :limit
+    ) AS top
+    ORDER BY top.score DESC, top.id DESC
+""")
+
+
+INDEX_EXISTS = {
+    "sqlite": "SELECT 1 FROM sqlite_master WHERE name = 'chatbot_messages_fts'",
+    "postgresql": """SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'chatbot_messages' AND column_name = 'content_tsv'""",
+}
+
+
+class SearchUnavailable(Exception):
+    """The database has no full-text index for chat messages.
+
+    `supported` is False when the database cannot do full-text search at
+    all, and True when it can but the index is missing.
+    """
+
+    def __init__(self, reason: str, supported: bool = True):
+        super().__init__(reason)
+        self.supported = supported
+
+
+# Set when ensure_search_index() found no full-text search on this database
+_unsupported: Optional[str] = None
+
+
+def ensure_search_index() -> bool:
+    """Create the full-text index for this database if it is missing.
+
+    Returns False if the database has no full-text search.
+    """
+    global _unsupported
+    dialect = engine.dialect.name
+    if dialect == "sqlite":
+        try:
+            with engine.begin() as conn:
+                existed = conn.execute(text(INDEX_EXISTS[dialect])).first() is not None
+                for statement in SQLITE_DDL:
+                    conn.execute(text(statement))
+                if not existed:
+                    # Index the messages written before the index existed
+                    conn.execute(text(
+                        "INSERT INTO chatbot_messages_fts(chatbot_messages_fts) VALUES ('rebuild')"))
+        except DBAPIError as e:
+            if "fts5" not in str(e).lower():
+                raise
+            # SQLite built without FTS5
+            _unsupported = "this SQLite build has no FTS5"
+            return False
+    elif dialect == "postgresql":
+        with engine.begin() as conn:
+            for statement in POSTGRES_DDL:
+                conn.execute(text(statement))
+    else:
+        _unsupported = f"{dialect} has no full-text search support in ECHO"
+        return False
+    _unsupported = None
+    return True
+
+
+def _index_exists(db: Session) -> bool:
+    dialect = db.get_bind().dialect.name
+    return dialect in INDEX_EXISTS and db.execute(text(INDEX_EXISTS[dialect])).first() is not None
+
+
+def _fts5_query(query: str) -> str:
+    """User input as an FTS5 query: every word must match, the last as a prefix"""
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return ""
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _highlight(snippet: str) -> str:
+    return html.escape(snippet or "").replace(START, "<mark>").replace(STOP, "</mark>")
+
+
+def search_messages(db: Session, user_id: int, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """The user's messages matching `query`, best match first.
+
+    Raises SearchUnavailable if the database has no full-text index.
+    """
+    if _unsupported:
+        raise SearchUnavailable(_unsupported, supported=False)
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        match = _fts5_query(query)
+        if not match:
+            return []
+        statement = SQLITE_SEARCH
+    elif dialect == "postgresql":
+        match = query
+        statement = POSTGRES_SEARCH
+    else:
+        raise SearchUnavailable(f"{dialect} has no full-text search support in ECHO",
+                                supported=False)
+
+    try:
+        rows = db.execute(statement, {
+            "query": match, "user_id": user_id, "limit": limit,
+            "start": START, "stop": STOP
+        }).mappings().all()
+    except DBAPIError:
+        # A failed statement aborts the transaction on PostgreSQL
+        db.rollback()
+        if not _index_exists(db):
+            raise SearchUnavailable("the chat search index has not been built")
+        raise
+    return [
+        {
+            "message_id": row["id"],
+            "session_id": row["session_id"],
+            "session_name": row["session_name"],
+            "role": row["role"],
+            "timestamp": row["timestamp"],
+            "snippet": _highlight(row["snippet"]),
+            "score": round(float(row["score"] or 0.0), 4)
+        }
+        for row in rows
+    ]
@@ -0,0 +1,124 @@
+"""
+Complexity-based model routing for ECHO.
+
+A definitional question does not need the model that synthesizes several
+course documents. With ECHO_MODEL_ROUTING enabled, each chat is classified by
+a cheap local heuristic (message length, attachments, course context size and
+history depth) and sent to the fast or the strong model tier. Course analyses
+always use the strong tier and conversation summaries the fast one.
+
+Per-tier latency and token counts are exported through echo_metrics, and the
+usage ledger already reports spend per model, so thresholds can be tuned from
+real traffic.
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from services.llm_backends import LLMBackend, create_backend
+
+FAST = "fast"
+STRONG = "strong"
+# Routing disabled: everything goes to ECHO_MODEL
+DEFAULT = "default"
+
+
+@dataclass
+class RouteDecision:
+    tier: str
+    backend: LLMBackend
+    reasons: List[str] = field(default_factory=list)
+
+    @property
+    def model_name(self) -> str:
+        return self.backend.model_name
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"tier": self.tier, "model": self.model_name, "reasons": self.reasons}
+
+
+class ModelRouter:
+    """Picks the fast or strong model tier per request"""
+
+    def __init__(self, fast: Optional[LLMBackend], strong: Optional[LLMBackend],
+                 enabled: bool = False, message_tokens: int = 200,
+                 context_tokens: int = 4000, history_messages: int = 6,
+                 attachments: int = 1):
+        self.backends = {FAST: fast, STRONG: strong}
+        self.enabled = enabled and fast is not None and strong is not None
+        # Any threshold reached sends the request to the strong tier
+        self.thresholds = {
+            "message_tokens": message_tokens,
+            "context_tokens": context_tokens,
+            "history_messages": history_messages,
+            "attachments": attachments
+        }
+        self.stats = {FAST: 0, STRONG: 0, DEFAULT: 0}
+        self.reason_counts: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls, default_backend: Optional[LLMBackend]) -> "ModelRouter":
+        enabled = os.getenv('ECHO_MODEL_ROUTING', 'false').lower() == 'true'
+        fast = strong = default_backend
+        if enabled and default_backend is not None:
+            fast = cls._tier_backend(default_backend, os.getenv('ECHO_MODEL_FAST'))
+            strong = cls._tier_backend(default_backend, os.getenv('ECHO_MODEL_STRONG'))
+        return cls(
+            fast, strong, enabled=enabled,
+            message_tokens=int(os.getenv('ECHO_ROUTE_MESSAGE_TOKENS', '200')),
+            context_tokens=int(os.getenv('ECHO_ROUTE_CONTEXT_TOKENS', '4000')),
+            history_messages=int(os.getenv('ECHO_ROUTE_HISTORY_MESSAGES', '6')),
+            attachments=int(os.getenv('ECHO_ROUTE_ATTACHMENTS', '1'))
+        )
+
+    @staticmethod
+    def _tier_backend(default_backend: LLMBackend, model_name: Optional[str]) -> LLMBackend:
+        """Backend for a tier's model, sharing the default one where possible"""
+        if not model_name or model_name == default_backend.model_name:
+            return default_backend
+        backend = create_backend(model_name=model_name)
+        if backend is None:
+            print(f"⚠️  Could not initialize ECHO model tier {model_name}, using {default_backend.model_name}")
+            return default_backend
+        return backend
+
+    def classify(self, message_tokens: int, context_tokens: int,
+                 history_messages: int, attachments: int) -> Tuple[str, List[str]]:
+        """Tier for a request and the thresholds that put it there"""
+        measured = {
+            "message_tokens": message_tokens,
+            "context_tokens": context_tokens,
+            "history_messages": history_messages,
+            "attachments": attachments
+        }
+        reasons = [name for name, value in measured.items()
+                   if self.thresholds[name] and value >= self.thresholds[name]]
+        return (STRONG if reasons else FAST), reasons
+
+    def route(self, message_tokens: int = 0, context_tokens: int = 0,
+              history_messages: int = 0, attachments: int = 0,
+              tier: Optional[str] = None) -> RouteDecision:
+        """Route a request; `tier` skips classification"""
+        if not self.enabled:
+            self.stats[DEFAULT] += 1
+            return RouteDecision(DEFAULT, self.backends[FAST])
+        if tier is not None:
+            reasons = [f"{tier}_task"]
+        else:
+            tier, reasons = self.classify(
+                message_tokens, context_tokens, history_messages, attachments)
+        self.stats[tier] += 1
+        for reason in reasons:
+            self.reason_counts[reason] = self.reason_counts.get(reason, 0) + 1
+        return RouteDecision(tier, self.backends[tier], reasons)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "fast_model": self.backends[FAST].model_name if self.backends[FAST] else None,
+            "strong_model": self.backends[STRONG].model_name if self.backends[STRONG] else None,
+            "thresholds": self.thresholds,
+            "requests": dict(self.stats),
+            "strong_reasons": dict(self.reason_counts)
+        }
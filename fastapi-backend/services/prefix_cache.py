@@ -0,0 +1,155 @@
+"""
+Provider-side caching of the ECHO prompt prefix.
+
+Every chat request starts with the same system prompt followed by the course
+context, which only changes when course documents or course info change. The
+prefix is registered with the provider once per (course, model, prefix text)
+and later requests reuse the handle, so the provider does not re-process
+those tokens. A cached context is sent whole, so a course context too large
+for the prompt budget is cached rather than truncated, up to `max_tokens`.
+Backends without context caching (and prefixes below the provider's minimum
+size) simply send the full prompt.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+from services.llm_backends import LLMBackend
+from services.prompt_budget import estimate_tokens
+
+PrefixKey = Tuple[Optional[int], str, str]
+
+
+@dataclass
+class PrefixHandle:
+    key: PrefixKey
+    tokens: int
+    # Whatever the backend needs to generate against the cached prefix
+    provider_handle: Any
+    expires_at: float
+    # The backend that registered it, for routed model tiers
+    backend: Optional[LLMBackend] = None
+    created_at: float = field(default_factory=time.monotonic)
+
+
+class PrefixCache:
+    """Registry of provider-cached prompt prefixes, LRU-bounded"""
+
+    def __init__(self, backend: Optional[LLMBackend], enabled: bool = True,
+                 ttl_seconds: float = 3600, min_tokens: int = 32768,
+                 max_tokens: int = 131072, max_entries: int = 100):
+        self.backend = backend
+        self.enabled = enabled and backend is not None and backend.supports_prefix_cache
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        # Largest prefix cached whole instead of truncated to the prompt budget
+        self.max_tokens = max_tokens
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[PrefixKey, PrefixHandle]" = OrderedDict()
+        # Registrations in flight, so concurrent requests share one
+        self._pending: Dict[PrefixKey, asyncio.Task] = {}
+        self.stats = {"hits": 0, "misses": 0, "skipped": 0, "failures": 0,
+                      "evictions": 0, "tokens_saved": 0}
+
+    def _key(self, course_id: Optional[int], model_name: str, system_prompt: str, context_text: str) -> PrefixKey:
+        digest = hashlib.sha256(
+            (system_prompt + "\0" + context_text).encode("utf-8")).hexdigest()[:16]
+        return (course_id, model_name, digest)
+
+    async def get_or_create(self, course_id: Optional[int], system_prompt: str,
+                            context_text: Optional[str],
+                            backend: Optional[LLMBackend] = None) -> Optional[PrefixHandle]:
+        """Handle for this prefix on `backend` (default: the cache's own),
+        registering it with the provider if needed.
+
+        Returns None whenever the full prompt should be sent instead.
+        """
+        backend = backend or self.backend
+        if not self.enabled or not context_text or not backend.supports_prefix_cache:
+            return None
+        tokens = estimate_tokens(system_prompt) + estimate_tokens(context_text)
+        if not self.min_tokens <= tokens <= self.max_tokens:
+            # Below the provider's minimum cacheable size, or too large to
+            # send whole; the context is fitted to the prompt budget instead
+            self.stats["skipped"] += 1
+            return None
+
+        key = self._key(course_id, backend.model_name, system_prompt, context_text)
+        handle = self._entries.get(key)
+        if handle is not None and handle.expires_at > time.monotonic():
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            self.stats["tokens_saved"] += handle.tokens
+            return handle
+        if handle is not None:
+            self._remove(key)
+
+        self.stats["misses"] += 1
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._register(key, tokens, system_prompt, context_text, backend))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        # A cancelled request must not cancel a registration others wait on
+        return await asyncio.shield(task)
+
+    async def _register(self, key: PrefixKey, tokens: int, system_prompt: str,
+                        context_text: str, backend: LLMBackend) -> Optional[PrefixHandle]:
+        try:
+            provider_handle = await backend.create_prefix(
+                system_prompt, context_text, self.ttl_seconds)
+        except Exception as e:
+            self.stats["failures"] += 1
+            print(f"⚠️  Could not cache prompt prefix for course {key[0]}: {e}")
+            return None
+
+        # Stop using the handle a little before the provider drops it
+        handle = PrefixHandle(key, tokens, provider_handle,
+                              time.monotonic() + self.ttl_seconds * 0.95, backend)
+        self._entries[key] = handle
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+        return handle
+
+    def _remove(self, key: PrefixKey):
+        handle = self._entries.pop(key, None)
+        if handle is None:
+            return
+        # Free provider storage now rather than at TTL, without blocking the caller
+        try:
+            asyncio.get_running_loop().create_task(
+                self._delete(handle.backend or self.backend, handle.provider_handle))
+        except RuntimeError:
+            pass
+
+    async def _delete(self, backend: LLMBackend, provider_handle: Any):
+        try:
+            await backend.delete_prefix(provider_handle)
+        except Exception as e:
+            print(f"⚠️  Could not delete cached prompt prefix: {e}")
+
+    def discard(self, key: PrefixKey):
+        self._remove(key)
+
+    def invalidate_course(self, course_id: int):
+        """Drop every cached prefix for a course"""
+        for key in [k for k in self._entries if k[0] == course_id]:
+            self._remove(key)
+
+    def describe(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "min_tokens": self.min_tokens,
+            "max_tokens": self.max_tokens,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            **self.stats
+        }
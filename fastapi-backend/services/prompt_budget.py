@@ -0,0 +1,167 @@
+"""
+Token budgeting for ECHO prompt assembly.
+
+The prompt is split into the system prompt, the retrieved course context, the
+summary of earlier turns, the recent conversation history and the user
+message. The system prompt, the summary and the user message are always
+sent. Whatever budget is left is shared between context and history; the
+oldest history turns are dropped first and the context is truncated from the
+end. When the system prompt and context are held in a provider-side prefix
+cache they are neither truncated nor sent, and leave the whole budget to the
+summary, history and message: the provider does not process them again.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# Rough average for English text and code with Gemini's tokenizer
+CHARS_PER_TOKEN = 4
+# Gemini bills a fixed number of tokens per image part
+TOKENS_PER_IMAGE = 258
+
+CONTEXT_TRUNCATED_MARKER = "\n\n[Course context truncated to fit the prompt budget]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, no tokenizer call"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_part_tokens(part: Any) -> int:
+    """Estimate a single message part: text, or an inline image/blob dict"""
+    if isinstance(part, str):
+        return estimate_tokens(part)
+    return TOKENS_PER_IMAGE
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to roughly max_tokens, keeping the beginning"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    keep = max(0, max_tokens * CHARS_PER_TOKEN - len(CONTEXT_TRUNCATED_MARKER))
+    return text[:keep] + CONTEXT_TRUNCATED_MARKER
+
+
+@dataclass
+class BudgetReport:
+    budget: int
+    system_tokens: int = 0
+    context_tokens: int = 0
+    summary_tokens: int = 0
+    history_tokens: int = 0
+    user_tokens: int = 0
+    history_messages_sent: int = 0
+    history_messages_dropped: int = 0
+    context_truncated: bool = False
+    over_budget: bool = False
+    prefix_cached: bool = False
+
+    @property
+    def total_tokens(self) -> int:
+        return (self.system_tokens + self.context_tokens + self.summary_tokens
+                + self.history_tokens + self.user_tokens)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens_estimated": self.total_tokens,
+            "budget": self.budget,
+            "system": self.system_tokens,
+            "context": self.context_tokens,
+            "summary": self.summary_tokens,
+            "history": self.history_tokens,
+            "user": self.user_tokens,
+            "history_messages_sent": self.history_messages_sent,
+            "history_messages_dropped": self.history_messages_dropped,
+            "context_truncated": self.context_truncated,
+            "over_budget": self.over_budget,
+            "prefix_cached": self.prefix_cached
+        }
+
+
+@dataclass
+class PromptAssembler:
+    """Fits prompt parts into a token budget"""
+    # Input tokens allowed for the whole prompt
+    budget: int = 16000
+    # Share of the flexible budget the context may claim before history
+    context_share: float = 0.6
+    # Labels prepended to the context and summary text when they are sent
+    context_label: str = "Course Context:\n"
+    summary_label: str = "Summary of the earlier conversation:\n"
+
+    def assemble(self, system_prompt: str, context_text: Optional[str],
+                 history: List[Dict[str, str]], user_parts: List[Any],
+                 summary: Optional[str] = None,
+                 cached_prefix: bool = False) -> Tuple[List[Dict[str, Any]], BudgetReport]:
+        """Build the model conversation and report what it costs.
+
+        With `cached_prefix` the system prompt and context are already held by
+        the provider, so they are left out of the returned conversation.
+        """
+        report = BudgetReport(budget=self.budget, prefix_cached=cached_prefix)
+        report.system_tokens = estimate_tokens(system_prompt)
+        report.user_tokens = sum(estimate_part_tokens(p) for p in user_parts)
+        summary_text = self.summary_label + summary if summary else ""
+        report.summary_tokens = estimate_tokens(summary_text)
+
+        required = report.user_tokens + report.summary_tokens
+        if not cached_prefix:
+            required += report.system_tokens
+        flexible = self.budget - required
+        if flexible < 0:
+            # The required parts alone exceed the budget; send them anyway
+            report.over_budget = True
+            flexible = 0
+
+        context_full = self.context_label + context_text if context_text else ""
+        context_need = estimate_tokens(context_full)
+
+        # Context first gets its share (or less, if it is small), history
+        # takes what it needs of the rest, and any history leftover flows
+        # back to the context
+        context_reserved = min(context_need, int(flexible * self.context_share))
+        if cached_prefix:
+            # The cached context is not sent, history gets the whole budget
+            context_reserved = 0
+        history_budget = max(flexible - context_reserved, 0)
+
+        kept_history: List[Dict[str, str]] = []
+        for msg in reversed(history):
+            tokens = estimate_tokens(msg.get("content", ""))
+            if report.history_tokens + tokens > history_budget:
+                break
+            kept_history.append(msg)
+            report.history_tokens += tokens
+        kept_history.reverse()
+        report.history_messages_sent = len(kept_history)
+        report.history_messages_dropped = len(history) - len(kept_history)
+
+        context_budget = flexible - report.history_tokens
+        context_sent = ""
+        if cached_prefix:
+            report.context_tokens = context_need
+        elif context_full and context_budget > 0:
+            context_sent = truncate_to_tokens(context_full, context_budget)
+            report.context_truncated = context_sent != context_full
+            report.context_tokens = estimate_tokens(context_sent)
+        elif context_full:
+            report.context_truncated = True
+
+        conversation: List[Dict[str, Any]] = []
+        if not cached_prefix:
+            conversation.append({"role": "user", "parts": [system_prompt]})
+        if context_sent:
+            conversation.append({"role": "user", "parts": [context_sent]})
+        if summary_text:
+            conversation.append({"role": "user", "parts": [summary_text]})
+        for msg in kept_history:
+            conversation.append({
+                # Gemini calls the assistant side of the conversation "model"
+                "role": "model" if msg.get("role") == "assistant" else msg.get("role", "user"),
+                "parts": [msg.get("content", "")]
+            })
+        conversation.append({"role": "user", "parts": user_parts})
+        return conversation, report
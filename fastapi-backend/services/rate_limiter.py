@@ -0,0 +1,231 @@
+"""
+Token-bucket rate limiting for ECHO.
+
+Every request draws one token from a global bucket, a per-course bucket and a
+per-user bucket, all or nothing. Buckets live in Redis when REDIS_URL is set,
+so every worker shares the same budget, and fall back to process memory when
+Redis is not configured or not reachable. Async callers use `acquire`, which
+keeps the Redis round trip off the event loop.
+"""
+
+import asyncio
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+
+@dataclass(frozen=True)
+class BucketSpec:
+    """Bucket size and refill rate, in tokens and tokens per second"""
+    capacity: float
+    refill_rate: float
+
+
+@dataclass
+class RateLimitDecision:
+    allowed: bool
+    # Seconds until the limiting bucket holds a whole token again
+    retry_after: float = 0.0
+    # Which bucket refused the request: "global", "course" or "user"
+    scope: Optional[str] = None
+
+
+# (key, capacity, refill_rate) for each bucket a request must draw from
+BucketRequest = Tuple[str, float, float]
+
+
+class InMemoryBucketStore:
+    """Per-process bucket store, used when no shared store is available"""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, buckets: List[BucketRequest], now: float) -> Tuple[bool, float, int]:
+        """Take one token from every bucket, or none if any is empty.
+
+        Returns (allowed, retry_after, index of the slowest empty bucket).
+        """
+        with self._lock:
+            levels = []
+            retry_after, limiting = 0.0, -1
+            for index, (key, capacity, rate) in enumerate(buckets):
+                tokens, updated_at = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + max(0.0, now - updated_at) * rate)
+                levels.append(tokens)
+                if tokens < 1:
+                    wait = (1 - tokens) / rate
+                    if wait > retry_after:
+                        retry_after, limiting = wait, index
+
+            if limiting >= 0:
+                return False, retry_after, limiting
+
+            for (key, _, _), tokens in zip(buckets, levels):
+                self._buckets[key] = (tokens - 1, now)
+            return True, 0.0, -1
+
+
+# Same algorithm as InMemoryBucketStore.take, executed atomically in Redis.
+# KEYS: bucket keys; ARGV: now, then capacity and refill rate per key.
+TAKE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local levels = {}
+local retry_after = 0
+local limiting = -1
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local updated_at = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+    levels[i] = tokens
+    if tokens < 1 then
+        local wait = (1 - tokens) / rate
+        if wait > retry_after then
+            retry_after = wait
+            limiting = i - 1
+        end
+    end
+end
+if limiting >= 0 then
+    return {0, tostring(retry_after), limiting}
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[2 * i])
+    local rate = tonumber(ARGV[2 * i + 1])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - 1), 'ts', tostring(now))
+    redis.call('PEXPIRE', key, math.ceil(capacity / rate * 2000))
+end
+return {1, '0', -1}
+"""
+
+
+class RedisBucketStore:
+    """Bucket store shared by every worker through Redis"""
+
+    def __init__(self, client, key_prefix: str = "echo:ratelimit:"):
+        self.client = client
+        self.key_prefix = key_prefix
+        self._take = client.register_script(TAKE_SCRIPT)
+
+    def take(self, buckets: List[BucketRequest], now: float) -> Tuple[bool, float, int]:
+        keys = [self.key_prefix + key for key, _, _ in buckets]
+        args = [now]
+        for _, capacity, rate in buckets:
+            args.extend([capacity, rate])
+        allowed, retry_after, limiting = self._take(keys=keys, args=args)
+        return bool(allowed), float(retry_after), int(limiting)
+
+
+class TokenBucketRateLimiter:
+    """Global, per-course and per-user token buckets checked together"""
+
+    def __init__(self, global_spec: BucketSpec, course_spec: Optional[BucketSpec] = None,
+                 user_spec: Optional[BucketSpec] = None, store=None):
+        self.global_spec = global_spec
+        self.course_spec = course_spec
+        self.user_spec = user_spec
+        self.store = store or InMemoryBucketStore()
+        # Used when the shared store errors out mid-request
+        self.fallback_store = InMemoryBucketStore()
+
+    @classmethod
+    def from_env(cls) -> "TokenBucketRateLimiter":
+        """Build the limiter from ECHO_* environment variables"""
+        window = float(os.getenv('ECHO_RATE_WINDOW', '60'))
+
+        def spec(limit: float) -> Optional[BucketSpec]:
+            # A limit of 0 disables that bucket
+            return BucketSpec(limit, limit / window) if limit > 0 else None
+
+        global_spec = spec(float(os.getenv('ECHO_RATE_LIMIT', '10')))
+        if global_spec is None:
+            raise ValueError("ECHO_RATE_LIMIT must be positive")
+        return cls(
+            global_spec=global_spec,
+            course_spec=spec(float(os.getenv('ECHO_COURSE_RATE_LIMIT', '10'))),
+            user_spec=spec(float(os.getenv('ECHO_USER_RATE_LIMIT', '5'))),
+            store=cls._store_from_env()
+        )
+
+    @staticmethod
+    def _store_from_env():
+        redis_url = os.getenv('REDIS_URL')
+        if not redis_url:
+            return InMemoryBucketStore()
+        if not REDIS_AVAILABLE:
+            print("⚠️  redis package not installed. ECHO rate limits are per worker.")
+            return InMemoryBucketStore()
+        try:
+            client = redis.Redis.from_url(
+                redis_url, socket_timeout=0.25, socket_connect_timeout=0.25)
+            client.ping()
+            return RedisBucketStore(client)
+        except Exception as e:
+            print(f"⚠️  Redis unavailable ({e}). ECHO rate limits are per worker.")
+            return InMemoryBucketStore()
+
+    def _buckets_for(self, user_id: Optional[int], course_id: Optional[int]) -> Tuple[List[BucketRequest], List[str]]:
+        buckets = [("global", self.global_spec.capacity,
+                    self.global_spec.refill_rate)]
+        scopes = ["global"]
+        if course_id is not None and self.course_spec:
+            buckets.append((f"course:{course_id}", self.course_spec.capacity,
+                            self.course_spec.refill_rate))
+            scopes.append("course")
+        if user_id is not None and self.user_spec:
+            buckets.append((f"user:{user_id}", self.user_spec.capacity,
+                            self.user_spec.refill_rate))
+            scopes.append("user")
+        return buckets, scopes
+
+    def try_acquire(self, user_id: Optional[int] = None, course_id: Optional[int] = None) -> RateLimitDecision:
+        """Take a token from each applicable bucket, or report how long to wait"""
+        buckets, scopes = self._buckets_for(user_id, course_id)
+        now = time.time()
+        try:
+            allowed, retry_after, limiting = self.store.take(buckets, now)
+        except Exception as e:
+            print(f"⚠️  Rate limit store error, using local buckets: {e}")
+            allowed, retry_after, limiting = self.fallback_store.take(
+                buckets, now)
+
+        if allowed:
+            return RateLimitDecision(True)
+        return RateLimitDecision(False, round(retry_after, 3), scopes[limiting])
+
+    async def acquire(self, user_id: Optional[int] = None, course_id: Optional[int] = None) -> RateLimitDecision:
+        """try_acquire for the event loop; a Redis round trip runs in a worker thread"""
+        if isinstance(self.store, RedisBucketStore):
+            return await asyncio.to_thread(self.try_acquire, user_id, course_id)
+        return self.try_acquire(user_id, course_id)
+
+    def describe(self) -> Dict[str, object]:
+        """Limiter configuration for status reporting"""
+        def as_dict(spec: Optional[BucketSpec]):
+            if spec is None:
+                return None
+            return {"capacity": spec.capacity, "per_second": round(spec.refill_rate, 4)}
+
+        return {
+            "store": "redis" if isinstance(self.store, RedisBucketStore) else "memory",
+            "global": as_dict(self.global_spec),
+            "course": as_dict(self.course_spec),
+            "user": as_dict(self.user_spec)
+        }
+
+
+def retry_after_seconds(retry_after: float) -> int:
+    """Whole seconds for Retry-After headers and user-facing messages"""
+    return max(1, math.ceil(retry_after))
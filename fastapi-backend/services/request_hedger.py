@@ -0,0 +1,178 @@
+"""
+Hedged model calls for ECHO tail latency.
+
+Most calls produce their first token in a couple of seconds, but a few hang
+until the request timeout. With hedging on, a call that has produced nothing
+by the configured percentile of recent first-token latencies gets a second,
+identical attempt; whichever attempt finishes first is used and the other is
+cancelled.
+
+A hedge is only sent when there is room for it: a global rate-limit token, a
+free concurrency slot, an empty admission queue and a closed circuit breaker
+(checked by the caller), plus the hedge budget, which allows at most
+`budget` hedges per model call on average. That keeps the extra spend to a
+few percent while cutting the tail.
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+from services.echo_metrics import current_trace, echo_metrics
+
+# Called by an attempt when its first output arrives
+FirstOutput = Callable[[], None]
+AttemptFactory = Callable[[Optional[FirstOutput]], Awaitable[Any]]
+
+
+class _Attempt:
+    def __init__(self, factory: AttemptFactory):
+        self.started = time.monotonic()
+        self.first_output = asyncio.Event()
+        self.ttft: Optional[float] = None
+        self.task = asyncio.ensure_future(factory(self._on_first_output))
+
+    def _on_first_output(self):
+        if self.ttft is None:
+            self.ttft = time.monotonic() - self.started
+            self.first_output.set()
+
+    def elapsed(self) -> float:
+        return self.ttft if self.ttft is not None else time.monotonic() - self.started
+
+
+class RequestHedger:
+    """Sends a second attempt for calls slower than recent ones"""
+
+    def __init__(self, enabled: bool = False, percentile: float = 95.0,
+                 min_samples: int = 20, window: int = 200,
+                 min_delay: float = 1.0, budget: float = 0.05):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self.min_delay = min_delay
+        self.budget = budget
+        # Hedges earn `budget` credit per call and spend one each
+        self.max_credit = max(1.0, budget * min_samples)
+        self._credit = 0.0
+        # model name -> recent first-token latencies in seconds
+        self._latencies: Dict[str, Deque[float]] = {}
+        self.stats = {"calls": 0, "hedged": 0, "hedge_won": 0,
+                      "skipped_budget": 0, "skipped_capacity": 0}
+
+    @classmethod
+    def from_env(cls) -> "RequestHedger":
+        return cls(
+            enabled=os.getenv('ECHO_HEDGE_ENABLED', 'false').lower() == 'true',
+            percentile=float(os.getenv('ECHO_HEDGE_PERCENTILE', '95')),
+            min_samples=int(os.getenv('ECHO_HEDGE_MIN_SAMPLES', '20')),
+            window=int(os.getenv('ECHO_HEDGE_WINDOW', '200')),
+            min_delay=float(os.getenv('ECHO_HEDGE_MIN_DELAY', '1.0')),
+            budget=float(os.getenv('ECHO_HEDGE_BUDGET', '0.05'))
+        )
+
+    def observe(self, model_name: str, seconds: float):
+        samples = self._latencies.get(model_name)
+        if samples is None:
+            samples = self._latencies[model_name] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def hedge_delay(self, model_name: str) -> Optional[float]:
+        """Seconds to wait for first output before hedging; None until warmed up"""
+        samples = self._latencies.get(model_name)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        rank = min(len(ordered) - 1, math.ceil(self.percentile / 100 * len(ordered)) - 1)
+        return max(self.min_delay, ordered[max(rank, 0)])
+
+    async def run(self, model_name: str, attempt: AttemptFactory,
+                  hedge_attempt: Optional[AttemptFactory] = None,
+                  may_hedge: Optional[Callable[[], Awaitable[bool]]] = None) -> Any:
+        """Run `attempt`, racing `hedge_attempt` against it if it is slow.
+
+        `may_hedge` is asked just before hedging and takes whatever capacity
+        the hedge needs; it returns False if there is none.
+        """
+        if not self.enabled:
+            return await attempt(None)
+
+        self.stats["calls"] += 1
+        self._credit = min(self.max_credit, self._credit + self.budget)
+        delay = self.hedge_delay(model_name)
+        primary = _Attempt(attempt)
+        try:
+            if delay is not None:
+                waiter = asyncio.ensure_future(primary.first_output.wait())
+                done, _ = await asyncio.wait(
+                    {primary.task, waiter}, timeout=delay,
+                    return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if not done and await self._may_hedge(may_hedge):
+                    return await self._race(model_name, primary, hedge_attempt or attempt)
+            result = await primary.task
+            self.observe(model_name, primary.elapsed())
+            return result
+        finally:
+            if not primary.task.done():
+                primary.task.cancel()
+
+    async def _may_hedge(self, may_hedge: Optional[Callable[[], Awaitable[bool]]]) -> bool:
+        if self._credit < 1.0:
+            self.stats["skipped_budget"] += 1
+            return False
+        if may_hedge is not None and not await may_hedge():
+            self.stats["skipped_capacity"] += 1
+            return False
+        self._credit -= 1.0
+        return True
+
+    async def _race(self, model_name: str, primary: _Attempt, factory: AttemptFactory) -> Any:
+        """First successful attempt wins; the other is cancelled"""
+        self.stats["hedged"] += 1
+        hedge = _Attempt(factory)
+        attempts = {primary.task: primary, hedge.task: hedge}
+        pending = set(attempts)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        continue
+                    won = attempts[task] is hedge
+                    if won:
+                        self.stats["hedge_won"] += 1
+                    # The slow primary's latency is at least what it took so far
+                    self.observe(model_name, primary.elapsed())
+                    self._note(won)
+                    return task.result()
+            # Both failed; report the primary's error like an unhedged call
+            self._note(False)
+            raise primary.task.exception()
+        finally:
+            for task in attempts:
+                if not task.done():
+                    task.cancel()
+
+    @staticmethod
+    def _note(won: bool):
+        outcome = "won" if won else "lost"
+        echo_metrics.inc("echo_hedges_total", outcome=outcome)
+        trace = current_trace()
+        if trace is not None:
+            trace.hedge = outcome
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "budget": self.budget,
+            "delays": {model: round(delay, 3) for model in self._latencies
+                       if (delay := self.hedge_delay(model)) is not None},
+            **self.stats
+        }
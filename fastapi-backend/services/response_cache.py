@@ -0,0 +1,156 @@
+"""
+Response cache for ECHO answers.
+
+Answers are keyed by (course, normalized question, course context version),
+so a document change in a course naturally misses every older entry. An
+exact-match tier catches repeated questions; an optional near-duplicate tier
+compares word sets within the same course and context version.
+"""
+
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Optional, Tuple
+
+# Words that carry no meaning for near-duplicate matching. Question words and
+# negations stay out of it: "why is X" and "how is X" ask different questions
+STOPWORDS = frozenset("""
+a an the is are was were be been being am do does did of to in on at for from
+by with about as into and or but if then so than that this these those it its
+i me my we our you your he she they them
+can could would should will shall may might must please explain tell give
+""".split())
+
+CacheKey = Tuple[Optional[int], str, str]
+
+
+def normalize_question(question: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    question = re.sub(r"[^\w\s]", " ", question.lower())
+    return " ".join(question.split())
+
+
+def question_terms(normalized: str) -> FrozenSet[str]:
+    return frozenset(w for w in normalized.split() if w not in STOPWORDS)
+
+
+@dataclass
+class CacheEntry:
+    response: Dict[str, Any]
+    terms: FrozenSet[str]
+    created_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class CacheHit:
+    response: Dict[str, Any]
+    tier: str  # "exact" or "similar"
+    similarity: float
+    age_seconds: float
+
+
+class ResponseCache:
+    """In-process TTL + LRU cache of successful ECHO responses"""
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: float = 3600,
+                 similarity_enabled: bool = False, similarity_threshold: float = 0.85):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_enabled = similarity_enabled
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[CacheKey, CacheEntry]" = OrderedDict()
+        # (course_id, version) -> keys, for near-duplicate lookup and invalidation
+        self._by_course: Dict[Tuple[Optional[int], str], set] = {}
+        self.stats = {"exact_hits": 0, "similar_hits": 0,
+                      "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _remove(self, key: CacheKey):
+        self._entries.pop(key, None)
+        group = self._by_course.get(key[:2])
+        if group is not None:
+            group.discard(key)
+            if not group:
+                del self._by_course[key[:2]]
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.created_at > self.ttl_seconds
+
+    def get(self, course_id: Optional[int], version: str, question: str) -> Optional[CacheHit]:
+        """Look up an answer, trying the exact tier first"""
+        now = time.monotonic()
+        normalized = normalize_question(question)
+        key = (course_id, version, normalized)
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if self._expired(entry, now):
+                self._remove(key)
+            else:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return CacheHit(entry.response, "exact", 1.0, now - entry.created_at)
+
+        if self.similarity_enabled:
+            hit = self._find_similar(course_id, version, normalized, now)
+            if hit is not None:
+                self.stats["similar_hits"] += 1
+                return hit
+
+        self.stats["misses"] += 1
+        return None
+
+    def _find_similar(self, course_id: Optional[int], version: str, normalized: str, now: float) -> Optional[CacheHit]:
+        terms = question_terms(normalized)
+        if not terms:
+            return None
+
+        best_key, best_score = None, 0.0
+        for key in list(self._by_course.get((course_id, version), ())):
+            entry = self._entries[key]
+            if self._expired(entry, now):
+                self._remove(key)
+                continue
+            if not entry.terms:
+                continue
+            score = len(terms & entry.terms) / len(terms | entry.terms)
+            if score > best_score:
+                best_key, best_score = key, score
+
+        if best_key is None or best_score < self.similarity_threshold:
+            return None
+        self._entries.move_to_end(best_key)
+        entry = self._entries[best_key]
+        return CacheHit(entry.response, "similar", round(best_score, 3), now - entry.created_at)
+
+    def put(self, course_id: Optional[int], version: str, question: str, response: Dict[str, Any]):
+        """Store a successful response, evicting the least recently used entries"""
+        normalized = normalize_question(question)
+        key = (course_id, version, normalized)
+        self._remove(key)
+        self._entries[key] = CacheEntry(response, question_terms(normalized))
+        self._by_course.setdefault(key[:2], set()).add(key)
+
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.stats["evictions"] += 1
+
+    def invalidate_course(self, course_id: int):
+        """Drop every cached answer for a course, whatever its context version"""
+        for group_key in [g for g in self._by_course if g[0] == course_id]:
+            for key in list(self._by_course.get(group_key, ())):
+                self._remove(key)
+        self.stats["invalidations"] += 1
+
+    def describe(self) -> Dict[str, Any]:
+        hits = self.stats["exact_hits"] + self.stats["similar_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_enabled": self.similarity_enabled,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            **self.stats
+        }
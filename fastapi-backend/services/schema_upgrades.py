@@ -0,0 +1,81 @@
+"""
+Startup schema upgrades for ECHO.
+
+The backend has no migration tool, and create_all never changes a table that
+already exists (and main.py's create_all does not see the models). Tables
+that ECHO added, and its columns and indexes on existing tables, are
+therefore created here when they are missing. `ensure_echo_schema()` only
+adds what is missing, so it is safe to run on every startup.
+"""
+
+from typing import List
+
+from sqlalchemy import Column, Index, Table, inspect, text
+
+from database import engine
+from models import ChatMessage, ChatSession, CourseAnalysis, EchoJob, LLMUsageEvent, LLMUsageHourly
+
+# Tables added for ECHO
+TABLES: List[Table] = [
+    CourseAnalysis.__table__,
+    LLMUsageEvent.__table__,
+    LLMUsageHourly.__table__,
+    EchoJob.__table__,
+]
+
+# Columns added to tables that existing deployments already have
+COLUMNS: List[Column] = [
+    ChatSession.__table__.c.summary,
+    ChatSession.__table__.c.summarized_through_id,
+    CourseAnalysis.__table__.c.document_version,
+]
+
+# Indexes the chat history queries rely on
+INDEXES: List[Index] = [
+    index
+    for table in (ChatSession.__table__, ChatMessage.__table__)
+    for index in table.indexes
+    if index.name in ("ix_chat_sessions_user_updated", "ix_chatbot_messages_session_timestamp")
+]
+
+
+def _add_column_sql(column: Column, dialect) -> str:
+    ddl = (f"ALTER TABLE {column.table.name} ADD COLUMN {column.name} "
+           f"{column.type.compile(dialect=dialect)}")
+    default = column.default
+    if default is not None and default.is_scalar:
+        ddl += f" DEFAULT {default.arg!r}"
+    return ddl
+
+
+def ensure_echo_schema() -> List[str]:
+    """Add the ECHO tables, columns and indexes missing from this database.
+
+    Returns what was added, as "table", "table.column" or the index name.
+    """
+    added = []
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        for table in TABLES:
+            if not inspector.has_table(table.name):
+                table.create(bind=conn)
+                added.append(table.name)
+        existing = {}
+        for column in COLUMNS:
+            table = column.table.name
+            if table not in existing:
+                if not inspector.has_table(table):
+                    # Not created yet; the table is made with every column
+                    continue
+                existing[table] = {c["name"] for c in inspector.get_columns(table)}
+            if column.name not in existing[table]:
+                conn.execute(text(_add_column_sql(column, conn.dialect)))
+                added.append(f"{table}.{column.name}")
+        for index in INDEXES:
+            table = index.table.name
+            if not inspector.has_table(table):
+                continue
+            if index.name not in {i["name"] for i in inspector.get_indexes(table)}:
+                index.create(bind=conn)
+                added.append(index.name)
+    return added
@@ -0,0 +1,124 @@
+"""
+In-process cache of active ECHO chat sessions.
+
+A follow-up message in an ongoing conversation needs the session row, the
+course info and the recent history. Those are kept here per session and
+updated write-through whenever the chat endpoint saves messages. A hit is
+still checked against the session row (one primary-key read of
+`updated_at`, owner and `is_active`), so a session deleted or written to by
+another worker is reloaded instead of served stale. Entries also expire
+after a TTL.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+
+@dataclass
+class CachedSession:
+    """Snapshot of a chat session and the state the chat endpoint needs"""
+    id: int
+    user_id: int
+    course_id: Optional[int]
+    summary: Optional[str] = None
+    summarized_through_id: int = 0
+    # ChatSession.updated_at when cached; any write elsewhere changes it
+    updated_at: Optional[datetime] = None
+    # Course info for `info_course_id`, which is the course of the last request
+    info_course_id: Optional[int] = None
+    course_info: Optional[Dict[str, Any]] = None
+    # Most recent messages as {'id', 'role', 'content'}, oldest first
+    history: Deque[Dict[str, Any]] = field(default_factory=deque)
+    cached_at: float = field(default_factory=time.monotonic)
+
+    def unsummarized_count(self) -> int:
+        """Cached turns not yet folded into the summary (capped by the history size)"""
+        return sum(1 for m in self.history
+                   if m['id'] > (self.summarized_through_id or 0))
+
+    def recent_history(self, limit: int) -> List[Dict[str, str]]:
+        """Unsummarized turns in chronological order, at most `limit`"""
+        messages = [m for m in self.history
+                    if m['id'] > (self.summarized_through_id or 0)]
+        return [{'role': m['role'], 'content': m['content']}
+                for m in messages[-limit:]]
+
+
+class ChatSessionCache:
+    """TTL + LRU map of session id -> CachedSession"""
+
+    def __init__(self, max_sessions: int = 500, ttl_seconds: float = 300,
+                 history_size: int = 10):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.history_size = history_size
+        self._sessions: "OrderedDict[int, CachedSession]" = OrderedDict()
+        # Background summary tasks update entries from worker threads
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, session_id: int, user_id: int) -> Optional[CachedSession]:
+        """Cached session if present, fresh and owned by the user"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None and time.monotonic() - entry.cached_at > self.ttl_seconds:
+                del self._sessions[session_id]
+                entry = None
+            if entry is None or entry.user_id != user_id:
+                self.stats["misses"] += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.stats["hits"] += 1
+            return entry
+
+    def put(self, entry: CachedSession):
+        with self._lock:
+            entry.history = deque(entry.history, maxlen=self.history_size)
+            entry.cached_at = time.monotonic()
+            self._sessions[entry.id] = entry
+            self._sessions.move_to_end(entry.id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def append_messages(self, session_id: int, messages: List[Dict[str, Any]],
+                        updated_at: Optional[datetime] = None):
+        """Write-through after messages were committed"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry.history.extend(messages)
+                entry.updated_at = updated_at
+
+    def update_summary(self, session_id: int, summary: str, through_id: int):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry.summary = summary
+                entry.summarized_through_id = through_id
+
+    def invalidate(self, session_id: int):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def describe(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0,
+            **self.stats
+        }
+
+
+session_cache = ChatSessionCache(
+    max_sessions=int(os.getenv('ECHO_SESSION_CACHE_SIZE', '500')),
+    ttl_seconds=float(os.getenv('ECHO_SESSION_CACHE_TTL', '300')),
+    history_size=int(os.getenv('ECHO_SESSION_CACHE_HISTORY', '10'))
+)
@@ -0,0 +1,256 @@
+"""
+LLM usage ledger and token quotas.
+
+Every ECHO model call (and every answer served from the cache) is written to
+llm_usage_events, and in the same transaction added to an hourly rollup per
+user, course and model. Reports and quota checks only read the rollups, never
+the events or the message metadata JSON.
+
+Quotas are daily token allowances per user and per course (UTC days). Over
+the soft quota requests still go through at background priority; over the
+hard quota they are refused until the day ends.
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import LLMUsageEvent, LLMUsageHourly
+
+
+@dataclass
+class UsageRecord:
+    model: str
+    kind: str  # chat, chat_files, analysis, summary
+    user_id: Optional[int] = None
+    course_id: Optional[int] = None
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    latency_ms: float = 0.0
+    cache_hit: bool = False
+    success: bool = True
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.response_tokens
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_to_rollup(db, record: UsageRecord, hour: datetime):
+    bucket = db.query(LLMUsageHourly).filter(
+        LLMUsageHourly.hour == hour,
+        LLMUsageHourly.user_id == (record.user_id or 0),
+        LLMUsageHourly.course_id == (record.course_id or 0),
+        LLMUsageHourly.model == record.model
+    )
+    # Increment in SQL so concurrent writers do not lose updates
+    updated = bucket.update({
+        LLMUsageHourly.requests: LLMUsageHourly.requests + 1,
+        LLMUsageHourly.cache_hits: LLMUsageHourly.cache_hits + int(record.cache_hit),
+        LLMUsageHourly.failures: LLMUsageHourly.failures + int(not record.success),
+        LLMUsageHourly.prompt_tokens: LLMUsageHourly.prompt_tokens + record.prompt_tokens,
+        LLMUsageHourly.response_tokens: LLMUsageHourly.response_tokens + record.response_tokens,
+        LLMUsageHourly.total_tokens: LLMUsageHourly.total_tokens + record.total_tokens,
+        LLMUsageHourly.latency_ms_total: LLMUsageHourly.latency_ms_total + record.latency_ms
+    }, synchronize_session=False)
+    if not updated:
+        db.add(LLMUsageHourly(
+            hour=hour,
+            user_id=record.user_id or 0,
+            course_id=record.course_id or 0,
+            model=record.model,
+            requests=1,
+            cache_hits=int(record.cache_hit),
+            failures=int(not record.success),
+            prompt_tokens=record.prompt_tokens,
+            response_tokens=record.response_tokens,
+            total_tokens=record.total_tokens,
+            latency_ms_total=record.latency_ms
+        ))
+
+
+def record_usage(record: UsageRecord):
+    """Write one usage event and fold it into its hourly rollup"""
+    hour = hour_bucket(datetime.utcnow())
+    db = SessionLocal()
+    try:
+        for attempt in range(2):
+            db.add(LLMUsageEvent(
+                user_id=record.user_id,
+                course_id=record.course_id,
+                model=record.model,
+                kind=record.kind,
+                prompt_tokens=record.prompt_tokens,
+                response_tokens=record.response_tokens,
+                total_tokens=record.total_tokens,
+                latency_ms=record.latency_ms,
+                cache_hit=record.cache_hit,
+                success=record.success
+            ))
+            _add_to_rollup(db, record, hour)
+            try:
+                db.commit()
+                return
+            except IntegrityError:
+                # Another worker created the bucket first; update it instead
+                db.rollback()
+    except Exception as e:
+        db.rollback()
+        print(f"Error recording LLM usage: {e}")
+    finally:
+        db.close()
+
+
+GROUP_COLUMNS = {
+    "user": LLMUsageHourly.user_id,
+    "course": LLMUsageHourly.course_id,
+    "model": LLMUsageHourly.model,
+    "hour": LLMUsageHourly.hour,
+}
+
+
+def usage_report(db, start: datetime, end: datetime, group_by: List[str],
+                 user_id: Optional[int] = None, course_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Aggregate the hourly rollups over [start, end) by the given dimensions"""
+    columns = [GROUP_COLUMNS[name].label(name) for name in group_by]
+    query = db.query(
+        *columns,
+        func.sum(LLMUsageHourly.requests).label("requests"),
+        func.sum(LLMUsageHourly.cache_hits).label("cache_hits"),
+        func.sum(LLMUsageHourly.failures).label("failures"),
+        func.sum(LLMUsageHourly.prompt_tokens).label("prompt_tokens"),
+        func.sum(LLMUsageHourly.response_tokens).label("response_tokens"),
+        func.sum(LLMUsageHourly.total_tokens).label("total_tokens"),
+        func.sum(LLMUsageHourly.latency_ms_total).label("latency_ms_total")
+    ).filter(LLMUsageHourly.hour >= start, LLMUsageHourly.hour < end)
+    if user_id is not None:
+        query = query.filter(LLMUsageHourly.user_id == user_id)
+    if course_id is not None:
+        query = query.filter(LLMUsageHourly.course_id == course_id)
+    if group_by:
+        query = query.group_by(*[GROUP_COLUMNS[name] for name in group_by]).order_by(
+            func.sum(LLMUsageHourly.total_tokens).desc())
+
+    rows = []
+    for row in query.all():
+        data = row._asdict()
+        requests = data["requests"] or 0
+        latency_total = data.pop("latency_ms_total") or 0.0
+        data["avg_latency_ms"] = round(latency_total / requests, 1) if requests else 0.0
+        rows.append(data)
+    return rows
+
+
+@dataclass
+class QuotaStatus:
+    state: str  # ok, soft or hard
+    scope: Optional[str] = None  # user or course
+    used: int = 0
+    limit: int = 0
+    resets_in: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "scope": self.scope,
+            "used_tokens": self.used,
+            "limit_tokens": self.limit,
+            "resets_in": round(self.resets_in)
+        }
+
+
+class UsageQuota:
+    """Daily token quotas per user and per course, read from the rollups.
+
+    Totals are re-read at most every `refresh_seconds` per user or course, and
+    bumped locally as usage is recorded in between.
+    """
+
+    def __init__(self, user_soft: int = 0, user_hard: int = 0,
+                 course_soft: int = 0, course_hard: int = 0,
+                 refresh_seconds: float = 60):
+        self.limits = {"user": (user_soft, user_hard),
+                       "course": (course_soft, course_hard)}
+        self.refresh_seconds = refresh_seconds
+        # (scope, id) -> (day, tokens used, read at)
+        self._totals: Dict[Tuple[str, int], Tuple[datetime, int, float]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "UsageQuota":
+        return cls(
+            user_soft=int(os.getenv('ECHO_USER_DAILY_TOKENS_SOFT', '0')),
+            user_hard=int(os.getenv('ECHO_USER_DAILY_TOKENS_HARD', '0')),
+            course_soft=int(os.getenv('ECHO_COURSE_DAILY_TOKENS_SOFT', '0')),
+            course_hard=int(os.getenv('ECHO_COURSE_DAILY_TOKENS_HARD', '0')),
+            refresh_seconds=float(os.getenv('ECHO_QUOTA_REFRESH_SECONDS', '60'))
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return any(soft or hard for soft, hard in self.limits.values())
+
+    def _used_today(self, scope: str, entity_id: int, today: datetime) -> int:
+        key = (scope, entity_id)
+        with self._lock:
+            cached = self._totals.get(key)
+            if cached and cached[0] == today and time.monotonic() - cached[2] < self.refresh_seconds:
+                return cached[1]
+
+        column = GROUP_COLUMNS[scope]
+        db = SessionLocal()
+        try:
+            used = db.query(func.coalesce(func.sum(LLMUsageHourly.total_tokens), 0)).filter(
+                column == entity_id, LLMUsageHourly.hour >= today).scalar()
+        finally:
+            db.close()
+        with self._lock:
+            self._totals[key] = (today, int(used), time.monotonic())
+        return int(used)
+
+    def check(self, user_id: Optional[int], course_id: Optional[int]) -> QuotaStatus:
+        """Worst quota state across the user and course; reads the database"""
+        now = datetime.utcnow()
+        today = day_start(now)
+        resets_in = (today + timedelta(days=1) - now).total_seconds()
+        worst = QuotaStatus("ok")
+        for scope, entity_id in (("user", user_id), ("course", course_id)):
+            soft, hard = self.limits[scope]
+            if not entity_id or not (soft or hard):
+                continue
+            used = self._used_today(scope, entity_id, today)
+            if hard and used >= hard:
+                return QuotaStatus("hard", scope, used, hard, resets_in)
+            if soft and used >= soft and worst.state == "ok":
+                worst = QuotaStatus("soft", scope, used, soft, resets_in)
+        return worst
+
+    def add(self, record: UsageRecord):
+        """Count newly recorded usage before the next refresh"""
+        today = day_start(datetime.utcnow())
+        with self._lock:
+            for key in (("user", record.user_id), ("course", record.course_id)):
+                cached = self._totals.get(key)
+                if key[1] and cached and cached[0] == today:
+                    self._totals[key] = (today, cached[1] + record.total_tokens, cached[2])
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "user_daily_tokens": {"soft": self.limits["user"][0], "hard": self.limits["user"][1]},
+            "course_daily_tokens": {"soft": self.limits["course"][0], "hard": self.limits["course"][1]}
+        }
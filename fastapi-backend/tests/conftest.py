@@ -0,0 +1,61 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# Tests import the backend modules the way main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# A throwaway database and the local model stub, set before anything
+# reads the configuration
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(
+    tempfile.mkdtemp(prefix="echo-tests-"), "echo.db"))
+os.environ.setdefault("ECHO_BACKEND", "stub")
+os.environ.setdefault("ECHO_STUB_LATENCY_MS", "0")
+os.environ.setdefault("ECHO_STUB_JITTER_MS", "0")
+
+
+@pytest.fixture
+def service():
+    """A GeminiService on the local stub backend"""
+    from services.gemini_service import GeminiService
+    return GeminiService()
+
+
+@pytest.fixture
+def db():
+    """A session on freshly created tables, dropped again afterwards"""
+    import database
+    import models
+    models.Base.metadata.create_all(bind=database.engine)
+    session = database.SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        models.Base.metadata.drop_all(bind=database.engine)
+
+
+@pytest.fixture
+def client(db):
+    """The app without its lifespan, on the test database"""
+    from fastapi.testclient import TestClient
+    import main
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def make_user(db):
+    """Create a user; returns it with the headers that authenticate as it"""
+    from auth import create_access_token
+    from models import User
+
+    def make(username="student", role="student", **fields):
+        user = User(username=username, email=f"{username}@example.com",
+                    hashed_password="not-a-hash", role=role, **fields)
+        db.add(user)
+        db.commit()
+        token = create_access_token({"sub": username})
+        return user, {"Authorization": f"Bearer {token}"}
+    return make
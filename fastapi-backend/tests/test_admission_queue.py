@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from services.admission_queue import AdmissionQueue, AdmissionRejected, Priority
+from services.rate_limiter import BucketSpec, TokenBucketRateLimiter
+
+
+def make_queue(capacity=1, refill_rate=20.0, max_depth=100):
+    limiter = TokenBucketRateLimiter(global_spec=BucketSpec(capacity, refill_rate))
+    return AdmissionQueue(limiter, max_depth=max_depth)
+
+
+def test_admits_immediately_while_tokens_last():
+    async def run():
+        queue = make_queue(capacity=2)
+        return [await queue.admit(Priority.INTERACTIVE) for _ in range(2)]
+
+    assert [admission.queued for admission in asyncio.run(run())] == [False, False]
+
+
+def test_waiters_are_admitted_in_priority_then_arrival_order():
+    async def run():
+        queue = make_queue()
+        await queue.admit(Priority.INTERACTIVE)
+        order = []
+
+        async def request(name, priority):
+            admission = await queue.admit(priority, deadline=5)
+            assert admission.queued
+            order.append(name)
+
+        tasks = []
+        for name, priority in [("background", Priority.BACKGROUND),
+                               ("chat-1", Priority.INTERACTIVE),
+                               ("urgent", Priority.URGENT),
+                               ("chat-2", Priority.INTERACTIVE)]:
+            tasks.append(asyncio.create_task(request(name, priority)))
+            # Let each one join the queue before the next arrives
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["urgent", "chat-1", "chat-2", "background"]
+
+
+def test_sheds_up_front_when_the_wait_exceeds_the_deadline():
+    async def run():
+        queue = make_queue(refill_rate=0.1)
+        await queue.admit(Priority.INTERACTIVE)
+        with pytest.raises(AdmissionRejected) as exc:
+            await queue.admit(Priority.INTERACTIVE, deadline=1)
+        return queue, exc.value
+
+    queue, rejected = asyncio.run(run())
+    assert rejected.reason == "deadline" and rejected.scope == "global"
+    assert rejected.retry_after == pytest.approx(10, abs=0.1)
+    assert queue.depth == 0
+
+
+def test_sheds_a_waiter_whose_deadline_passes_in_the_queue():
+    async def run():
+        queue = make_queue(refill_rate=0.2)
+        await queue.admit(Priority.INTERACTIVE)
+        # Waits: the next token is five seconds away, inside its deadline
+        first = asyncio.create_task(queue.admit(Priority.INTERACTIVE, deadline=30))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as exc:
+            await queue.admit(Priority.INTERACTIVE, deadline=0.05)
+        depth_after_shed = queue.depth
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return exc.value, depth_after_shed, queue.depth
+
+    rejected, depth_after_shed, final_depth = asyncio.run(run())
+    assert rejected.reason == "deadline"
+    assert depth_after_shed == 1
+    assert final_depth == 0
+
+
+def test_rejects_when_the_queue_is_full():
+    async def run():
+        queue = make_queue(refill_rate=0.2, max_depth=1)
+        await queue.admit(Priority.INTERACTIVE)
+        waiter = asyncio.create_task(queue.admit(Priority.INTERACTIVE, deadline=30))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as exc:
+            await queue.admit(Priority.URGENT, deadline=30)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return exc.value
+
+    rejected = asyncio.run(run())
+    assert rejected.reason == "queue_full"
+    assert rejected.retry_after == pytest.approx(5)
+
+
+class SlowLimiter(TokenBucketRateLimiter):
+    """Limiter whose store answers slowly, like a Redis round trip"""
+
+    def __init__(self, *args, delay=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+        self.granted = 0
+
+    async def acquire(self, user_id=None, course_id=None):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        decision = self.try_acquire(user_id, course_id)
+        self.granted += decision.allowed
+        return decision
+
+
+def test_token_taken_for_a_shed_waiter_goes_to_the_next_one():
+    async def run():
+        limiter = SlowLimiter(global_spec=BucketSpec(1, 20))
+        queue = AdmissionQueue(limiter)
+        await queue.admit(Priority.INTERACTIVE)
+
+        # Its deadline passes while the dispatcher is taking its token
+        shed = asyncio.create_task(queue.admit(Priority.URGENT, deadline=0.06))
+        await asyncio.sleep(0)
+        limiter.delay = 0.1
+        waiting = asyncio.create_task(queue.admit(Priority.INTERACTIVE, deadline=5))
+        results = await asyncio.gather(shed, waiting, return_exceptions=True)
+        return limiter.granted, results, queue.depth
+
+    granted, (shed, admitted), depth = asyncio.run(run())
+    assert isinstance(shed, AdmissionRejected) and admitted.queued
+    # One token for the fast path and one for the waiter, none wasted
+    assert granted == 2
+    assert depth == 0
+
+
+def test_deadline_shedding_reports_the_bucket_that_held_the_request():
+    async def run():
+        limiter = TokenBucketRateLimiter(
+            global_spec=BucketSpec(10, 10), user_spec=BucketSpec(1, 0.1))
+        queue = AdmissionQueue(limiter)
+        await queue.admit(Priority.INTERACTIVE, user_id=1)
+        first = asyncio.create_task(
+            queue.admit(Priority.INTERACTIVE, user_id=1, deadline=30))
+        await asyncio.sleep(0)
+
+        with pytest.raises(AdmissionRejected) as exc:
+            await queue.admit(Priority.INTERACTIVE, user_id=1, deadline=0.1)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        return exc.value
+
+    rejected = asyncio.run(run())
+    assert rejected.reason == "deadline" and rejected.scope == "user"
+    assert rejected.retry_after == pytest.approx(10, abs=0.5)
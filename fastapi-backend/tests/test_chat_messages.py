@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import ChatMessage, ChatSession
+
+
+@pytest.fixture
+def transcript(db, make_user):
+    user, headers = make_user("student")
+    session = ChatSession(user_id=user.id, session_name="Heaps")
+    db.add(session)
+    db.commit()
+    start = datetime(2024, 3, 5, 9, 0, 0)
+    # Pairs share a timestamp, as save_exchange writes them
+    db.add_all([ChatMessage(session_id=session.id, role=role, content=f"message {i}",
+                            timestamp=start + timedelta(minutes=i // 2),
+                            message_metadata={"turn": i // 2})
+                for i, role in enumerate(["user", "assistant"] * 3)])
+    db.commit()
+    return f"/api/chatbot/sessions/{session.id}/messages", headers
+
+
+def contents(response):
+    return [m["content"] for m in response.json()]
+
+
+def test_whole_transcript_without_paging(client, transcript):
+    url, headers = transcript
+    response = client.get(url, headers=headers)
+
+    assert contents(response) == [f"message {i}" for i in range(6)]
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_pages_walk_back_from_the_newest_message(client, transcript):
+    url, headers = transcript
+    pages, params = [], {"limit": 4}
+    while True:
+        response = client.get(url, headers=headers, params=params)
+        pages.append(contents(response))
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params = {"limit": 4, "before_id": cursor}
+
+    assert pages == [[f"message {i}" for i in range(2, 6)], ["message 0", "message 1"]]
+
+
+def test_fields_select_the_returned_columns(client, transcript):
+    url, headers = transcript
+    response = client.get(url, headers=headers, params={"fields": "role,content", "limit": 2})
+
+    assert response.json() == [{"role": "user", "content": "message 4"},
+                               {"role": "assistant", "content": "message 5"}]
+    # The cursor is still the id of the oldest message on the page
+    before_id = int(response.headers["X-Next-Cursor"])
+    older = client.get(url, headers=headers,
+                       params={"fields": "id,metadata", "before_id": before_id, "limit": 2})
+    assert [m["metadata"] for m in older.json()] == [{"turn": 1}, {"turn": 1}]
+    assert all(m["id"] < before_id for m in older.json())
+
+
+def test_unknown_fields_are_rejected(client, transcript):
+    url, headers = transcript
+    response = client.get(url, headers=headers, params={"fields": "content,secret"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown message fields: secret"
+
+
+def test_other_users_cannot_read_the_transcript(client, transcript, make_user):
+    url, _ = transcript
+    _, headers = make_user("other")
+    assert client.get(url, headers=headers).status_code == 404
@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import circuit_breaker
+from services.circuit_breaker import CircuitBreaker, CircuitOpenError, CircuitState
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock the test moves by hand"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(circuit_breaker, "time",
+                        SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=30)
+
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.is_open()
+    with pytest.raises(CircuitOpenError) as exc:
+        breaker.before_call()
+    assert exc.value.retry_after == 30
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2)
+
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+
+
+def test_half_open_after_recovery_timeout_allows_limited_trials(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=30,
+                             half_open_max_calls=1)
+    breaker.record_failure()
+
+    clock.value += 10
+    assert breaker.retry_after() == 20
+    clock.value += 20
+    assert breaker.state == CircuitState.HALF_OPEN
+    assert not breaker.is_open()
+
+    breaker.before_call()
+    # The only trial call is taken
+    assert breaker.is_open()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_trial_success_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=5)
+    breaker.record_failure()
+    clock.value += 5
+
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    breaker.before_call()
+
+
+def test_half_open_trial_failure_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=5)
+    for _ in range(3):
+        breaker.record_failure()
+    clock.value += 5
+
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert breaker.retry_after() == 5
+    assert breaker.snapshot()["times_opened"] == 2
+
+
+def test_released_trial_call_can_be_retaken(clock):
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=5)
+    breaker.record_failure()
+    clock.value += 5
+
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
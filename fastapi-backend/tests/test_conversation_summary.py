@@ -0,0 +1,75 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from models import ChatMessage, ChatSession
+from services import conversation_summary
+
+
+class FakeSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    async def summarize_conversation(self, summary, messages):
+        self.calls.append((summary, [m["id"] for m in messages]))
+        return f"{summary or ''}[{messages[0]['id']}-{messages[-1]['id']}]"
+
+
+@pytest.fixture
+def summarizer(monkeypatch):
+    fake = FakeSummarizer()
+    monkeypatch.setattr(conversation_summary, "get_gemini_service", lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def long_session(db):
+    updated_at = datetime(2024, 3, 5, 9, 0, 0)
+    session = ChatSession(user_id=1, session_name="Heaps", updated_at=updated_at)
+    db.add(session)
+    db.commit()
+    for i in range(20):
+        db.add(ChatMessage(session_id=session.id,
+                           role="user" if i % 2 == 0 else "assistant",
+                           content=f"turn {i}"))
+    db.commit()
+    ids = [m.id for m in db.query(ChatMessage.id).order_by(ChatMessage.id)]
+    return session.id, ids, updated_at
+
+
+def test_folds_all_but_the_recent_turns(db, summarizer, long_session):
+    session_id, ids, updated_at = long_session
+
+    summary = asyncio.run(conversation_summary.refresh_session_summary(session_id))
+
+    keep = conversation_summary.KEEP_VERBATIM
+    assert summarizer.calls == [(None, ids[:-keep])]
+    db.expire_all()
+    session = db.get(ChatSession, session_id)
+    assert session.summary == summary == f"[{ids[0]}-{ids[-keep - 1]}]"
+    assert session.summarized_through_id == ids[-keep - 1]
+    # Not activity in the session: the list order and cache key are unchanged
+    assert session.updated_at == updated_at
+
+    # Nothing new to fold until another batch of turns piles up
+    assert asyncio.run(conversation_summary.refresh_session_summary(session_id)) is None
+    assert len(summarizer.calls) == 1
+
+
+def test_long_backlog_is_folded_in_chunks(db, summarizer, long_session, monkeypatch):
+    session_id, ids, _ = long_session
+    monkeypatch.setattr(conversation_summary, "FOLD_CHUNK", 5)
+
+    summary = asyncio.run(conversation_summary.refresh_session_summary(session_id))
+
+    # 14 turns to fold, oldest first, each call extending the summary
+    assert [folded for _, folded in summarizer.calls] == [ids[0:5], ids[5:10], ids[10:14]]
+    assert summarizer.calls[1][0] == f"[{ids[0]}-{ids[4]}]"
+    assert summary.endswith(f"[{ids[10]}-{ids[13]}]")
+
+
+def test_short_sessions_are_not_summarized(db, summarizer):
+    assert not conversation_summary.summary_due(conversation_summary.KEEP_VERBATIM)
+    assert conversation_summary.messages_to_fold(
+        [{"id": i, "content": "x"} for i in range(5)]) == []
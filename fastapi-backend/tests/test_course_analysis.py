@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from services import course_analysis
+
+
+class FakeService:
+    """Course content versions and analyses the test controls"""
+
+    def __init__(self):
+        self.s3_version = "s3-1"
+        self.document_version = "docs-1"
+        self.s3_listings = 0
+        self.analyses = 0
+
+    def get_s3_content_version(self, course_id):
+        self.s3_listings += 1
+        return self.s3_version
+
+    def get_course_context_version(self, course_id, db_session=None):
+        return self.document_version
+
+    async def analyze_course_content(self, course_id, user_id=None, queue_deadline=None):
+        self.analyses += 1
+        return {"success": True, "analysis": f"analysis {self.analyses}",
+                "content_count": 2, "file_types": ["pdf"], "model_used": "strong"}
+
+
+@pytest.fixture
+def service(db, monkeypatch):
+    fake = FakeService()
+    monkeypatch.setattr(course_analysis, "get_gemini_service", lambda: fake)
+    return fake
+
+
+def get(course_id=1, **kwargs):
+    async def run():
+        result = await course_analysis.get_course_analysis(course_id, **kwargs)
+        # Let any background refresh finish before the test looks
+        await asyncio.gather(*course_analysis._refresh_tasks)
+        return result
+    return asyncio.run(run())
+
+
+def test_first_request_analyzes_and_later_ones_read_the_stored_row(service):
+    analysis, cached = get()
+    assert not cached and analysis["analysis"] == "analysis 1"
+
+    listings = service.s3_listings
+    analysis, cached = get()
+    assert cached and analysis["analysis"] == "analysis 1" and not analysis["stale"]
+    # Served from the database alone
+    assert service.s3_listings == listings and service.analyses == 1
+
+
+def test_changed_documents_serve_the_stale_row_and_refresh_it_in_the_background(service):
+    get()
+    service.document_version = "docs-2"
+    service.s3_version = "s3-2"
+
+    analysis, cached = get()
+    assert cached and analysis["stale"] and analysis["analysis"] == "analysis 1"
+
+    analysis, cached = get()
+    assert cached and not analysis["stale"] and analysis["analysis"] == "analysis 2"
+    assert service.analyses == 2
+
+
+def test_document_change_without_new_files_skips_the_model(service):
+    get()
+    service.document_version = "docs-2"
+
+    assert get()[0]["stale"]
+    analysis, _ = get()
+    assert not analysis["stale"] and analysis["analysis"] == "analysis 1"
+    assert service.analyses == 1
+
+
+def test_refresh_recomputes_inline(service):
+    get()
+
+    analysis, cached = get(refresh=True)
+    assert not cached and analysis["analysis"] == "analysis 2"
+
+
+def test_batch_only_analyzes_changed_courses(service):
+    get(1)
+    totals = asyncio.run(course_analysis.run_batch([1, 2], only_changed=True))
+    assert totals == {"analyzed": 1, "unchanged": 1, "failed": 0}
+    assert service.analyses == 2
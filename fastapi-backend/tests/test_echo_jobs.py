@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import EchoJob
+from services import echo_jobs
+
+
+@pytest.fixture
+def events(db):
+    queue = echo_jobs.job_events.subscribe(1)
+    yield queue
+    echo_jobs.job_events.unsubscribe(1, queue)
+
+
+def drain(queue):
+    updates = []
+    while not queue.empty():
+        updates.append(queue.get_nowait())
+    return [(u["status"], u.get("error")) for u in updates]
+
+
+def job(db, job_id):
+    db.expire_all()
+    return db.get(EchoJob, job_id)
+
+
+@echo_jobs.job_handler("test_echo")
+async def echo_handler(user_id, payload):
+    await asyncio.sleep(payload.get("delay", 0))
+    if payload.get("fail"):
+        raise RuntimeError(payload["fail"])
+    return {"echo": payload["message"]}
+
+
+def run(job_id):
+    asyncio.run(echo_jobs.run_job(job_id))
+
+
+def test_job_runs_once_and_reports_its_progress(db, events):
+    job_id = echo_jobs._create(1, "test_echo", {"message": "hi"})
+    run(job_id)
+    # A redelivery of a job already taken is skipped
+    run(job_id)
+
+    stored = job(db, job_id)
+    assert stored.status == echo_jobs.SUCCEEDED and stored.result == {"echo": "hi"}
+    assert drain(events) == [("running", None), ("succeeded", None)]
+
+
+def test_failed_and_timed_out_jobs_store_the_error(db, events, monkeypatch):
+    failing = echo_jobs._create(1, "test_echo", {"message": "hi", "fail": "model down"})
+    run(failing)
+    assert job(db, failing).error == "model down"
+
+    monkeypatch.setattr(echo_jobs, "JOB_TIMEOUT", 0.01)
+    slow = echo_jobs._create(1, "test_echo", {"message": "hi", "delay": 1})
+    run(slow)
+    assert job(db, slow).status == echo_jobs.FAILED
+    assert "did not finish" in job(db, slow).error
+
+
+def test_cancelled_job_is_marked_failed_and_its_user_told(db, events):
+    job_id = echo_jobs._create(1, "test_echo", {"message": "hi", "delay": 5})
+
+    async def cancel_midway():
+        task = asyncio.create_task(echo_jobs.run_job(job_id))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_midway())
+    assert job(db, job_id).status == echo_jobs.FAILED
+    assert drain(events)[-1] == ("failed", "Interrupted before ECHO finished")
+
+
+def test_job_abandoned_by_a_dead_worker_is_taken_over(db, monkeypatch):
+    monkeypatch.setattr(echo_jobs, "JOB_TIMEOUT", 60)
+    job_id = echo_jobs._create(1, "test_echo", {"message": "hi"})
+    assert echo_jobs._start(job_id) is not None
+
+    # Still within the timeout: the first run may be alive
+    assert echo_jobs._start(job_id) is None
+
+    stored = job(db, job_id)
+    stored.started_at = datetime.utcnow() - timedelta(seconds=120)
+    db.commit()
+    run(job_id)
+    assert job(db, job_id).status == echo_jobs.SUCCEEDED
+
+
+def test_chat_job_for_a_deleted_user_fails(db, events):
+    from routers import chatbot  # registers the chat handlers
+
+    job_id = echo_jobs._create(1, "chat", {"message": "What is a heap?"})
+    run(job_id)
+    assert (job(db, job_id).status, job(db, job_id).error) == (
+        echo_jobs.FAILED, "User no longer exists")
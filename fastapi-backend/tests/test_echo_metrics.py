@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+from services.echo_metrics import EchoMetrics, echo_metrics, timed
+
+
+def test_trace_records_stages_and_outcome():
+    metrics = EchoMetrics()
+    with metrics.trace("chat") as trace:
+        with timed("queue_wait"):
+            pass
+        with timed("model_total"):
+            pass
+        trace.outcome = "success"
+
+    snapshot = metrics.snapshot()
+    assert snapshot['echo_call_seconds{kind="chat",outcome="success"}']["count"] == 1
+    assert snapshot['echo_stage_seconds{kind="chat",stage="queue_wait"}']["count"] == 1
+    assert 'echo_calls_total{kind="chat",outcome="success"} 1' in metrics.render_prometheus()
+
+
+def test_failed_trace_is_counted_as_an_error():
+    metrics = EchoMetrics()
+    with pytest.raises(RuntimeError):
+        with metrics.trace("analysis"):
+            raise RuntimeError("model down")
+
+    assert 'echo_calls_total{kind="analysis",outcome="error"} 1' in metrics.render_prometheus()
+
+
+def test_chat_attaches_its_timings(service):
+    result = asyncio.run(service.chat_with_context("What is a heap?"))
+
+    assert result["success"]
+    assert "model_total" in result["timings"]["stages_ms"]
+    assert 'echo_call_seconds{kind="chat",outcome="success"}' in echo_metrics.snapshot()
+
+
+def test_metrics_need_a_valid_token(client):
+    response = client.get("/api/chatbot/metrics",
+                          headers={"Authorization": "Bearer not-a-token"})
+    assert response.status_code == 401
+
+
+def test_metrics_are_refused_to_students(client, make_user):
+    _, headers = make_user("student")
+    response = client.get("/api/chatbot/metrics", headers=headers)
+    assert response.status_code == 403
+
+
+@pytest.mark.parametrize("role,fields", [("admin", {}), ("teacher", {"is_staff": True})])
+def test_admins_and_staff_can_scrape_the_metrics(client, make_user, role, fields):
+    _, headers = make_user(role, role=role, **fields)
+
+    response = client.get("/api/chatbot/metrics", headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE" in response.text
+
+    response = client.get("/api/chatbot/metrics?format=json", headers=headers)
+    assert response.json()["status"] == "success"
@@ -0,0 +1,99 @@
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from models import ChatMessage, ChatSession
+from routers import chatbot
+
+
+@pytest.fixture
+def echo(service, monkeypatch):
+    monkeypatch.setattr(chatbot, "get_gemini_service", lambda: service)
+    return service
+
+
+@pytest.fixture
+def student(db, make_user):
+    user, headers = make_user("student")
+    session = ChatSession(user_id=user.id, session_name="Heaps")
+    db.add(session)
+    db.commit()
+    token = headers["Authorization"].split()[1]
+    return user, session.id, token, headers
+
+
+def receive_until(socket, *types):
+    """Messages up to and including the first of one of `types`"""
+    messages = []
+    while not messages or messages[-1]["type"] not in types:
+        messages.append(socket.receive_json())
+    return messages
+
+
+def test_socket_needs_a_valid_token(client, student):
+    _, session_id, _, _ = student
+    with client.websocket_connect(f"/ws/echo/{session_id}?token=nope") as socket:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            socket.receive_json()
+    assert exc.value.code == 4001
+
+
+def test_socket_for_another_users_session_is_closed(client, student, make_user):
+    _, session_id, _, _ = student
+    _, headers = make_user("other")
+    token = headers["Authorization"].split()[1]
+    with client.websocket_connect(f"/ws/echo/{session_id}?token={token}") as socket:
+        with pytest.raises(WebSocketDisconnect) as exc:
+            socket.receive_json()
+    assert exc.value.code == 4004
+
+
+def test_reply_streams_and_is_saved(client, db, echo, student):
+    _, session_id, token, _ = student
+    with client.websocket_connect(f"/ws/echo/{session_id}?token={token}") as socket:
+        assert socket.receive_json() == {
+            "type": "echo:session", "data": {"session_id": session_id, "course_id": None}}
+
+        socket.send_json({"type": "echo:message",
+                          "data": {"message": "What is a heap?", "request_id": "r1"}})
+        messages = receive_until(socket, "echo:done", "echo:error")
+
+    tokens = [m for m in messages if m["type"] == "echo:token"]
+    done = messages[-1]
+    assert done["type"] == "echo:done" and done["data"]["request_id"] == "r1"
+    assert "".join(t["data"]["text"] for t in tokens) == done["data"]["response"]
+
+    saved = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).all()
+    assert [m.role for m in saved] == ["user", "assistant"]
+    assert saved[1].id == done["data"]["message_id"]
+
+
+def test_one_reply_at_a_time_and_cancel_stops_it(client, db, echo, student):
+    _, session_id, token, _ = student
+    with client.websocket_connect(f"/ws/echo/{session_id}?token={token}") as socket:
+        socket.receive_json()
+        socket.send_json({"type": "echo:message",
+                          "data": {"message": "What is a heap?", "request_id": "r1"}})
+        receive_until(socket, "echo:token")
+
+        socket.send_json({"type": "echo:message",
+                          "data": {"message": "And a trie?", "request_id": "r2"}})
+        busy = receive_until(socket, "echo:error")[-1]
+        assert busy["data"] == {"request_id": "r2",
+                                "message": "Wait for the current reply or cancel it first"}
+
+        socket.send_json({"type": "echo:cancel"})
+        cancelled = receive_until(socket, "echo:cancelled", "echo:done")[-1]
+        assert cancelled["type"] == "echo:cancelled"
+
+    assert db.query(ChatMessage).filter(ChatMessage.session_id == session_id).count() == 0
+
+
+def test_http_chat_goes_through_the_same_turn(client, db, echo, student):
+    _, session_id, _, headers = student
+    response = client.post("/api/chatbot/chat", headers=headers,
+                           json={"message": "What is a heap?", "session_id": session_id})
+
+    assert response.status_code == 200
+    assert response.json()["session_id"] == session_id
+    saved = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).all()
+    assert [m.content for m in saved] == ["What is a heap?", response.json()["response"]]
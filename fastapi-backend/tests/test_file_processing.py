@@ -0,0 +1,68 @@
+import asyncio
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from services import gemini_service
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    notes = tmp_path / "notes.txt"
+    notes.write_text("Binary heaps keep the smallest key at the root.")
+    image = tmp_path / "diagram.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\nnot really an image")
+    return [
+        {"saved_path": str(notes), "original_name": "notes.txt", "content_type": "text/plain"},
+        {"saved_path": str(image), "original_name": "diagram.png", "content_type": "image/png"},
+        {"saved_path": str(tmp_path / "missing.txt"), "original_name": "missing.txt",
+         "content_type": "text/plain"},
+    ]
+
+
+class BrokenPool(Executor):
+    """Executor whose workers have all died"""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_exception(BrokenProcessPool("a worker died"))
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        self.shut_down = True
+
+
+def test_documents_are_extracted_in_worker_processes(service, uploads):
+    service.extract_workers = 1
+    try:
+        loaded = asyncio.run(service._load_uploaded_files(uploads))
+    finally:
+        pool = service._extract_pool
+        service.shutdown_extraction_pool()
+
+    # The missing file is skipped, the others keep their order
+    assert [f["name"] for f in loaded] == ["notes.txt", "diagram.png"]
+    assert "smallest key" in loaded[0]["content"]
+    assert loaded[1]["type"] == "image" and loaded[1]["data"].startswith(b"\x89PNG")
+    assert pool is not None and service._extract_pool is None
+
+
+def test_broken_pool_is_shut_down_and_replaced(service, uploads):
+    broken = BrokenPool()
+    service._extract_pool = broken
+
+    assert asyncio.run(service._load_uploaded_file(uploads[0])) is None
+    assert broken.shut_down and service._extract_pool is None
+
+
+def test_service_shutdown_stops_the_pool(service, monkeypatch):
+    pool = BrokenPool()
+    service._extract_pool = pool
+    monkeypatch.setattr(gemini_service, "_gemini_service", service)
+
+    gemini_service.shutdown_gemini_service()
+    assert pool.shut_down and service._extract_pool is None
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from services.gemini_service import GeminiService
+from services.llm_backends import LLMResponse, LLMUsage
+
+
+class ScriptedBackend:
+    """Backend whose calls wait on the test and fail as scripted"""
+    model_name = "scripted"
+
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def stream(self, contents, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.calls <= self.failures:
+                raise RuntimeError("503 upstream timeout")
+        finally:
+            self.in_flight -= 1
+        yield LLMResponse("answer", LLMUsage(10, 5, 15))
+
+
+@pytest.fixture
+def slots(service, monkeypatch):
+    """Two concurrency slots and no backoff delay to speak of"""
+    monkeypatch.setattr(service, "generation_semaphore", asyncio.Semaphore(2))
+    monkeypatch.setattr(service, "_retry_delay", lambda attempt: 0.05)
+    return service.generation_semaphore
+
+
+def test_in_flight_calls_are_bounded_by_the_semaphore(service, slots):
+    backend = ScriptedBackend(delay=0.02)
+    service.backend = backend
+
+    async def burst():
+        return await asyncio.gather(
+            *(service._generate_with_retries("q") for _ in range(6)))
+
+    responses = asyncio.run(burst())
+    assert [r.text for r in responses] == ["answer"] * 6
+    assert backend.max_in_flight == 2
+
+
+def test_cancelled_call_gives_back_its_slot(service, slots):
+    service.backend = ScriptedBackend(delay=10)
+
+    async def cancel_midway():
+        task = asyncio.create_task(service._generate_with_retries("q"))
+        await asyncio.sleep(0.01)
+        assert slots._value == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return slots._value
+
+    assert asyncio.run(cancel_midway()) == 2
+
+
+def test_backoff_does_not_hold_a_slot(service, slots):
+    backend = ScriptedBackend(failures=1)
+    service.backend = backend
+
+    async def observe_backoff():
+        task = asyncio.create_task(service._generate_with_retries("q"))
+        # The first attempt has failed and the retry is sleeping
+        while backend.calls == 0 or backend.in_flight:
+            await asyncio.sleep(0.005)
+        during_backoff = slots._value
+        response = await task
+        return during_backoff, response
+
+    during_backoff, response = asyncio.run(observe_backoff())
+    assert during_backoff == 2
+    assert response.text == "answer" and backend.calls == 2
+
+
+def test_gives_up_after_the_configured_attempts(service, slots):
+    backend = ScriptedBackend(failures=10)
+    service.backend = backend
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(service._generate_with_retries("q"))
+    assert backend.calls == service.max_retries
+
+
+def test_zero_retries_is_rejected(monkeypatch):
+    monkeypatch.setenv("ECHO_MAX_RETRIES", "0")
+    with pytest.raises(ValueError):
+        GeminiService()
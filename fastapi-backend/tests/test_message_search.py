@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import text
+
+from database import engine
+from models import ChatMessage, ChatSession
+from services import message_search
+
+
+def drop_index():
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS chatbot_messages_fts"))
+
+
+@pytest.fixture
+def sessions(db, make_user):
+    drop_index()
+    user, headers = make_user("student")
+    other, _ = make_user("other")
+    mine = ChatSession(user_id=user.id, session_name="Heaps")
+    theirs = ChatSession(user_id=other.id, session_name="Also heaps")
+    db.add_all([mine, theirs])
+    db.commit()
+    db.add_all([
+        ChatMessage(session_id=mine.id, role="user", content="What is a <b>binary</b> heap?"),
+        ChatMessage(session_id=mine.id, role="assistant", content="A tree with the heap property."),
+        ChatMessage(session_id=theirs.id, role="user", content="Binary heaps again"),
+    ])
+    db.commit()
+    yield headers
+    drop_index()
+
+
+def search(client, headers, q):
+    return client.get("/api/chatbot/search", headers=headers, params={"q": q})
+
+
+def test_messages_written_before_the_index_are_found(client, sessions):
+    assert message_search.ensure_search_index()
+
+    response = search(client, sessions, "binary")
+    assert response.status_code == 200
+    results = response.json()
+    # Only the user's own sessions, with escaped text around the match
+    assert [r["session_name"] for r in results] == ["Heaps"]
+    assert results[0]["snippet"] == "What is a &lt;b&gt;<mark>binary</mark>&lt;/b&gt; heap?"
+
+
+def test_new_messages_are_indexed_and_prefixes_match(client, db, sessions):
+    message_search.ensure_search_index()
+    session = db.query(ChatSession).filter(ChatSession.session_name == "Heaps").one()
+    db.add(ChatMessage(session_id=session.id, role="user", content="Explain priority queues"))
+    db.commit()
+
+    results = search(client, sessions, "priority que").json()
+    assert [r["snippet"] for r in results] == [
+        "Explain <mark>priority</mark> <mark>queues</mark>"]
+
+
+def test_missing_index_answers_503(client, sessions):
+    response = search(client, sessions, "heap")
+    assert response.status_code == 503
+    assert response.json()["detail"] == (
+        "Chat search is not available: the chat search index has not been built")
+
+
+def test_database_without_full_text_search_answers_501(client, sessions, monkeypatch):
+    # A SQLite build without FTS5 fails to create the virtual table
+    monkeypatch.setattr(message_search, "SQLITE_DDL", [
+        statement.replace("USING fts5", "USING missing_fts5")
+        for statement in message_search.SQLITE_DDL])
+    monkeypatch.setattr(message_search, "_unsupported", None)
+    assert not message_search.ensure_search_index()
+
+    response = search(client, sessions, "heap")
+    assert response.status_code == 501
+    assert response.json()["detail"] == (
+        "Chat search is not available: this SQLite build has no FTS5")
@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+from services.llm_backends import StubBackend
+from services.model_router import DEFAULT, FAST, STRONG, ModelRouter
+
+
+def stub(model_name):
+    return StubBackend(latency_ms=0, jitter_ms=0, tokens_per_second=0,
+                       seed=1, model_name=model_name)
+
+
+@pytest.fixture
+def router():
+    return ModelRouter(stub("echo-fast"), stub("echo-strong"), enabled=True,
+                       message_tokens=50, context_tokens=1000,
+                       history_messages=4, attachments=1)
+
+
+def test_small_requests_go_to_the_fast_tier(router):
+    decision = router.route(message_tokens=10, context_tokens=200, history_messages=2)
+    assert (decision.tier, decision.model_name, decision.reasons) == (FAST, "echo-fast", [])
+
+
+def test_any_threshold_sends_a_request_to_the_strong_tier(router):
+    decision = router.route(message_tokens=10, context_tokens=1500, attachments=2)
+    assert decision.tier == STRONG and decision.model_name == "echo-strong"
+    assert decision.reasons == ["context_tokens", "attachments"]
+
+    assert router.describe()["requests"] == {FAST: 0, STRONG: 1, DEFAULT: 0}
+    assert router.describe()["strong_reasons"] == {"context_tokens": 1, "attachments": 1}
+
+
+def test_fixed_tier_skips_classification(router):
+    decision = router.route(message_tokens=500, tier=FAST)
+    assert decision.tier == FAST and decision.reasons == ["fast_task"]
+
+
+def test_disabled_routing_uses_the_default_model():
+    router = ModelRouter(stub("echo-default"), stub("echo-default"))
+    decision = router.route(message_tokens=500, attachments=3)
+    assert (decision.tier, decision.model_name) == (DEFAULT, "echo-default")
+
+
+def test_chats_are_answered_by_the_routed_tier(service, router):
+    service.model_router = router
+
+    short = asyncio.run(service.chat_with_context("What is a heap?"))
+    assert short["success"] and short["model_used"] == "echo-fast"
+    assert short["timings"]["tier"] == FAST
+
+    question = "Compare binary, binomial and Fibonacci heaps in detail. " * 20
+    long = asyncio.run(service.chat_with_context(question))
+    assert long["success"] and long["model_used"] == "echo-strong"
+    assert long["route"]["reasons"] == ["message_tokens"]
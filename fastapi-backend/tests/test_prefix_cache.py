@@ -0,0 +1,113 @@
+import asyncio
+
+from services.llm_backends import StubBackend
+from services.prefix_cache import PrefixCache
+from services.prompt_budget import PromptAssembler, estimate_tokens
+
+
+class CachingBackend(StubBackend):
+    """Stub that supports provider-side prefix caching"""
+    supports_prefix_cache = True
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("latency_ms", 0)
+        super().__init__(**kwargs)
+        self.created = 0
+
+    async def create_prefix(self, system_prompt, context_text, ttl_seconds):
+        self.created += 1
+        return f"cachedContents/{self.created}"
+
+    async def delete_prefix(self, handle):
+        pass
+
+
+SYSTEM_PROMPT = "You are ECHO, a course assistant."
+# About 40000 tokens, above the provider minimum
+LARGE_CONTEXT = "Lecture notes on binary heaps and priority queues. " * 3200
+
+
+def test_large_context_hits_with_default_settings():
+    backend = CachingBackend()
+    cache = PrefixCache(backend)
+
+    async def lookup_twice():
+        first = await cache.get_or_create(1, SYSTEM_PROMPT, LARGE_CONTEXT)
+        second = await cache.get_or_create(1, SYSTEM_PROMPT, LARGE_CONTEXT)
+        return first, second
+
+    first, second = asyncio.run(lookup_twice())
+    assert first is not None and second is first
+    assert backend.created == 1
+    assert cache.stats["hits"] == 1 and cache.stats["skipped"] == 0
+
+
+def test_cached_context_is_not_limited_by_the_prompt_budget():
+    assembler = PromptAssembler()
+    assert estimate_tokens(LARGE_CONTEXT) > assembler.budget
+    history = [{"role": "user", "content": "What is a heap?"},
+               {"role": "assistant", "content": "A tree with the heap property."}]
+
+    conversation, report = assembler.assemble(
+        SYSTEM_PROMPT, LARGE_CONTEXT, history, ["And a min-heap?"], cached_prefix=True)
+
+    assert report.prefix_cached and not report.context_truncated
+    assert report.history_messages_sent == 2
+    assert all(LARGE_CONTEXT not in part for msg in conversation for part in msg["parts"])
+
+
+def test_small_and_oversized_prefixes_are_skipped():
+    backend = CachingBackend()
+    cache = PrefixCache(backend, max_tokens=50000)
+
+    async def lookups():
+        small = await cache.get_or_create(1, SYSTEM_PROMPT, "Short notes.")
+        huge = await cache.get_or_create(1, SYSTEM_PROMPT, LARGE_CONTEXT * 2)
+        return small, huge
+
+    assert asyncio.run(lookups()) == (None, None)
+    assert cache.stats["skipped"] == 2 and backend.created == 0
+
+
+def test_service_caches_a_large_course_context(monkeypatch):
+    from services import llm_backends
+    from services.gemini_service import GeminiService
+
+    monkeypatch.setenv("ECHO_BACKEND", "stub")
+    monkeypatch.setitem(llm_backends.BACKENDS, "stub", CachingBackend)
+    service = GeminiService()
+    monkeypatch.setattr(service, "course_content_enabled", True)
+    monkeypatch.setattr(service, "_course_context",
+                        lambda course_id, course_info=None, db_session=None: (LARGE_CONTEXT, 3))
+
+    async def build_twice():
+        first = await service._build_conversation("What is a heap?", course_id=1)
+        second = await service._build_conversation("And a min-heap?", course_id=1)
+        return first, second
+
+    (_, _, first_report, first_prefix, _), (_, _, second_report, second_prefix, _) = \
+        asyncio.run(build_twice())
+    assert first_prefix is not None and second_prefix is first_prefix
+    assert second_report.prefix_cached and not second_report.context_truncated
+    assert service.prefix_cache.stats["hits"] == 1
+
+
+def test_follow_up_turns_use_the_cached_prefix(monkeypatch):
+    from services import llm_backends
+    from services.gemini_service import GeminiService
+
+    monkeypatch.setitem(llm_backends.BACKENDS, "stub", CachingBackend)
+    service = GeminiService()
+    monkeypatch.setattr(service, "course_content_enabled", True)
+    monkeypatch.setattr(service, "_course_context",
+                        lambda course_id, course_info=None, db_session=None: (LARGE_CONTEXT, 3))
+    history = [{"role": "user", "content": "What is a heap?"},
+               {"role": "assistant", "content": "A tree with the heap property."}]
+
+    conversation, _, report, prefix, _ = asyncio.run(service._build_conversation(
+        "And a min-heap?", course_id=1, conversation_history=history,
+        conversation_summary="We covered binary trees."))
+
+    assert prefix is not None and report.prefix_cached
+    assert report.history_messages_sent == 2 and report.summary_tokens > 0
+    assert conversation[-1]["parts"] == ["And a min-heap?"]
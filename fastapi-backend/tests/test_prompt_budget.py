@@ -0,0 +1,82 @@
+from services.prompt_budget import (CONTEXT_TRUNCATED_MARKER, PromptAssembler,
+                                    estimate_tokens)
+
+# 100 tokens each, leaving 800 of a 1000 token budget to context and history
+SYSTEM_PROMPT = "s" * 400
+QUESTION = "q" * 400
+CONTEXT_LABEL = "Course Context:\n"
+
+
+def history_of(count, tokens_each=10):
+    return [{"role": "user" if i % 2 == 0 else "assistant",
+             "content": f"{i:04d}" + "h" * (tokens_each * 4 - 4)}
+            for i in range(count)]
+
+
+def test_small_context_and_history_are_sent_whole():
+    assembler = PromptAssembler(budget=1000)
+    context = "c" * 400
+    history = history_of(4)
+
+    conversation, report = assembler.assemble(SYSTEM_PROMPT, context, history, [QUESTION])
+
+    assert not report.context_truncated and not report.over_budget
+    assert report.history_messages_sent == 4 and report.history_messages_dropped == 0
+    assert report.context_tokens == estimate_tokens(CONTEXT_LABEL + context)
+    assert [msg["parts"][0] for msg in conversation] == (
+        [SYSTEM_PROMPT, CONTEXT_LABEL + context]
+        + [msg["content"] for msg in history] + [QUESTION])
+    assert [msg["role"] for msg in conversation[2:6]] == ["user", "model", "user", "model"]
+
+
+def test_large_context_and_history_split_the_flexible_budget():
+    assembler = PromptAssembler(budget=1000, context_share=0.6)
+    history = history_of(50)
+
+    conversation, report = assembler.assemble(SYSTEM_PROMPT, "c" * 40000, history, [QUESTION])
+
+    # History gets what the context's 60% share leaves: 320 of 800 tokens
+    assert report.history_tokens == 320
+    assert report.history_messages_sent == 32
+    assert report.history_messages_dropped == 18
+    # The oldest turns are the ones dropped
+    assert conversation[2]["parts"][0] == history[18]["content"]
+    # The context takes the rest and is cut from the end
+    assert report.context_truncated
+    assert conversation[1]["parts"][0].endswith(CONTEXT_TRUNCATED_MARKER)
+    assert report.context_tokens <= 480
+    assert report.total_tokens <= assembler.budget
+
+
+def test_unused_history_budget_flows_back_to_the_context():
+    assembler = PromptAssembler(budget=1000, context_share=0.6)
+
+    _, report = assembler.assemble(SYSTEM_PROMPT, "c" * 40000, history_of(2), [QUESTION])
+
+    assert report.history_tokens == 20
+    assert report.context_tokens == 780
+
+
+def test_summary_is_always_sent_and_shrinks_the_flexible_budget():
+    assembler = PromptAssembler(budget=1000, context_share=0.5)
+    summary = "m" * (400 - len(assembler.summary_label))
+
+    conversation, report = assembler.assemble(
+        SYSTEM_PROMPT, None, history_of(100), [QUESTION], summary=summary)
+
+    assert report.summary_tokens == 100
+    # Without context the history may use all 700 remaining tokens
+    assert report.history_tokens == 700
+    assert report.history_messages_dropped == 30
+    assert conversation[1]["parts"][0] == assembler.summary_label + summary
+
+
+def test_required_parts_over_budget_are_sent_anyway():
+    assembler = PromptAssembler(budget=150)
+
+    conversation, report = assembler.assemble(
+        SYSTEM_PROMPT, "c" * 400, history_of(2), [QUESTION])
+
+    assert report.over_budget and report.context_truncated
+    assert report.history_messages_sent == 0
+    assert [msg["parts"][0] for msg in conversation] == [SYSTEM_PROMPT, QUESTION]
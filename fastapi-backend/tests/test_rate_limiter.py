@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import pytest
+
+from services import rate_limiter
+from services.rate_limiter import BucketSpec, InMemoryBucketStore, TokenBucketRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock the test moves by hand"""
+    now = SimpleNamespace(value=1000.0)
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def test_bucket_starts_full_and_refills_at_its_rate():
+    store = InMemoryBucketStore()
+    bucket = [("global", 2, 0.5)]
+
+    assert store.take(bucket, now=0)[0]
+    assert store.take(bucket, now=0)[0]
+    allowed, retry_after, limiting = store.take(bucket, now=0)
+    assert not allowed and retry_after == 2 and limiting == 0
+
+    # Half a token after one second is not enough
+    assert not store.take(bucket, now=1)[0]
+    assert store.take(bucket, now=2)[0]
+
+
+def test_refill_is_capped_at_capacity():
+    store = InMemoryBucketStore()
+    bucket = [("global", 2, 1)]
+    store.take(bucket, now=0)
+
+    # An hour idle still only holds two tokens
+    assert store.take(bucket, now=3600)[0]
+    assert store.take(bucket, now=3600)[0]
+    assert not store.take(bucket, now=3600)[0]
+
+
+def test_no_bucket_is_charged_when_one_is_empty():
+    store = InMemoryBucketStore()
+    store.take([("user:1", 1, 0.1)], now=0)
+
+    allowed, retry_after, limiting = store.take(
+        [("global", 5, 1), ("user:1", 1, 0.1)], now=0)
+    assert not allowed and limiting == 1 and retry_after == pytest.approx(10)
+    # The global bucket kept all five tokens
+    for _ in range(5):
+        assert store.take([("global", 5, 1)], now=0)[0]
+
+
+def test_limiter_reports_the_refusing_scope(clock):
+    limiter = TokenBucketRateLimiter(
+        global_spec=BucketSpec(10, 10), course_spec=BucketSpec(5, 1),
+        user_spec=BucketSpec(1, 0.25))
+
+    assert limiter.try_acquire(user_id=1, course_id=7).allowed
+    decision = limiter.try_acquire(user_id=1, course_id=7)
+    assert not decision.allowed
+    assert decision.scope == "user" and decision.retry_after == 4
+
+    # Another user in the same course is still let through
+    assert limiter.try_acquire(user_id=2, course_id=7).allowed
+
+    clock.value += 4
+    assert limiter.try_acquire(user_id=1, course_id=7).allowed
+
+
+def test_limiter_falls_back_to_local_buckets_when_the_store_fails(clock):
+    class BrokenStore:
+        def take(self, buckets, now):
+            raise ConnectionError("store down")
+
+    limiter = TokenBucketRateLimiter(global_spec=BucketSpec(1, 0.1), store=BrokenStore())
+    assert limiter.try_acquire().allowed
+    assert limiter.try_acquire().scope == "global"
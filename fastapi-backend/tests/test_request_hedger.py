@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from services.request_hedger import RequestHedger
+
+
+def warmed_up(**kwargs):
+    hedger = RequestHedger(enabled=True, min_samples=2, min_delay=0.01, **kwargs)
+    hedger.observe("echo", 0.01)
+    hedger.observe("echo", 0.01)
+    return hedger
+
+
+class Attempts:
+    """The first attempt hangs, later ones answer at once"""
+
+    def __init__(self):
+        self.started = 0
+        self.cancelled = 0
+
+    async def __call__(self, on_first_output):
+        self.started += 1
+        attempt = self.started
+        try:
+            if attempt == 1:
+                await asyncio.sleep(5)
+            if on_first_output is not None:
+                on_first_output()
+            return f"attempt {attempt}"
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+
+def test_fast_calls_are_not_hedged():
+    hedger = warmed_up(budget=1.0)
+
+    async def quick(on_first_output):
+        on_first_output()
+        return "answer"
+
+    assert asyncio.run(hedger.run("echo", quick)) == "answer"
+    assert hedger.stats["hedged"] == 0 and hedger.stats["calls"] == 1
+
+
+def test_slow_call_is_hedged_and_the_loser_cancelled():
+    hedger = warmed_up(budget=1.0)
+    attempts = Attempts()
+
+    assert asyncio.run(hedger.run("echo", attempts)) == "attempt 2"
+    assert hedger.stats["hedged"] == 1 and hedger.stats["hedge_won"] == 1
+    assert attempts.cancelled == 1
+
+
+def test_hedges_are_limited_by_the_budget():
+    hedger = warmed_up(budget=0.5)
+
+    async def run():
+        # Half a hedge of credit per call: the first slow call may not hedge
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(hedger.run("echo", Attempts()), 0.1)
+        return await hedger.run("echo", Attempts())
+
+    assert asyncio.run(run()) == "attempt 2"
+    assert hedger.stats["skipped_budget"] == 1 and hedger.stats["hedged"] == 1
+
+
+def test_no_hedge_without_capacity():
+    hedger = warmed_up(budget=1.0)
+
+    async def no_capacity():
+        return False
+
+    async def run():
+        return await asyncio.wait_for(
+            hedger.run("echo", Attempts(), may_hedge=no_capacity), 0.1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+    assert hedger.stats["skipped_capacity"] == 1 and hedger.stats["hedged"] == 0
+    # A refused hedge does not spend the credit
+    assert hedger._credit == 1.0
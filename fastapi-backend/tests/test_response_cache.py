@@ -0,0 +1,91 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from services import response_cache
+from services.response_cache import ResponseCache, normalize_question, question_terms
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock the test moves by hand; new entries still take their
+    creation time from the real clock, so it starts from the real reading"""
+    now = SimpleNamespace(value=time.monotonic())
+    monkeypatch.setattr(response_cache, "time",
+                        SimpleNamespace(monotonic=lambda: now.value))
+    return now
+
+
+def test_normalization_ignores_case_punctuation_and_spacing():
+    assert normalize_question("  What's   a HEAP?! ") == "what s a heap"
+
+
+def test_exact_hits_are_keyed_by_course_and_context_version(clock):
+    cache = ResponseCache()
+    cache.put(1, "v1", "What is a heap?", {"response": "a tree"})
+
+    hit = cache.get(1, "v1", "what is a   HEAP")
+    assert hit.tier == "exact" and hit.response == {"response": "a tree"}
+    # Another course, or the same course after its documents changed
+    assert cache.get(2, "v1", "What is a heap?") is None
+    assert cache.get(1, "v2", "What is a heap?") is None
+
+
+def test_near_duplicates_match_only_when_enabled(clock):
+    question = "Can you explain what a binary heap is?"
+    rephrased = "Please explain what the binary heap is"
+
+    cache = ResponseCache()
+    cache.put(1, "v1", question, {"response": "a tree"})
+    assert cache.get(1, "v1", rephrased) is None
+
+    cache = ResponseCache(similarity_enabled=True)
+    cache.put(1, "v1", question, {"response": "a tree"})
+    hit = cache.get(1, "v1", rephrased)
+    assert hit.tier == "similar" and hit.similarity == 1.0
+
+
+def test_question_words_keep_questions_apart(clock):
+    assert question_terms("what is recursion") != question_terms("why is recursion")
+
+    cache = ResponseCache(similarity_enabled=True, similarity_threshold=0.6)
+    cache.put(1, "v1", "What is recursion?", {"response": "a definition"})
+    assert cache.get(1, "v1", "Why is recursion used?") is None
+    assert cache.get(1, "v1", "How is recursion used?") is None
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(ttl_seconds=60)
+    cache.put(1, "v1", "What is a heap?", {"response": "a tree"})
+
+    clock.value += 59
+    assert cache.get(1, "v1", "What is a heap?").age_seconds == pytest.approx(59, abs=1)
+    clock.value += 2
+    assert cache.get(1, "v1", "What is a heap?") is None
+    assert cache.describe()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache(max_entries=2)
+    cache.put(1, "v1", "first", {"response": 1})
+    cache.put(1, "v1", "second", {"response": 2})
+    cache.get(1, "v1", "first")
+    cache.put(1, "v1", "third", {"response": 3})
+
+    assert cache.get(1, "v1", "second") is None
+    assert cache.get(1, "v1", "first") is not None
+    assert cache.stats["evictions"] == 1
+
+
+def test_invalidate_course_drops_every_version(clock):
+    cache = ResponseCache()
+    cache.put(1, "v1", "old", {"response": 1})
+    cache.put(1, "v2", "new", {"response": 2})
+    cache.put(2, "v1", "other", {"response": 3})
+
+    cache.invalidate_course(1)
+
+    assert cache.get(1, "v1", "old") is None
+    assert cache.get(1, "v2", "new") is None
+    assert cache.get(2, "v1", "other") is not None
@@ -0,0 +1,53 @@
+import pytest
+from botocore.exceptions import ClientError
+
+from config import settings
+from routers import courses, documents
+
+
+@pytest.fixture(autouse=True)
+def fresh_clients(monkeypatch):
+    monkeypatch.setattr(documents, "_s3_client", None)
+    monkeypatch.setattr(courses, "_presign_client", None)
+    monkeypatch.setattr(settings, "use_iam_role", False)
+    monkeypatch.setattr(settings, "aws_access_key_id", "")
+    monkeypatch.setattr(settings, "aws_secret_access_key", "")
+
+
+def configure_keys(monkeypatch):
+    monkeypatch.setattr(settings, "aws_access_key_id", "AKIAEXAMPLE")
+    monkeypatch.setattr(settings, "aws_secret_access_key", "secret")
+
+
+def test_missing_client_is_not_cached(monkeypatch):
+    assert documents.get_s3_client() is None
+
+    # Credentials configured later are picked up
+    configure_keys(monkeypatch)
+    client = documents.get_s3_client()
+    assert client is not None
+    assert documents.get_s3_client() is client
+
+
+def test_presign_client_is_created_once(monkeypatch):
+    configure_keys(monkeypatch)
+    client = courses.get_presign_client()
+    assert courses.get_presign_client() is client
+
+    url = courses.generate_presigned_url("echo-bucket", "courses/1/notes.pdf")
+    assert url.startswith("https://echo-bucket.s3.amazonaws.com/courses/1/notes.pdf?")
+
+
+def test_failed_upload_falls_back_to_local_storage(monkeypatch):
+    class FailingClient:
+        def put_object(self, **kwargs):
+            raise ClientError({"Error": {"Code": "AccessDenied", "Message": "denied"}},
+                              "PutObject")
+
+    stored = []
+    monkeypatch.setattr(documents, "_s3_client", FailingClient())
+    monkeypatch.setattr(documents, "upload_to_local_storage",
+                        lambda content, key, content_type: stored.append(key) or "local")
+
+    assert documents.upload_to_s3(b"notes", "courses/1/notes.txt", "text/plain") == "local"
+    assert stored == ["courses/1/notes.txt"]
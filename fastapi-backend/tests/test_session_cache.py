@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from models import ChatMessage, ChatSession
+from routers import chatbot
+from services.session_cache import ChatSessionCache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    fresh = ChatSessionCache()
+    monkeypatch.setattr(chatbot, "session_cache", fresh)
+    return fresh
+
+
+@pytest.fixture
+def session_id(db):
+    session = ChatSession(user_id=1, session_name="Heaps",
+                          updated_at=datetime(2024, 3, 5, 9, 0, 0))
+    db.add(session)
+    db.commit()
+    db.add(ChatMessage(session_id=session.id, role="user", content="What is a heap?"))
+    db.commit()
+    return session.id
+
+
+def history(session):
+    return [m["content"] for m in session.history]
+
+
+def test_repeat_lookups_are_served_from_the_cache(db, cache, session_id):
+    first = chatbot.active_chat_session(db, session_id, user_id=1)
+    second = chatbot.active_chat_session(db, session_id, user_id=1)
+
+    assert second is first
+    assert history(second) == ["What is a heap?"]
+    assert cache.stats == {"hits": 1, "misses": 1, "evictions": 0}
+
+
+def test_write_by_another_worker_reloads_the_session(db, cache, session_id):
+    chatbot.active_chat_session(db, session_id, user_id=1)
+
+    # Another worker answers in this session
+    db.add(ChatMessage(session_id=session_id, role="assistant", content="A tree."))
+    session = db.get(ChatSession, session_id)
+    session.updated_at += timedelta(seconds=5)
+    db.commit()
+
+    reloaded = chatbot.active_chat_session(db, session_id, user_id=1)
+    assert history(reloaded) == ["What is a heap?", "A tree."]
+
+
+def test_write_through_keeps_the_entry_valid(db, cache, session_id):
+    cached = chatbot.active_chat_session(db, session_id, user_id=1)
+
+    # What save_exchange does in this worker
+    updated_at = datetime(2024, 3, 5, 9, 1, 0)
+    message = ChatMessage(session_id=session_id, role="assistant", content="A tree.")
+    db.add(message)
+    db.get(ChatSession, session_id).updated_at = updated_at
+    db.commit()
+    cache.append_messages(session_id, [
+        {"id": message.id, "role": "assistant", "content": "A tree."}], updated_at)
+
+    assert chatbot.active_chat_session(db, session_id, user_id=1) is cached
+    assert history(cached) == ["What is a heap?", "A tree."]
+
+
+def test_deleted_session_is_not_served_from_the_cache(db, cache, session_id):
+    chatbot.active_chat_session(db, session_id, user_id=1)
+
+    db.get(ChatSession, session_id).is_active = False
+    db.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        chatbot.active_chat_session(db, session_id, user_id=1)
+    assert exc.value.status_code == 404
+    assert cache.describe()["sessions"] == 0
+
+
+def test_other_users_never_get_the_cached_session(db, cache, session_id):
+    chatbot.active_chat_session(db, session_id, user_id=1)
+
+    with pytest.raises(HTTPException) as exc:
+        chatbot.active_chat_session(db, session_id, user_id=2)
+    assert exc.value.status_code == 404
@@ -0,0 +1,52 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from routers.chatbot import parse_session_cursor, session_cursor
+
+
+def test_cursor_round_trips_the_last_session_on_the_page():
+    updated_at = datetime(2024, 3, 5, 14, 30, 15, 123456)
+    cursor = session_cursor(SimpleNamespace(updated_at=updated_at, id=42))
+
+    assert cursor == "2024-03-05T14:30:15.123456,42"
+    assert parse_session_cursor(cursor) == (updated_at, 42)
+
+
+def test_cursor_keeps_sessions_updated_in_the_same_second_apart():
+    updated_at = datetime(2024, 3, 5, 14, 30, 15)
+    first = parse_session_cursor(session_cursor(SimpleNamespace(updated_at=updated_at, id=7)))
+    second = parse_session_cursor(session_cursor(SimpleNamespace(updated_at=updated_at, id=8)))
+
+    assert first[0] == second[0] and first[1] != second[1]
+
+
+@pytest.mark.parametrize("cursor", ["", "42", "yesterday,42", "2024-03-05T14:30:15,abc"])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        parse_session_cursor(cursor)
+    assert exc.value.status_code == 400
+
+
+def test_pages_follow_the_cursor_through_ties(client, db, make_user):
+    from models import ChatSession
+
+    user, headers = make_user("student")
+    same_second = datetime(2024, 3, 5, 14, 30, 15)
+    db.add_all([ChatSession(user_id=user.id, session_name=f"Session {i}",
+                            updated_at=same_second) for i in range(5)])
+    db.commit()
+
+    names, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/chatbot/sessions", headers=headers, params=params)
+        assert response.status_code == 200
+        names += [s["session_name"] for s in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+
+    assert names == [f"Session {i}" for i in range(4, -1, -1)]
@@ -0,0 +1,85 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from models import LLMUsageEvent, LLMUsageHourly
+from services.model_router import ModelRouter
+from services.prompt_budget import estimate_tokens
+from services.usage_ledger import UsageQuota, UsageRecord, record_usage, usage_report
+
+
+class Chunk:
+    """A stream chunk as google-generativeai 0.3.2 yields it: text, no usage"""
+
+    def __init__(self, text):
+        self.text = text
+
+
+class UncountedBackend:
+    model_name = "gemini-pinned"
+
+    async def stream(self, contents, **kwargs):
+        yield Chunk("A heap is a tree ")
+        yield Chunk("with the heap property.")
+
+
+def test_events_are_rolled_up_per_hour_user_course_and_model(db):
+    record_usage(UsageRecord("fast", "chat", user_id=1, course_id=7,
+                             prompt_tokens=100, response_tokens=20, latency_ms=300))
+    record_usage(UsageRecord("fast", "chat", user_id=1, course_id=7,
+                             prompt_tokens=50, response_tokens=10, latency_ms=100,
+                             cache_hit=True))
+    record_usage(UsageRecord("strong", "analysis", course_id=7,
+                             prompt_tokens=400, response_tokens=80, success=False))
+
+    assert db.query(LLMUsageEvent).count() == 3
+    assert db.query(LLMUsageHourly).count() == 2
+
+    now = datetime.utcnow()
+    report = usage_report(db, now - timedelta(hours=1), now + timedelta(hours=1), ["model"])
+    assert report == [
+        {"model": "strong", "requests": 1, "cache_hits": 0, "failures": 1,
+         "prompt_tokens": 400, "response_tokens": 80, "total_tokens": 480,
+         "avg_latency_ms": 0.0},
+        {"model": "fast", "requests": 2, "cache_hits": 1, "failures": 0,
+         "prompt_tokens": 150, "response_tokens": 30, "total_tokens": 180,
+         "avg_latency_ms": 200.0},
+    ]
+
+
+def test_quota_states_follow_the_days_usage(db):
+    quota = UsageQuota(user_soft=100, user_hard=200, course_hard=1000)
+    assert quota.check(1, 7).state == "ok"
+
+    record_usage(UsageRecord("fast", "chat", user_id=1, course_id=7, prompt_tokens=120))
+    quota = UsageQuota(user_soft=100, user_hard=200, course_hard=1000)
+    status = quota.check(1, 7)
+    assert (status.state, status.scope, status.used) == ("soft", "user", 120)
+
+    # Usage recorded in this worker counts before the next database read
+    quota.add(UsageRecord("fast", "chat", user_id=1, course_id=7, prompt_tokens=90))
+    status = quota.check(1, 7)
+    assert (status.state, status.used, status.limit) == ("hard", 210, 200)
+    assert quota.check(2, 7).state == "ok"
+
+
+def test_uncounted_responses_are_metered_with_estimates(db, service):
+    service.backend = UncountedBackend()
+    service.model_router = ModelRouter(service.backend, service.backend)
+
+    async def chat():
+        result = await service.chat_with_context("What is a heap?", user_id=1)
+        await asyncio.gather(*service._usage_writes)
+        return result
+
+    result = asyncio.run(chat())
+    assert result["success"]
+
+    rollup = db.query(LLMUsageHourly).one()
+    assert rollup.user_id == 1 and rollup.requests == 1
+    assert rollup.prompt_tokens == result["prompt_tokens"] > 0
+    assert rollup.response_tokens == estimate_tokens(result["response"])
+
+    # And the quota sees them
+    service.usage_quota = UsageQuota(user_hard=rollup.total_tokens)
+    refused = asyncio.run(service.chat_with_context("And a min-heap?", user_id=1))
+    assert not refused["success"] and refused["error"] == "Usage quota exceeded"